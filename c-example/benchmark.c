@@ -0,0 +1,185 @@
+#include "bridgestan.h"
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+// Time the methods of a model when called directly from C, to separate
+// the cost of the model from the overhead of the language interfaces.
+// The model is loaded at runtime as in runtime_loading.c, and the results
+// are printed as JSON.
+
+#ifdef _WIN32
+#include <windows.h>
+#define dlopen(lib, flags) LoadLibraryA(lib)
+#define dlsym(handle, sym) (void*)GetProcAddress(handle, sym)
+
+static double now_ns() {
+  LARGE_INTEGER freq, count;
+  QueryPerformanceFrequency(&freq);
+  QueryPerformanceCounter(&count);
+  return (double)count.QuadPart * 1e9 / (double)freq.QuadPart;
+}
+#else
+#include <dlfcn.h>
+#include <time.h>
+
+static double now_ns() {
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return (double)ts.tv_sec * 1e9 + (double)ts.tv_nsec;
+}
+#endif
+
+#if __STDC_VERSION__ < 202000
+#define typeof __typeof__
+#endif
+
+#define REPEATS 5
+
+// the best time per call, in nanoseconds, of REPEATS runs of `iters` calls
+#define TIME(result, iters, call)                \
+  do {                                           \
+    result = -1;                                 \
+    for (int r_ = 0; r_ < REPEATS; ++r_) {       \
+      double start_ = now_ns();                  \
+      for (long i_ = 0; i_ < (iters); ++i_) {    \
+        call;                                    \
+      }                                          \
+      double t_ = (now_ns() - start_) / (iters); \
+      if (result < 0 || t_ < result)             \
+        result = t_;                             \
+    }                                            \
+  } while (0)
+
+#define LOAD(name)                                        \
+  typeof(&name) name = dlsym(handle, #name);              \
+  if (!name) {                                            \
+    fprintf(stderr, "Error: could not load %s\n", #name); \
+    return 1;                                             \
+  }
+
+int main(int argc, char** argv) {
+  if (argc < 2) {
+    fprintf(stderr, "Usage: %s <library> [data] [iterations]\n", argv[0]);
+    return 1;
+  }
+  char* lib = argv[1];
+  char* data = argc > 2 && strlen(argv[2]) > 0 ? argv[2] : NULL;
+  long iters = argc > 3 ? atol(argv[3]) : 10000;
+  if (iters < 1) {
+    fprintf(stderr, "Error: iterations must be positive\n");
+    return 1;
+  }
+
+  void* handle = dlopen(lib, RTLD_LAZY);
+  if (!handle) {
+    fprintf(stderr, "Error: could not load %s\n", lib);
+    return 1;
+  }
+
+  LOAD(bs_model_construct);
+  LOAD(bs_model_destruct);
+  LOAD(bs_free_error_msg);
+  LOAD(bs_name);
+  LOAD(bs_param_num);
+  LOAD(bs_param_unc_num);
+  LOAD(bs_param_names);
+  LOAD(bs_param_constrain);
+  LOAD(bs_param_unconstrain);
+  LOAD(bs_log_density);
+  LOAD(bs_log_density_gradient);
+  LOAD(bs_log_density_hessian);
+  LOAD(bs_log_density_hessian_vector_product);
+  LOAD(bs_rng_construct);
+  LOAD(bs_rng_destruct);
+
+  char* err = NULL;
+  bs_model* model = bs_model_construct(data, 123, &err);
+  if (!model) {
+    if (err) {
+      fprintf(stderr, "Error: %s\n", err);
+      bs_free_error_msg(err);
+    }
+    return 1;
+  }
+  bs_rng* rng = bs_rng_construct(123, NULL);
+
+  int N = bs_param_unc_num(model);
+  int P = bs_param_num(model, 1, 1);
+  int P0 = bs_param_num(model, 0, 0);
+  double* theta_unc = calloc(N, sizeof(double));
+  double* grad = calloc(N, sizeof(double));
+  double* hvp = calloc(N, sizeof(double));
+  double* v = calloc(N, sizeof(double));
+  double* hessian = calloc((size_t)N * N, sizeof(double));
+  double* theta = calloc(P, sizeof(double));
+  double lp = 0;
+  for (int i = 0; i < N; ++i) {
+    theta_unc[i] = 0.1;
+    v[i] = 1.0;
+  }
+
+  // check every method succeeds once before timing it
+  int rc
+      = bs_log_density_hessian(model, 1, 1, theta_unc, &lp, grad, hessian, &err)
+        || bs_log_density_hessian_vector_product(model, 1, 1, theta_unc, v, &lp,
+                                                 hvp, &err)
+        || bs_param_constrain(model, 1, 1, theta_unc, theta, rng, &err)
+        || bs_param_unconstrain(model, theta, theta_unc, &err);
+  if (rc) {
+    if (err) {
+      fprintf(stderr, "Error: %s\n", err);
+      bs_free_error_msg(err);
+    }
+    return 1;
+  }
+
+  double t_param_num, t_param_unc_num, t_param_names, t_param_constrain,
+      t_param_unconstrain, t_log_density, t_log_density_gradient,
+      t_log_density_hessian, t_log_density_hvp;
+  TIME(t_param_num, iters, bs_param_num(model, 1, 1));
+  TIME(t_param_unc_num, iters, bs_param_unc_num(model));
+  TIME(t_param_names, iters, bs_param_names(model, 1, 1));
+  TIME(t_param_constrain, iters,
+       bs_param_constrain(model, 1, 1, theta_unc, theta, rng, NULL));
+  TIME(t_param_unconstrain, iters,
+       bs_param_unconstrain(model, theta, theta_unc, NULL));
+  TIME(t_log_density, iters, bs_log_density(model, 1, 1, theta_unc, &lp, NULL));
+  TIME(t_log_density_gradient, iters,
+       bs_log_density_gradient(model, 1, 1, theta_unc, &lp, grad, NULL));
+  TIME(
+      t_log_density_hessian, iters,
+      bs_log_density_hessian(model, 1, 1, theta_unc, &lp, grad, hessian, NULL));
+  TIME(t_log_density_hvp, iters,
+       bs_log_density_hessian_vector_product(model, 1, 1, theta_unc, v, &lp,
+                                             hvp, NULL));
+
+  printf("{\n");
+  printf("  \"name\": \"%s\",\n", bs_name(model));
+  printf("  \"param_unc_num\": %d,\n", N);
+  printf("  \"param_num\": %d,\n", P0);
+  printf("  \"iterations\": %ld,\n", iters);
+  printf("  \"ns_per_call\": {\n");
+  printf("    \"param_num\": %.3f,\n", t_param_num);
+  printf("    \"param_unc_num\": %.3f,\n", t_param_unc_num);
+  printf("    \"param_names\": %.3f,\n", t_param_names);
+  printf("    \"param_constrain\": %.3f,\n", t_param_constrain);
+  printf("    \"param_unconstrain\": %.3f,\n", t_param_unconstrain);
+  printf("    \"log_density\": %.3f,\n", t_log_density);
+  printf("    \"log_density_gradient\": %.3f,\n", t_log_density_gradient);
+  printf("    \"log_density_hessian\": %.3f,\n", t_log_density_hessian);
+  printf("    \"log_density_hessian_vector_product\": %.3f\n",
+         t_log_density_hvp);
+  printf("  }\n");
+  printf("}\n");
+
+  free(theta_unc);
+  free(grad);
+  free(hvp);
+  free(v);
+  free(hessian);
+  free(theta);
+  bs_rng_destruct(rng);
+  bs_model_destruct(model);
+  return 0;
+}
@@ -0,0 +1,93 @@
+"""
+Benchmarks of the throughput and latency of log density gradients served
+from an event loop, by AsyncStanModel with its calls coalesced into
+batches and by one run_in_executor call per request, as the number of
+concurrent clients increases.
+
+Build the test models with ``STAN_THREADS=true``, then run from the
+python/ folder::
+
+    pytest benchmarks/bench_async.py --benchmark-json=async.json
+
+Each round serves ``REQUESTS`` requests from the given number of clients,
+each of which makes its requests one after the other. The ``extra_info``
+of each result records the throughput in requests per second and the
+median and 99th percentile latency of a request in microseconds.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from conftest import model_files
+
+import bridgestan as bs
+
+REQUESTS = 2000
+
+
+@pytest.fixture(scope="module", params=["stdnormal", "logistic"])
+def model(request):
+    lib, data = model_files(request.param)
+    model = bs.StanModel(lib, data, warn=False)
+    if "STAN_THREADS=true" not in model.model_info():
+        pytest.skip("the model must be compiled with STAN_THREADS=true")
+    return model
+
+
+async def _serve(call, theta_unc, clients):
+    latencies = []
+
+    async def client(n):
+        for _ in range(n):
+            start = time.perf_counter()
+            await call(theta_unc)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(REQUESTS // clients) for _ in range(clients)))
+    return time.perf_counter() - start, latencies
+
+
+def _serve_coalesced(model, theta_unc, clients):
+    async def run():
+        async with bs.AsyncStanModel(model) as amodel:
+            return await _serve(amodel.alog_density_gradient, theta_unc, clients)
+
+    return asyncio.run(run())
+
+
+def _serve_executor(model, theta_unc, clients):
+    async def run():
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor() as executor:
+
+            def call(theta):
+                return loop.run_in_executor(executor, model.log_density_gradient, theta)
+
+            return await _serve(call, theta_unc, clients)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("clients", [1, 8, 64, 256])
+@pytest.mark.parametrize(
+    "serve", [_serve_coalesced, _serve_executor], ids=["coalesced", "executor"]
+)
+def test_log_density_gradient(benchmark, model, serve, clients):
+    theta_unc = np.full(model.param_unc_num(), 0.1)
+    results = []
+
+    def run():
+        results.append(serve(model, theta_unc, clients))
+
+    benchmark.group = f"{model.name()} clients={clients}"
+    benchmark.pedantic(run, rounds=3, warmup_rounds=1)
+
+    elapsed, latencies = min(results, key=lambda result: result[0])
+    benchmark.extra_info["clients"] = clients
+    benchmark.extra_info["requests_per_second"] = len(latencies) / elapsed
+    benchmark.extra_info["latency_p50_us"] = np.percentile(latencies, 50) * 1e6
+    benchmark.extra_info["latency_p99_us"] = np.percentile(latencies, 99) * 1e6
@@ -0,0 +1,66 @@
+"""
+Benchmarks of model construction with large data in each of the formats
+StanModel accepts.
+
+Build the logistic test model, then run from the python/ folder::
+
+    pytest benchmarks/bench_data.py --benchmark-json=data.json
+
+The number of rows of the design matrix defaults to 100,000 and can be
+set with the ``BRIDGESTAN_BENCHMARK_ROWS`` environment variable.
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+from conftest import model_files
+
+import bridgestan as bs
+
+ROWS = int(os.getenv("BRIDGESTAN_BENCHMARK_ROWS", "100000"))
+COLUMNS = 24
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(1234)
+    return {
+        "N": ROWS,
+        "K": COLUMNS,
+        "x": rng.normal(size=(ROWS, COLUMNS)),
+        "y": rng.integers(0, 2, size=ROWS),
+    }
+
+
+@pytest.fixture(scope="module")
+def data_files(data, tmp_path_factory):
+    folder = tmp_path_factory.mktemp("data")
+    json_file = folder / "logistic.json"
+    json_file.write_text(
+        json.dumps({k: np.asarray(v).tolist() for k, v in data.items()})
+    )
+    return json_file, bs.convert_json_data(json_file)
+
+
+@pytest.mark.parametrize("kind", ["json_file", "json_string", "dict", "binary"])
+def test_construct(benchmark, data, data_files, kind):
+    lib, _ = model_files("logistic")
+    json_file, binary_file = data_files
+    inputs = {
+        "json_file": json_file,
+        "json_string": json_file.read_text(),
+        "dict": data,
+        "binary": binary_file,
+    }
+    benchmark.group = "construct"
+    benchmark.extra_info["rows"] = ROWS
+    benchmark.extra_info["bytes"] = data["x"].nbytes + data["y"].nbytes
+    benchmark.pedantic(
+        bs.StanModel,
+        args=(lib, inputs[kind]),
+        kwargs={"warn": False},
+        rounds=5,
+        warmup_rounds=1,
+    )
@@ -0,0 +1,55 @@
+"""
+Measure the per-call overhead of StanModel.log_density_gradient with and
+without the compiled fast path.
+
+Run from the python/ folder after building the test models::
+
+    python benchmarks/bench_fastcall.py
+"""
+
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+import bridgestan as bs
+
+STAN_FOLDER = Path(__file__).parent.parent.parent / "test_models"
+
+
+def per_call(func, number: int = 200_000) -> float:
+    """Return the best time of a single call in microseconds."""
+    times = timeit.repeat(func, number=number, repeat=5)
+    return min(times) / number * 1e6
+
+
+def main() -> None:
+    lib = STAN_FOLDER / "bernoulli" / "bernoulli_model.so"
+    data = STAN_FOLDER / "bernoulli" / "bernoulli.data.json"
+    model = bs.StanModel(lib, data)
+    if model._fast is None:
+        print("bridgestan._fastcall is not built; only timing ctypes")
+
+    theta = np.array([0.1])
+    out = np.zeros(1)
+
+    fast = model._fast
+    results = {}
+    if fast is not None:
+        results["fast path"] = per_call(lambda: model.log_density_gradient(theta))
+        results["fast path, out="] = per_call(
+            lambda: model.log_density_gradient(theta, out=out)
+        )
+    model._fast = None
+    results["ctypes"] = per_call(lambda: model.log_density_gradient(theta))
+    results["ctypes, out="] = per_call(
+        lambda: model.log_density_gradient(theta, out=out)
+    )
+    model._fast = fast
+
+    for name, us in results.items():
+        print(f"{name:>20}: {us:.3f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmarks of log_density_hessian with the columns of the Hessian computed
+by increasing numbers of threads, for increasing numbers of parameters.
+
+Build the logistic test model with ``STAN_THREADS=true``, then run from
+the python/ folder::
+
+    pytest benchmarks/bench_hessian.py --benchmark-json=hessian.json
+
+The number of rows of the design matrix defaults to 1,000 and can be set
+with the ``BRIDGESTAN_BENCHMARK_ROWS`` environment variable.
+"""
+
+import os
+
+import numpy as np
+import pytest
+from conftest import model_files
+
+import bridgestan as bs
+
+ROWS = int(os.getenv("BRIDGESTAN_BENCHMARK_ROWS", "1000"))
+
+
+@pytest.fixture(scope="module")
+def logistic():
+    lib, _ = model_files("logistic")
+    model = bs.StanModel(lib, {"N": 1, "K": 1, "x": np.zeros((1, 1)), "y": [0]})
+    if "STAN_THREADS=true" not in model.model_info():
+        pytest.skip("the model must be compiled with STAN_THREADS=true")
+    return model
+
+
+@pytest.mark.parametrize("n_threads", [1, 2, 4, 8])
+@pytest.mark.parametrize("columns", [10, 100, 300])
+def test_log_density_hessian(benchmark, logistic, columns, n_threads):
+    rng = np.random.default_rng(1234)
+    model = logistic.with_data(
+        {
+            "N": ROWS,
+            "K": columns,
+            "x": rng.normal(size=(ROWS, columns)),
+            "y": rng.integers(0, 2, size=ROWS),
+        }
+    )
+    theta_unc = rng.normal(scale=0.1, size=model.param_unc_num())
+    out_grad = np.zeros(model.param_unc_num())
+    out_hess = np.zeros((model.param_unc_num(), model.param_unc_num()))
+
+    benchmark.group = f"log_density_hessian D={model.param_unc_num()}"
+    benchmark.extra_info["dims"] = model.param_unc_num()
+    benchmark.extra_info["n_threads"] = n_threads
+    benchmark.pedantic(
+        model.log_density_hessian,
+        args=(theta_unc,),
+        kwargs={"out_grad": out_grad, "out_hess": out_hess, "n_threads": n_threads},
+        rounds=3,
+        warmup_rounds=1,
+    )
@@ -0,0 +1,116 @@
+"""
+Per-call benchmarks of the StanModel methods on the test models.
+
+Build the test models (and, to separate the interface overhead from the
+cost of the model, the C harness with ``make benchmark`` in c-example/),
+then run from the python/ folder::
+
+    pytest benchmarks/bench_stanmodel.py --benchmark-json=benchmark.json
+
+Each result records the model, and when the C harness is available the
+time of the same call made directly from C and the difference between
+the two, in its ``extra_info``.
+"""
+
+import numpy as np
+import pytest
+
+
+def test_name(bench, model):
+    bench("name", model.name)
+
+
+def test_model_info(bench, model):
+    bench("model_info", model.model_info)
+
+
+def test_param_num(bench, model):
+    bench("param_num", model.param_num, include_tp=True, include_gq=True)
+
+
+def test_param_unc_num(bench, model):
+    bench("param_unc_num", model.param_unc_num)
+
+
+def test_param_names(bench, model):
+    bench("param_names", model.param_names, include_tp=True, include_gq=True)
+
+
+def test_param_unc_names(bench, model):
+    bench("param_unc_names", model.param_unc_names)
+
+
+def test_param_constrain(bench, model, theta_unc):
+    rng = model.new_rng(123)
+    out = np.zeros(model.param_num(include_tp=True, include_gq=True))
+    bench(
+        "param_constrain",
+        model.param_constrain,
+        theta_unc,
+        include_tp=True,
+        include_gq=True,
+        out=out,
+        rng=rng,
+    )
+
+
+def test_param_unconstrain(bench, model, theta_unc):
+    theta = model.param_constrain(theta_unc)
+    out = np.zeros(model.param_unc_num())
+    bench("param_unconstrain", model.param_unconstrain, theta, out=out)
+
+
+def test_param_unconstrain_json(bench, model, theta_unc):
+    names = model.param_names()
+    if any("." in name for name in names):
+        pytest.skip("only models with scalar parameters are supported")
+    theta = model.param_constrain(theta_unc)
+    theta_json = {name: value for name, value in zip(names, theta)}
+    bench("param_unconstrain_json", model.param_unconstrain_json, theta_json)
+
+
+def test_log_density(bench, model, theta_unc):
+    bench("log_density", model.log_density, theta_unc)
+
+
+def test_log_density_gradient(bench, model, theta_unc):
+    bench("log_density_gradient", model.log_density_gradient, theta_unc)
+
+
+def test_log_density_gradient_out(bench, model, theta_unc):
+    out = np.zeros(model.param_unc_num())
+    bench("log_density_gradient_out", model.log_density_gradient, theta_unc, out=out)
+
+
+def test_log_density_hessian(bench, model, theta_unc):
+    bench("log_density_hessian", model.log_density_hessian, theta_unc)
+
+
+def test_log_density_hessian_vector_product(bench, model, theta_unc):
+    v = np.ones(model.param_unc_num())
+    bench(
+        "log_density_hessian_vector_product",
+        model.log_density_hessian_vector_product,
+        theta_unc,
+        v,
+    )
+
+
+def test_log_density_hessian_matrix_product(bench, model, theta_unc):
+    V = np.ones((model.param_unc_num(), 10))
+    bench(
+        "log_density_hessian_matrix_product",
+        model.log_density_hessian_matrix_product,
+        theta_unc,
+        V,
+    )
+
+
+def test_log_density_gradient_batch(bench, model, theta_unc):
+    thetas = np.tile(theta_unc, (100, 1))
+    bench("log_density_gradient_batch", model.log_density_gradient_batch, thetas)
+
+
+def test_workspace_log_density_gradient(bench, model, theta_unc):
+    ws = model.workspace()
+    bench("workspace_log_density_gradient", ws.log_density_gradient, theta_unc)
@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import bridgestan as bs
+
+ROOT = Path(__file__).parent.parent.parent
+STAN_FOLDER = ROOT / "test_models"
+HARNESS = Path(
+    os.getenv("BRIDGESTAN_BENCHMARK_HARNESS", ROOT / "c-example" / "benchmark")
+)
+
+MODELS = ["stdnormal", "bernoulli", "regression", "logistic", "multi", "ode_sundials"]
+
+
+def model_files(name):
+    lib = STAN_FOLDER / name / f"{name}_model.so"
+    data = STAN_FOLDER / name / f"{name}.data.json"
+    return lib, data if data.exists() else None
+
+
+@pytest.fixture(scope="session", params=MODELS)
+def model(request):
+    lib, data = model_files(request.param)
+    return bs.StanModel(lib, data, warn=False)
+
+
+@pytest.fixture(scope="session")
+def theta_unc(model):
+    # the same point as c-example/benchmark.c
+    return np.full(model.param_unc_num(), 0.1)
+
+
+@pytest.fixture(scope="session")
+def c_ns_per_call(model):
+    """
+    The time per call of each method from the C harness, or an empty dict
+    if it has not been built with ``make benchmark`` in c-example/.
+    """
+    if not HARNESS.exists():
+        return {}
+    lib, data = model_files(model.name().removesuffix("_model"))
+    proc = subprocess.run(
+        [str(HARNESS), str(lib), str(data or ""), "2000"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(proc.stdout)["ns_per_call"]
+
+
+@pytest.fixture
+def bench(benchmark, model, c_ns_per_call):
+    """
+    Benchmark a function, recording the time of the same method called
+    directly from C and the difference, which is the interface overhead,
+    in the ``extra_info`` of the JSON output.
+    """
+
+    def run(method, func, *args, **kwargs):
+        benchmark.group = method
+        benchmark.extra_info["model"] = model.name()
+        result = benchmark(func, *args, **kwargs)
+        if method in c_ns_per_call and benchmark.stats is not None:
+            c_ns = c_ns_per_call[method]
+            benchmark.extra_info["c_ns_per_call"] = c_ns
+            benchmark.extra_info["overhead_ns_per_call"] = (
+                benchmark.stats.stats.min * 1e9 - c_ns
+            )
+        return result
+
+    return run
@@ -1,5 +1,26 @@
 from .__version import __version__
-from .compile import compile_model, set_bridgestan_path
+from .async_model import AsyncStanModel
+from .compile import (
+    compile_model,
+    compile_model_async,
+    compile_models,
+    set_bridgestan_path,
+)
+from .data import convert_json_data, dump_binary_data
 from .model import StanModel
+from .pool import ModelPool
+from .registry import set_library_budget, unload_idle_libraries
 
-__all__ = ["StanModel", "set_bridgestan_path", "compile_model"]
+__all__ = [
+    "StanModel",
+    "ModelPool",
+    "AsyncStanModel",
+    "set_bridgestan_path",
+    "compile_model",
+    "compile_models",
+    "compile_model_async",
+    "dump_binary_data",
+    "convert_json_data",
+    "set_library_budget",
+    "unload_idle_libraries",
+]
@@ -0,0 +1,262 @@
+/*
+ * Optional fast path for the most frequently called StanModel methods.
+ *
+ * ctypes spends several microseconds per call converting arguments,
+ * running the ``from_param`` shims and allocating ``byref`` objects. This
+ * module instead calls the functions of a model's shared library through
+ * pointers looked up once, reading arguments with the buffer protocol.
+ *
+ * It only handles the common case: one-dimensional, float64, C-contiguous
+ * NumPy arrays of the right size. Anything else, including other objects
+ * supporting the buffer protocol, returns ``NotImplemented``, and StanModel
+ * falls back to ctypes, so both paths accept and reject the same inputs.
+ *
+ * The function pointer types mirror the declarations in src/bridgestan.h.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdbool.h>
+#include <stdint.h>
+#include <string.h>
+
+typedef struct bs_model bs_model;
+
+typedef void (*free_error_msg_t)(char *);
+typedef int (*log_density_t)(const bs_model *, bool, bool, const double *,
+                             double *, char **);
+typedef int (*log_density_gradient_t)(const bs_model *, bool, bool,
+                                      const double *, double *, double *,
+                                      char **);
+
+typedef struct {
+  PyObject_HEAD const bs_model *model;
+  Py_ssize_t dims;
+  PyObject *dims_obj;
+  PyObject *empty;
+  PyObject *ndarray;
+  free_error_msg_t free_error_msg;
+  log_density_t log_density;
+  log_density_gradient_t log_density_gradient;
+} FastModel;
+
+static int get_buffer(FastModel *self, PyObject *obj, Py_buffer *view,
+                      Py_ssize_t len, int writable) {
+  // the ndpointer types of the ctypes path only accept NumPy arrays
+  int is_array = PyObject_IsInstance(obj, self->ndarray);
+  if (is_array <= 0) {
+    PyErr_Clear();
+    return -1;
+  }
+  int flags = PyBUF_C_CONTIGUOUS | PyBUF_FORMAT;
+  if (writable)
+    flags |= PyBUF_WRITABLE;
+  if (PyObject_GetBuffer(obj, view, flags) < 0) {
+    PyErr_Clear();
+    return -1;
+  }
+  if (view->itemsize != sizeof(double) || strcmp(view->format, "d") != 0
+      || view->ndim != 1 || view->shape[0] != len) {
+    PyBuffer_Release(view);
+    return -1;
+  }
+  return 0;
+}
+
+static PyObject *raise_error(FastModel *self, char *err, const char *method) {
+  if (err) {
+    PyErr_SetString(PyExc_RuntimeError, err);
+    self->free_error_msg(err);
+  } else {
+    PyErr_Format(PyExc_RuntimeError, "Unknown error in %s. ", method);
+  }
+  return NULL;
+}
+
+static int get_flags(PyObject *const *args, bool *propto, bool *jacobian) {
+  int p = PyObject_IsTrue(args[0]);
+  int j = p < 0 ? -1 : PyObject_IsTrue(args[1]);
+  if (j < 0)
+    return -1;
+  *propto = p;
+  *jacobian = j;
+  return 0;
+}
+
+/* log_density(theta_unc, propto, jacobian) -> float */
+static PyObject *FastModel_log_density(FastModel *self, PyObject *const *args,
+                                       Py_ssize_t nargs) {
+  if (nargs != 3) {
+    PyErr_SetString(PyExc_TypeError, "log_density takes 3 arguments");
+    return NULL;
+  }
+  bool propto, jacobian;
+  if (get_flags(args + 1, &propto, &jacobian) < 0)
+    return NULL;
+  Py_buffer theta;
+  if (get_buffer(self, args[0], &theta, self->dims, 0) < 0)
+    Py_RETURN_NOTIMPLEMENTED;
+
+  double lp;
+  char *err = NULL;
+  int rc;
+  Py_BEGIN_ALLOW_THREADS;
+  rc = self->log_density(self->model, propto, jacobian, theta.buf, &lp, &err);
+  Py_END_ALLOW_THREADS;
+  PyBuffer_Release(&theta);
+
+  if (rc)
+    return raise_error(self, err, "log_density");
+  return PyFloat_FromDouble(lp);
+}
+
+/* log_density_gradient(theta_unc, propto, jacobian, out) -> (float, out) */
+static PyObject *FastModel_log_density_gradient(FastModel *self,
+                                                PyObject *const *args,
+                                                Py_ssize_t nargs) {
+  if (nargs != 4) {
+    PyErr_SetString(PyExc_TypeError, "log_density_gradient takes 4 arguments");
+    return NULL;
+  }
+  bool propto, jacobian;
+  if (get_flags(args + 1, &propto, &jacobian) < 0)
+    return NULL;
+  Py_buffer theta, grad;
+  if (get_buffer(self, args[0], &theta, self->dims, 0) < 0)
+    Py_RETURN_NOTIMPLEMENTED;
+
+  PyObject *out = args[3];
+  if (out == Py_None) {
+    out = PyObject_Vectorcall(self->empty, &self->dims_obj, 1, NULL);
+    if (out == NULL) {
+      PyBuffer_Release(&theta);
+      return NULL;
+    }
+  } else {
+    Py_INCREF(out);
+  }
+  if (get_buffer(self, out, &grad, self->dims, 1) < 0) {
+    PyBuffer_Release(&theta);
+    Py_DECREF(out);
+    Py_RETURN_NOTIMPLEMENTED;
+  }
+
+  double lp;
+  char *err = NULL;
+  int rc;
+  Py_BEGIN_ALLOW_THREADS;
+  rc = self->log_density_gradient(self->model, propto, jacobian, theta.buf, &lp,
+                                  grad.buf, &err);
+  Py_END_ALLOW_THREADS;
+  PyBuffer_Release(&theta);
+  PyBuffer_Release(&grad);
+
+  if (rc) {
+    Py_DECREF(out);
+    return raise_error(self, err, "log_density_gradient");
+  }
+  PyObject *lp_obj = PyFloat_FromDouble(lp);
+  if (lp_obj == NULL) {
+    Py_DECREF(out);
+    return NULL;
+  }
+  PyObject *result = PyTuple_New(2);
+  if (result == NULL) {
+    Py_DECREF(lp_obj);
+    Py_DECREF(out);
+    return NULL;
+  }
+  PyTuple_SET_ITEM(result, 0, lp_obj);
+  PyTuple_SET_ITEM(result, 1, out);
+  return result;
+}
+
+static int FastModel_init(FastModel *self, PyObject *args, PyObject *kwds) {
+  PyObject *model, *free_error_msg, *log_density, *log_density_gradient;
+  PyObject *empty, *ndarray;
+  Py_ssize_t dims;
+  static char *kwlist[] = {"model",
+                           "dims",
+                           "free_error_msg",
+                           "log_density",
+                           "log_density_gradient",
+                           "empty",
+                           "ndarray",
+                           NULL};
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "OnOOOOO", kwlist, &model, &dims,
+                                   &free_error_msg, &log_density,
+                                   &log_density_gradient, &empty, &ndarray))
+    return -1;
+
+  self->model = PyLong_AsVoidPtr(model);
+  self->free_error_msg = (free_error_msg_t)PyLong_AsVoidPtr(free_error_msg);
+  self->log_density = (log_density_t)PyLong_AsVoidPtr(log_density);
+  self->log_density_gradient
+      = (log_density_gradient_t)PyLong_AsVoidPtr(log_density_gradient);
+  if (PyErr_Occurred())
+    return -1;
+  if (self->model == NULL || self->free_error_msg == NULL
+      || self->log_density == NULL || self->log_density_gradient == NULL) {
+    PyErr_SetString(PyExc_ValueError, "null pointer");
+    return -1;
+  }
+
+  self->dims = dims;
+  Py_XSETREF(self->dims_obj, PyLong_FromSsize_t(dims));
+  if (self->dims_obj == NULL)
+    return -1;
+  Py_INCREF(empty);
+  Py_XSETREF(self->empty, empty);
+  Py_INCREF(ndarray);
+  Py_XSETREF(self->ndarray, ndarray);
+  return 0;
+}
+
+static void FastModel_dealloc(FastModel *self) {
+  Py_XDECREF(self->dims_obj);
+  Py_XDECREF(self->empty);
+  Py_XDECREF(self->ndarray);
+  Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyMethodDef FastModel_methods[] = {
+    {"log_density", (PyCFunction)(void (*)(void))FastModel_log_density,
+     METH_FASTCALL, "log_density(theta_unc, propto, jacobian)"},
+    {"log_density_gradient",
+     (PyCFunction)(void (*)(void))FastModel_log_density_gradient, METH_FASTCALL,
+     "log_density_gradient(theta_unc, propto, jacobian, out)"},
+    {NULL, NULL, 0, NULL},
+};
+
+static PyTypeObject FastModelType = {
+    PyVarObject_HEAD_INIT(NULL, 0).tp_name = "bridgestan._fastcall.FastModel",
+    .tp_doc = "Direct calls into the functions of a model's shared library.",
+    .tp_basicsize = sizeof(FastModel),
+    .tp_itemsize = 0,
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = PyType_GenericNew,
+    .tp_init = (initproc)FastModel_init,
+    .tp_dealloc = (destructor)FastModel_dealloc,
+    .tp_methods = FastModel_methods,
+};
+
+static struct PyModuleDef fastcall_module = {
+    PyModuleDef_HEAD_INIT,
+    .m_name = "_fastcall",
+    .m_doc = "Optional compiled fast path for bridgestan.StanModel.",
+    .m_size = -1,
+};
+
+PyMODINIT_FUNC PyInit__fastcall(void) {
+  if (PyType_Ready(&FastModelType) < 0)
+    return NULL;
+  PyObject *m = PyModule_Create(&fastcall_module);
+  if (m == NULL)
+    return NULL;
+  Py_INCREF(&FastModelType);
+  if (PyModule_AddObject(m, "FastModel", (PyObject *)&FastModelType) < 0) {
+    Py_DECREF(&FastModelType);
+    Py_DECREF(m);
+    return NULL;
+  }
+  return m;
+}
@@ -0,0 +1,375 @@
+"""
+An :mod:`asyncio` interface to a model, for evaluating it from an event
+loop, such as a web service, without blocking the loop.
+
+Calls run on a bounded pool of threads. Concurrent calls of the same
+method with the same options are coalesced into one call of the batched
+method of the model, so many small requests cross into the library once.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from .model import FloatArray, StanModel, StanRNG, _batch_warnings
+
+DEFAULT_MAX_BATCH_SIZE = 256
+
+_Key = Tuple[Any, ...]
+# the result of each row of a batch and its status code
+_Rows = List[Tuple[Any, int]]
+
+
+def _quiet_batches() -> None:
+    # a failed row is evaluated again on its own to raise its error, so
+    # the warning of the batch would only repeat it
+    _batch_warnings.quiet = True
+
+
+class _Pending:
+    """The calls waiting to be evaluated together as one batch."""
+
+    __slots__ = ("rows", "futures", "handle", "ready")
+
+    def __init__(self, handle: asyncio.Handle) -> None:
+        self.rows: List[npt.NDArray[np.float64]] = []
+        self.futures: List["asyncio.Future[Tuple[Any, int]]"] = []
+        # the callback which marks the batch ready once its window is over
+        self.handle = handle
+        self.ready = False
+
+
+class AsyncStanModel:
+    """
+    A wrapper of a :class:`StanModel` whose methods are coroutines, for use
+    from an :mod:`asyncio` event loop.
+
+    The calls are evaluated on a pool of at most ``max_workers`` threads,
+    which is one thread if the model was not compiled with
+    ``STAN_THREADS=True``, because such models cannot be called from more
+    than one thread at once.
+
+    The calls of :meth:`alog_density_gradient`, :meth:`aparam_constrain`
+    and :meth:`aparam_unconstrain` are coalesced: every call of the same
+    method with the same options which is waiting for a thread is
+    evaluated with the others by one call of the batched method of the
+    model, such as :meth:`StanModel.log_density_gradient_batch`. Each call
+    still gets its own result, or raises its own error.
+
+    A call waits for the calls made before the event loop next runs its
+    callbacks, such as those started together by :func:`asyncio.gather`,
+    and then for ``window`` seconds, if it is positive. The batch is then
+    evaluated as soon as a thread is free, and calls keep joining it until
+    then, so batches grow with the load without delaying calls when there
+    is a free thread. A batch is evaluated at once when it has
+    ``max_batch_size`` calls.
+
+    An instance must only be used from one event loop. Use it as an
+    asynchronous context manager, or call :meth:`aclose`, to shut down its
+    threads::
+
+        async with bs.AsyncStanModel(model) as amodel:
+            lp, grad = await amodel.alog_density_gradient(theta_unc)
+
+    :param model: The model to evaluate.
+    :param max_workers: The maximum number of threads, which defaults to
+        the number of CPUs.
+    :param window: How long the first call of a batch waits for others,
+        in seconds, before the batch is evaluated. Note that the event loop
+        may only wake up about once a millisecond for a positive window.
+    :param max_batch_size: The maximum number of calls in one batch.
+    :param n_threads: The number of threads each batch is evaluated with
+        inside the library, as for :meth:`StanModel.log_density_gradient_batch`.
+    :raises ValueError: If ``max_workers``, ``max_batch_size`` or
+        ``window`` are out of range.
+    """
+
+    def __init__(
+        self,
+        model: StanModel,
+        *,
+        max_workers: Optional[int] = None,
+        window: float = 0.0,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        n_threads: int = 1,
+    ) -> None:
+        if max_workers is not None and max_workers < 1:
+            raise ValueError("Error: max_workers must be at least 1")
+        if max_batch_size < 1:
+            raise ValueError("Error: max_batch_size must be at least 1")
+        if window < 0:
+            raise ValueError("Error: window must not be negative")
+        if "STAN_THREADS=true" not in model.model_info():
+            max_workers = 1
+        #: The wrapped model.
+        self.model = model
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.n_threads = n_threads
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(
+            self._max_workers,
+            thread_name_prefix=f"bridgestan-{model.name()}",
+            initializer=_quiet_batches,
+        )
+        # the batches being collected, in the order they were started
+        self._pending: Dict[_Key, _Pending] = {}
+        self._in_flight = 0
+        self._closed = False
+
+    async def __aenter__(self) -> "AsyncStanModel":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """
+        Evaluate the calls which are waiting to join a batch, wait for every
+        call to finish, and shut down the threads. Calls made afterwards
+        raise :class:`RuntimeError`.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for key in list(self._pending):
+            self._flush(key)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+
+    async def _run(self, method: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Call ``method`` on the pool of threads."""
+        if self._closed:
+            raise RuntimeError("Error: AsyncStanModel is closed")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(method, *args, **kwargs)
+        )
+
+    async def _submit(self, key: _Key, row: npt.NDArray[np.float64]) -> Tuple[Any, int]:
+        """
+        Add ``row`` to the batch of calls for ``key``, and return its
+        result and status code once the batch has been evaluated.
+        """
+        if self._closed:
+            raise RuntimeError("Error: AsyncStanModel is closed")
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[Tuple[Any, int]]" = loop.create_future()
+        pending = self._pending.get(key)
+        if pending is None:
+            if self.window > 0:
+                handle: asyncio.Handle = loop.call_later(self.window, self._ready, key)
+            else:
+                handle = loop.call_soon(self._ready, key)
+            pending = self._pending[key] = _Pending(handle)
+        pending.rows.append(row)
+        pending.futures.append(future)
+        if len(pending.rows) >= self.max_batch_size:
+            self._flush(key)
+        return await future
+
+    def _ready(self, key: _Key) -> None:
+        """Evaluate the batch for ``key`` now, or once a thread is free."""
+        pending = self._pending.get(key)
+        if pending is None:
+            return
+        pending.ready = True
+        if self._in_flight < self._max_workers:
+            self._flush(key)
+
+    def _flush(self, key: _Key) -> None:
+        """Start evaluating the batch of calls for ``key``."""
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        pending.handle.cancel()
+        self._in_flight += 1
+        loop = asyncio.get_running_loop()
+        batch = loop.run_in_executor(
+            self._executor, self._evaluate, key, np.stack(pending.rows)
+        )
+        batch.add_done_callback(functools.partial(self._done, pending.futures))
+
+    def _done(
+        self,
+        futures: List["asyncio.Future[Tuple[Any, int]]"],
+        batch: "asyncio.Future[_Rows]",
+    ) -> None:
+        """Resolve the calls of a batch, and start the oldest ready batch."""
+        self._in_flight -= 1
+        _resolve(futures, batch)
+        for key, pending in self._pending.items():
+            if pending.ready:
+                self._flush(key)
+                break
+
+    def _evaluate(self, key: _Key, rows: npt.NDArray[np.float64]) -> _Rows:
+        """Evaluate a batch on a worker thread."""
+        method, *options = key
+        if method == "log_density_gradient":
+            propto, jacobian = options
+            lp, grad, status = self.model.log_density_gradient_batch(
+                rows, propto=propto, jacobian=jacobian, n_threads=self.n_threads
+            )
+            return [((lp[i], grad[i]), status[i]) for i in range(len(rows))]
+        if method == "param_constrain":
+            (include_tp,) = options
+            out, status = self.model.param_constrain_batch(
+                rows, include_tp=include_tp, n_threads=self.n_threads
+            )
+        else:
+            out, status = self.model.param_unconstrain_batch(
+                rows, n_threads=self.n_threads
+            )
+        return [(out[i], status[i]) for i in range(len(rows))]
+
+    def _row(self, x: FloatArray, dims: int, name: str) -> npt.NDArray[np.float64]:
+        x = np.ascontiguousarray(x, dtype=np.float64)
+        if x.shape != (dims,):
+            raise ValueError(f"Error: {name} must have shape ({dims}, ), got {x.shape}")
+        return x
+
+    async def alog_density(
+        self, theta_unc: FloatArray, *, propto: bool = True, jacobian: bool = True
+    ) -> float:
+        """
+        Return the log density, as :meth:`StanModel.log_density`, evaluated
+        on the pool of threads.
+        """
+        return await self._run(
+            self.model.log_density, theta_unc, propto=propto, jacobian=jacobian
+        )
+
+    async def alog_density_gradient(
+        self, theta_unc: FloatArray, *, propto: bool = True, jacobian: bool = True
+    ) -> Tuple[float, FloatArray]:
+        """
+        Return the log density and its gradient, as
+        :meth:`StanModel.log_density_gradient`, coalesced with concurrent
+        calls with the same ``propto`` and ``jacobian``.
+
+        :raises ValueError: If ``theta_unc`` is not of shape ``(D, )``.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        theta_unc = self._row(theta_unc, self.model.param_unc_num(), "theta_unc")
+        key = ("log_density_gradient", bool(propto), bool(jacobian))
+        result, status = await self._submit(key, theta_unc)
+        if status:
+            # evaluate the row alone to raise its error message
+            return await self._run(
+                self.model.log_density_gradient,
+                theta_unc,
+                propto=propto,
+                jacobian=jacobian,
+            )
+        return result
+
+    async def alog_density_hessian(
+        self, theta_unc: FloatArray, *, propto: bool = True, jacobian: bool = True
+    ) -> Tuple[float, FloatArray, FloatArray]:
+        """
+        Return the log density, its gradient and its Hessian, as
+        :meth:`StanModel.log_density_hessian`, evaluated on the pool of
+        threads.
+        """
+        return await self._run(
+            self.model.log_density_hessian,
+            theta_unc,
+            propto=propto,
+            jacobian=jacobian,
+        )
+
+    async def alog_density_hessian_vector_product(
+        self,
+        theta_unc: FloatArray,
+        v: FloatArray,
+        *,
+        propto: bool = True,
+        jacobian: bool = True,
+    ) -> Tuple[float, FloatArray]:
+        """
+        Return the log density and the product of its Hessian with ``v``,
+        as :meth:`StanModel.log_density_hessian_vector_product`, evaluated on
+        the pool of threads.
+        """
+        return await self._run(
+            self.model.log_density_hessian_vector_product,
+            theta_unc,
+            v,
+            propto=propto,
+            jacobian=jacobian,
+        )
+
+    async def aparam_constrain(
+        self,
+        theta_unc: FloatArray,
+        *,
+        include_tp: bool = False,
+        include_gq: bool = False,
+        rng: Optional[StanRNG] = None,
+    ) -> FloatArray:
+        """
+        Return the constrained parameters, as
+        :meth:`StanModel.param_constrain`. Calls without generated
+        quantities are coalesced with concurrent calls with the same
+        ``include_tp``; calls with generated quantities, which draw from
+        ``rng``, are evaluated on their own.
+
+        :raises ValueError: If ``theta_unc`` is not of shape ``(D, )``, or
+            if ``rng`` is ``None`` and ``include_gq`` is ``True``.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        if include_gq:
+            return await self._run(
+                self.model.param_constrain,
+                theta_unc,
+                include_tp=include_tp,
+                include_gq=include_gq,
+                rng=rng,
+            )
+        theta_unc = self._row(theta_unc, self.model.param_unc_num(), "theta_unc")
+        result, status = await self._submit(
+            ("param_constrain", bool(include_tp)), theta_unc
+        )
+        if status:
+            return await self._run(
+                self.model.param_constrain, theta_unc, include_tp=include_tp
+            )
+        return result
+
+    async def aparam_unconstrain(self, theta: FloatArray) -> FloatArray:
+        """
+        Return the unconstrained parameters, as
+        :meth:`StanModel.param_unconstrain`, coalesced with concurrent calls.
+
+        :raises ValueError: If ``theta`` is not of shape ``(P, )``.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        theta = self._row(theta, self.model.param_num(), "theta")
+        result, status = await self._submit(("param_unconstrain",), theta)
+        if status:
+            return await self._run(self.model.param_unconstrain, theta)
+        return result
+
+
+def _resolve(
+    futures: List["asyncio.Future[Tuple[Any, int]]"], batch: "asyncio.Future[_Rows]"
+) -> None:
+    """Set the result of each call of a batch which has been evaluated."""
+    if batch.cancelled():
+        for future in futures:
+            future.cancel()
+        return
+    error = batch.exception()
+    for i, future in enumerate(futures):
+        if future.done():  # cancelled by the caller
+            continue
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(batch.result()[i])
@@ -0,0 +1,293 @@
+"""
+A content-addressed cache of compiled models.
+
+Each entry is a directory named after a hash of everything which can
+change the compiled library: the Stan source and the files it
+``#include``\\ s, the ``stanc`` and ``make`` arguments, the C++ compiler,
+and the BridgeStan version and sources. A cache hit therefore never
+needs to invoke ``make``.
+
+Entries are built in a temporary directory and renamed into place, so a
+complete entry is never observed half-written. Building is serialized
+per entry with a file lock, and eviction of the least recently used
+entries happens under a lock on the whole cache.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Set, Union
+
+from .__version import __version__
+
+CACHE_DIR_ENV = "BRIDGESTAN_CACHE_DIR"
+CACHE_SIZE_ENV = "BRIDGESTAN_CACHE_SIZE"
+DEFAULT_CACHE_SIZE = 2 * 1024**3
+
+_INCLUDE = re.compile(r"^\s*#include\s*[<\"]?([^>\"\s]+)[>\"]?", re.MULTILINE)
+_CXX = re.compile(r"^\s*CXX\s*[:?]?=\s*(.+?)\s*$", re.MULTILINE)
+
+if platform.system() == "Windows":
+    import msvcrt
+
+    def _lock(fd: int, blocking: bool) -> None:
+        mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+        while True:
+            try:
+                msvcrt.locking(fd, mode, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after 10 seconds
+                if not blocking:
+                    raise
+
+    def _unlock(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock(fd: int, blocking: bool) -> None:
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextmanager
+def file_lock(path: Path, blocking: bool = True) -> Iterator[bool]:
+    """
+    Hold an exclusive lock on ``path`` for the duration of the context.
+
+    :param path: The lock file, which is created if it does not exist.
+    :param blocking: If ``False``, do not wait for the lock if another
+        process holds it.
+    :return: A context manager yielding whether the lock was acquired.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        try:
+            _lock(fd, blocking)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+def get_cache_dir(cache_dir: Union[str, os.PathLike, None] = None) -> Optional[Path]:
+    """
+    Return the cache directory to use, or ``None`` if caching is disabled.
+
+    :param cache_dir: An explicit cache directory. If ``None``, the value of
+        the ``BRIDGESTAN_CACHE_DIR`` environment variable is used, if set.
+    """
+    if cache_dir is None:
+        cache_dir = os.getenv(CACHE_DIR_ENV, "")
+        if cache_dir == "":
+            return None
+    return Path(cache_dir).expanduser().resolve()
+
+
+def get_cache_size() -> int:
+    """
+    Return the maximum total size of the cache in bytes, which is read from
+    the ``BRIDGESTAN_CACHE_SIZE`` environment variable if set.
+    """
+    size = os.getenv(CACHE_SIZE_ENV, "")
+    return int(size) if size else DEFAULT_CACHE_SIZE
+
+
+def _include_dirs(model_dir: Path, bs_path: Path, stanc_args: List[str]) -> List[Path]:
+    dirs = [model_dir, bs_path]
+    for arg in stanc_args:
+        if arg.startswith("--include-paths="):
+            dirs += [bs_path / p for p in arg.split("=", 1)[1].split(",") if p]
+    return dirs
+
+
+def merge_include_paths(stanc_args: List[str], paths: List[str]) -> List[str]:
+    """
+    Return ``stanc_args`` with one ``--include-paths`` argument, which
+    lists ``paths`` followed by the paths of any ``--include-paths``
+    arguments already in ``stanc_args``.
+    """
+    merged = list(paths)
+    rest = []
+    for arg in stanc_args:
+        if arg.startswith("--include-paths="):
+            merged += [p for p in arg.split("=", 1)[1].split(",") if p]
+        else:
+            rest.append(arg)
+    return [f"--include-paths={','.join(merged)}"] + rest
+
+
+def _hash_stan_file(
+    h: "hashlib._Hash", stan_file: Path, include_dirs: List[Path], seen: Set[Path]
+) -> None:
+    if stan_file in seen:
+        return
+    seen.add(stan_file)
+    source = stan_file.read_bytes()
+    h.update(source)
+    for name in _INCLUDE.findall(source.decode("utf-8", errors="replace")):
+        h.update(b"\0include\0" + name.encode())
+        for folder in include_dirs:
+            candidate = (folder / name).resolve()
+            if candidate.is_file():
+                _hash_stan_file(h, candidate, include_dirs, seen)
+                break
+
+
+def _compiler(bs_path: Path, make_args: List[str]) -> str:
+    for arg in reversed(make_args):
+        if arg.startswith("CXX="):
+            return arg.split("=", 1)[1]
+    local = bs_path / "make" / "local"
+    if local.is_file():
+        found = _CXX.findall(local.read_text(errors="replace"))
+        if found:
+            return found[-1]
+    return os.getenv("CXX", "clang++" if platform.system() == "Darwin" else "g++")
+
+
+@lru_cache(maxsize=None)
+def _compiler_version(cxx: str) -> str:
+    try:
+        proc = subprocess.run(
+            cxx.split() + ["--version"], capture_output=True, text=True, check=False
+        )
+        return proc.stdout
+    except OSError:
+        return ""
+
+
+def cache_key(
+    stan_file: Path,
+    bs_path: Union[str, os.PathLike],
+    stanc_args: List[str],
+    make_args: List[str],
+) -> str:
+    """
+    Return the key of the cache entry for a model.
+
+    :param stan_file: The resolved path to the Stan model file.
+    :param bs_path: The path to BridgeStan.
+    :param stanc_args: The arguments passed to stanc3.
+    :param make_args: The arguments passed to Make.
+    :return: A hexadecimal digest identifying the compiled library.
+    """
+    bs_path = Path(bs_path).resolve()
+    h = hashlib.sha256()
+    _hash_stan_file(
+        h, stan_file, _include_dirs(stan_file.parent, bs_path, stanc_args), set()
+    )
+    cxx = _compiler(bs_path, make_args)
+    h.update(
+        json.dumps(
+            [stanc_args, make_args, cxx, _compiler_version(cxx), __version__]
+        ).encode()
+    )
+    # the sources and user configuration of a development checkout can
+    # change without a change of version
+    for dep in sorted((bs_path / "src").glob("*.[ch]*")) + [bs_path / "make" / "local"]:
+        if dep.is_file():
+            h.update(dep.name.encode() + b"\0" + dep.read_bytes())
+    return h.hexdigest()[:32]
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def evict(cache_dir: Path, max_size: int, keep: Optional[Path] = None) -> None:
+    """
+    Delete the least recently used entries of the cache until its total
+    size is at most ``max_size`` bytes. Entries which are being built, and
+    ``keep``, are never deleted.
+
+    Entries whose library is loaded by a process can be deleted. On POSIX
+    systems the loaded library stays mapped until it is unloaded. On
+    Windows, a loaded library cannot be deleted, so it is left in place.
+    """
+    with file_lock(cache_dir / ".lock"):
+        entries = []
+        for entry in cache_dir.iterdir():
+            if entry.is_dir() and not entry.name.startswith("."):
+                entries.append((entry.stat().st_mtime, _dir_size(entry), entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= max_size:
+                break
+            if keep is not None and entry == keep:
+                continue
+            with file_lock(cache_dir / f".{entry.name}.lock", blocking=False) as ok:
+                if ok:
+                    shutil.rmtree(entry, ignore_errors=True)
+                    total -= size
+
+
+def cached_compile(
+    cache_dir: Path,
+    stan_file: Path,
+    bs_path: Union[str, os.PathLike],
+    stanc_args: List[str],
+    make_args: List[str],
+    build: Callable[[Path, List[str]], None],
+) -> Path:
+    """
+    Return the path of the cached library for a model, building it first
+    if it is not yet in the cache.
+
+    :param cache_dir: The root of the cache.
+    :param stan_file: The resolved path to the Stan model file.
+    :param bs_path: The path to BridgeStan.
+    :param stanc_args: The arguments passed to stanc3.
+    :param make_args: The arguments passed to Make.
+    :param build: A function called with the library to build and the
+        ``stanc`` arguments to build it with, which raises on failure.
+    :return: The path to the compiled library.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    key = cache_key(stan_file, bs_path, stanc_args, make_args)
+    entry = cache_dir / key
+    lib_name = f"{stan_file.stem}_model.so"
+    lib = entry / lib_name
+
+    with file_lock(cache_dir / f".{key}.lock"):
+        if lib.is_file():
+            os.utime(entry)
+            return lib
+
+        staging = cache_dir / f".{key}.{os.getpid()}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+        try:
+            shutil.copyfile(stan_file, staging / stan_file.name)
+            # includes are resolved relative to the original model
+            args = merge_include_paths(stanc_args, [".", str(stan_file.parent)])
+            build(staging / lib_name, args)
+            for f in staging.iterdir():
+                if f.name != lib_name:
+                    f.unlink()
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(staging, entry)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        os.utime(entry, (time.time(), time.time()))
+
+    evict(cache_dir, get_cache_size(), keep=entry)
+    return lib
@@ -1,11 +1,16 @@
+import hashlib
 import os
 import platform
 import subprocess
+import tempfile
+import threading
 import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Union
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
 
 from .__version import __version__
+from .cache import cached_compile, file_lock, get_cache_dir
 from .download import CURRENT_BRIDGESTAN, HOME_BRIDGESTAN, get_bridgestan_src
 from .util import validate_readable
 
@@ -31,6 +36,8 @@ WINDOWS_PATH_SET = False
 
 MAKE = os.getenv("MAKE", "make")
 
+ProgressCallback = Callable[[Path, str], None]
+
 
 def set_bridgestan_path(path: Union[str, os.PathLike]) -> None:
     """
@@ -96,6 +103,8 @@ def compile_model(
     *,
     stanc_args: List[str] = [],
     make_args: List[str] = [],
+    cache_dir: Optional[Union[str, os.PathLike]] = None,
+    progress: Optional[ProgressCallback] = None,
 ) -> Path:
     """
     Run BridgeStan's Makefile on a ``.stan`` file, creating the ``.so``
@@ -104,6 +113,19 @@ def compile_model(
     This function checks that the path to BridgeStan is valid and will
     error if not. This can be set with :func:`set_bridgestan_path`.
 
+    If a cache directory is given, either with ``cache_dir`` or the
+    ``BRIDGESTAN_CACHE_DIR`` environment variable, the ``.so`` is built in
+    and returned from that directory instead of being placed next to the
+    ``.stan`` file. Entries are keyed on the Stan source (including any
+    ``#include``\\ d files), ``stanc_args``, ``make_args``, the C++ compiler,
+    and the BridgeStan version, so a cache hit returns without running
+    Make. The least recently used entries are removed once the cache
+    exceeds ``BRIDGESTAN_CACHE_SIZE`` bytes (2 GiB by default).
+
+    This can be called from several threads or processes at once. The
+    object files shared by every model built with the same ``make_args``
+    are built once, under a lock, before the model itself.
+
     :param stan_file: A path to a Stan model file.
     :param stanc_args: A list of arguments to pass to stanc3.
         For example, ``["--O1"]`` will enable compiler optimization level 1.
@@ -111,36 +133,249 @@ def compile_model(
         For example, ``["STAN_THREADS=True"]`` will enable
         threading for the compiled model. If the same flags are defined
         in ``make/local``, the versions passed here will take precedent.
+    :param cache_dir: A directory in which to cache compiled models. If
+        ``None``, the value of ``BRIDGESTAN_CACHE_DIR`` is used, and if
+        that is not set the model is not cached.
+    :param progress: A function called with the path of the Stan file and
+        each line of Make's output (both stdout and stderr) as soon as it is
+        written. For example, ``lambda f, line: print(f.name, line)``.
     :raises FileNotFoundError or PermissionError: If `stan_file` does not exist
         or is not readable.
     :raises ValueError: If BridgeStan cannot be located.
     :raises RuntimeError: If compilation fails.
     """
     verify_bridgestan_path(get_bridgestan_path())
+    file_path = _validate_stan_file(stan_file)
+    output_callback = _line_callback(progress, file_path)
+
+    cache = get_cache_dir(cache_dir)
+    if cache is not None:
+        return cached_compile(
+            cache,
+            file_path,
+            get_bridgestan_path(),
+            stanc_args,
+            make_args,
+            lambda output, args: _make(output, args, make_args, output_callback),
+        )
+
+    output = generate_so_name(file_path)
+    _make(output, ["--include-paths=."] + stanc_args, make_args, output_callback)
+    return output
+
+
+def compile_model_async(
+    stan_file: Union[str, os.PathLike],
+    *,
+    stanc_args: List[str] = [],
+    make_args: List[str] = [],
+    cache_dir: Optional[Union[str, os.PathLike]] = None,
+    progress: Optional[ProgressCallback] = None,
+    executor: Optional[ThreadPoolExecutor] = None,
+) -> "Future[Path]":
+    """
+    Start compiling a ``.stan`` file in the background, as with
+    :func:`compile_model`, and return a future for the path to the ``.so``.
+
+    Any number of models can be compiled concurrently. The object files
+    shared by every model built with the same ``make_args`` are built once,
+    before the model itself, so concurrent builds do not race on them.
+
+    :param stan_file: A path to a Stan model file.
+    :param stanc_args: A list of arguments to pass to stanc3.
+    :param make_args: A list of additional arguments to pass to Make.
+    :param cache_dir: A directory in which to cache compiled models. See
+        :func:`compile_model`.
+    :param progress: A function called with the path of the Stan file and
+        each line of Make's output as soon as it is written. This is called
+        from a worker thread.
+    :param executor: The executor to compile the model on. If ``None``, a
+        shared executor with one worker per CPU is used.
+    :return: A :class:`concurrent.futures.Future` which resolves to the
+        path of the compiled library, or raises the same errors as
+        :func:`compile_model`.
+    """
+    if executor is None:
+        executor = _default_executor()
+    return executor.submit(
+        compile_model,
+        stan_file,
+        stanc_args=stanc_args,
+        make_args=make_args,
+        cache_dir=cache_dir,
+        progress=progress,
+    )
+
+
+def compile_models(
+    stan_files: Sequence[Union[str, os.PathLike]],
+    *,
+    stanc_args: List[str] = [],
+    make_args: List[str] = [],
+    cache_dir: Optional[Union[str, os.PathLike]] = None,
+    progress: Optional[ProgressCallback] = None,
+    jobs: Optional[int] = None,
+) -> List[Path]:
+    """
+    Compile several ``.stan`` files concurrently, as with
+    :func:`compile_model`.
+
+    :param stan_files: Paths to Stan model files.
+    :param stanc_args: A list of arguments to pass to stanc3 for every model.
+    :param make_args: A list of additional arguments to pass to Make for
+        every model.
+    :param cache_dir: A directory in which to cache compiled models. See
+        :func:`compile_model`.
+    :param progress: A function called with the path of the Stan file and
+        each line of Make's output as soon as it is written. This is called
+        from worker threads.
+    :param jobs: The number of models to compile at once. If ``None``, the
+        number of CPUs is used.
+    :return: The paths to the compiled libraries, in the order of
+        ``stan_files``.
+    :raises RuntimeError: If any compilation fails, after every other model
+        has finished compiling.
+    """
+    with ThreadPoolExecutor(jobs or os.cpu_count()) as executor:
+        futures = [
+            compile_model_async(
+                stan_file,
+                stanc_args=stanc_args,
+                make_args=make_args,
+                cache_dir=cache_dir,
+                progress=progress,
+                executor=executor,
+            )
+            for stan_file in stan_files
+        ]
+    return [future.result() for future in futures]
+
+
+_DEFAULT_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_DEFAULT_EXECUTOR_LOCK = threading.Lock()
+
+
+def _default_executor() -> ThreadPoolExecutor:
+    global _DEFAULT_EXECUTOR
+    with _DEFAULT_EXECUTOR_LOCK:
+        if _DEFAULT_EXECUTOR is None:
+            _DEFAULT_EXECUTOR = ThreadPoolExecutor(
+                os.cpu_count(), thread_name_prefix="bridgestan-compile"
+            )
+        return _DEFAULT_EXECUTOR
+
+
+# prerequisites of every model library which depend only on make_args
+SHARED_TARGETS = ["STANC", "BRIDGE_O", "SUNDIALS_TARGETS", "MPI_TARGETS", "TBB_TARGETS"]
+_SHARED_BUILT: Set[Tuple[str, ...]] = set()
+_SHARED_LOCK = threading.Lock()
+
+
+def _validate_stan_file(stan_file: Union[str, os.PathLike]) -> Path:
     file_path = Path(stan_file).resolve()
     validate_readable(file_path)
     if file_path.suffix != ".stan":
         raise ValueError(f"File '{stan_file}' does not end in .stan")
+    return file_path
 
-    output = generate_so_name(file_path)
+
+def _line_callback(
+    progress: Optional[ProgressCallback], file_path: Path
+) -> Optional[Callable[[str], None]]:
+    if progress is None:
+        return None
+    return lambda line: progress(file_path, line)
+
+
+def _make_shared(
+    make_args: List[str], output_callback: Optional[Callable[[str], None]]
+) -> None:
+    """
+    Build the targets in SHARED_TARGETS for ``make_args``, once per process,
+    while holding a lock shared with other processes.
+    """
+    bs_path = get_bridgestan_path()
+    verify_bridgestan_path(bs_path)
+    key = (bs_path, *make_args)
+    with _SHARED_LOCK:
+        if key in _SHARED_BUILT:
+            return
+        lock_name = hashlib.sha256(bs_path.encode()).hexdigest()[:16]
+        lock = Path(tempfile.gettempdir()) / f"bridgestan-{lock_name}.lock"
+        with file_lock(lock):
+            values = _run(
+                [MAKE] + make_args + [f"print-{name}" for name in SHARED_TARGETS],
+                None,
+            )
+            targets = []
+            for line in values.splitlines():
+                name, _, value = line.partition(" = ")
+                if name in SHARED_TARGETS:
+                    targets += value.split()
+            if targets:
+                _run([MAKE] + make_args + targets, output_callback)
+        _SHARED_BUILT.add(key)
+
+
+def _make(
+    output: Path,
+    stanc_args: List[str],
+    make_args: List[str],
+    output_callback: Optional[Callable[[str], None]] = None,
+) -> None:
+    # so that concurrent builds do not race on the shared object files
+    _make_shared(make_args, output_callback)
     cmd = (
         [MAKE]
         + make_args
-        + ["STANCFLAGS=" + " ".join(["--include-paths=."] + stanc_args)]
+        + ["STANCFLAGS=" + " ".join(stanc_args)]
         + [os.fspath(output)]
     )
-    proc = subprocess.run(
-        cmd, cwd=get_bridgestan_path(), capture_output=True, text=True, check=False
-    )
+    _run(cmd, output_callback)
+
+
+def _run(cmd: List[str], output_callback: Optional[Callable[[str], None]]) -> str:
+    """
+    Run a command in the BridgeStan folder and return its stdout, calling
+    ``output_callback`` with each line of stdout and stderr as it is written.
+
+    :raises RuntimeError: If the command fails.
+    """
+    if output_callback is None:
+        proc = subprocess.run(
+            cmd, cwd=get_bridgestan_path(), capture_output=True, text=True, check=False
+        )
+        returncode, stdout, stderr = proc.returncode, proc.stdout, proc.stderr
+    else:
+        with subprocess.Popen(
+            cmd,
+            cwd=get_bridgestan_path(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        ) as proc:
+            lines: Dict[str, List[str]] = {"stdout": [], "stderr": []}
 
-    if proc.returncode:
+            def forward(name: str) -> None:
+                for line in getattr(proc, name):
+                    lines[name].append(line)
+                    output_callback(line.rstrip("\n"))
+
+            reader = threading.Thread(target=forward, args=("stderr",))
+            reader.start()
+            forward("stdout")
+            reader.join()
+            returncode = proc.wait()
+        stdout, stderr = "".join(lines["stdout"]), "".join(lines["stderr"])
+
+    if returncode:
         error = (
-            f"Command {' '.join(cmd)} failed with code {proc.returncode}.\n"
-            f"stdout:\n{proc.stdout}\nstderr:\n{proc.stderr}"
+            f"Command {' '.join(cmd)} failed with code {returncode}.\n"
+            f"stdout:\n{stdout}\nstderr:\n{stderr}"
         )
 
         raise RuntimeError(error)
-    return output
+    return stdout
 
 
 def windows_dll_path_setup() -> None:
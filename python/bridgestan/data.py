@@ -0,0 +1,245 @@
+"""
+Passing data to a model as arrays rather than as JSON.
+
+A dictionary of NumPy arrays and numbers is described to the C++ side as
+a table of ``bs_data_buffer`` structures (see ``bridgestan.h``), each of
+which points at the memory of an array. The model reads the arrays in
+place while it is constructed, so large data is never serialized to JSON
+and parsed again.
+
+Data can also be saved in a binary file ending in ``.bsdata``, which the
+C++ side memory maps and reads the same way. The layout of these files is
+described in ``src/binary_data.hpp``.
+"""
+
+import ctypes
+import json
+import os
+import struct
+import tempfile
+from numbers import Number
+from pathlib import Path
+from typing import Any, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+BS_DATA_FLOAT64 = 0
+BS_DATA_INT32 = 1
+BS_DATA_INT64 = 2
+
+BINARY_DATA_SUFFIX = ".bsdata"
+BINARY_DATA_MAGIC = b"BSDATA\x00\x01"
+BINARY_DATA_BYTE_ORDER_MARK = 0x01020304
+# the values of each variable start at a multiple of this many bytes
+BINARY_DATA_ALIGNMENT = 64
+
+
+class DataBuffer(ctypes.Structure):
+    """Mirrors ``bs_data_buffer`` in ``bridgestan.h``."""
+
+    _fields_ = [
+        ("name", ctypes.c_char_p),
+        ("type", ctypes.c_int),
+        ("ndim", ctypes.c_int),
+        ("shape", ctypes.POINTER(ctypes.c_size_t)),
+        ("strides", ctypes.POINTER(ctypes.c_ssize_t)),
+        ("data", ctypes.c_void_p),
+    ]
+
+
+def _as_buffer_array(value: Any) -> Optional[Tuple[np.ndarray, int]]:
+    """
+    Return the array to pass for a value, converted if its type cannot be
+    read directly, and its ``bs_data_type``, or ``None`` if the value must
+    be passed as JSON instead.
+    """
+    if not isinstance(value, (np.ndarray, Number, np.generic)):
+        return None
+    arr = np.asarray(value)
+    kind = arr.dtype.kind
+    if kind == "c":
+        # complex data is real data with a trailing dimension of size 2
+        arr = np.stack([arr.real, arr.imag], axis=-1)
+        kind = arr.dtype.kind
+    if kind == "f":
+        if arr.dtype != np.float64:
+            arr = arr.astype(np.float64)
+        return arr, BS_DATA_FLOAT64
+    if kind in "biu":
+        if arr.dtype == np.int32:
+            return arr, BS_DATA_INT32
+        if arr.dtype == np.int64:
+            return arr, BS_DATA_INT64
+        if kind == "u" and arr.dtype.itemsize >= 8:
+            return None
+        # smaller and non-native integer types, and booleans as in JSON
+        return arr.astype(np.int64), BS_DATA_INT64
+    return None
+
+
+def buffer_table(
+    data: Mapping[str, Any],
+) -> Optional[Tuple["ctypes.Array[DataBuffer]", List[Any]]]:
+    """
+    Describe a mapping of names to arrays and numbers as a table of
+    ``bs_data_buffer`` structures.
+
+    Arrays of floating point, integer, boolean and complex types are
+    supported, with any strides. Arrays of ``float64``, ``int32`` and
+    ``int64`` in native byte order are referenced without a copy.
+
+    :param data: A mapping from variable names to values.
+    :return: A tuple of the table and a list of objects which must be kept
+        alive while the table is in use, or ``None`` if any value is not
+        supported, in which case the data should be passed as JSON.
+    """
+    table = (DataBuffer * len(data))()
+    keep_alive: List[Any] = [table]
+    for entry, (name, value) in zip(table, data.items()):
+        converted = _as_buffer_array(value)
+        if converted is None or not isinstance(name, str):
+            return None
+        arr, dtype = converted
+        if not arr.dtype.isnative:
+            arr = arr.astype(arr.dtype.newbyteorder("="))
+        shape = (ctypes.c_size_t * arr.ndim)(*arr.shape)
+        strides = (ctypes.c_ssize_t * arr.ndim)(*arr.strides)
+        encoded = name.encode("utf-8")
+        entry.name = encoded
+        entry.type = dtype
+        entry.ndim = arr.ndim
+        entry.shape = shape
+        entry.strides = strides
+        entry.data = arr.ctypes.data
+        keep_alive += [encoded, arr, shape, strides]
+    return table, keep_alive
+
+
+def sequence_buffer_table(
+    data: Mapping[str, Any],
+) -> Optional[Tuple["ctypes.Array[DataBuffer]", List[Any]]]:
+    """
+    Describe a mapping of names to values as a table of ``bs_data_buffer``
+    structures, as :func:`buffer_table`, but also converting lists and
+    tuples of numbers, which are common in dictionaries of parameters, to
+    arrays.
+
+    :param data: A mapping from variable names to values.
+    :return: As :func:`buffer_table`.
+    """
+    arrays = {}
+    for name, value in data.items():
+        if isinstance(value, (list, tuple)):
+            try:
+                value = np.asarray(value)
+            except ValueError:  # ragged
+                return None
+        arrays[name] = value
+    return buffer_table(arrays)
+
+
+def _as_binary_array(name: str, value: Any) -> Tuple[np.ndarray, int]:
+    arr = np.asarray(value)
+    if arr.dtype.kind == "U":
+        # JSON allows non-finite values as strings, such as "NaN" and "-Inf"
+        try:
+            arr = arr.astype(np.float64)
+        except ValueError as e:
+            raise ValueError(
+                f"Variable '{name}' cannot be saved as binary data: {e}"
+            ) from e
+    converted = _as_buffer_array(arr)
+    if converted is None:
+        raise ValueError(
+            f"Variable '{name}' cannot be saved as binary data: "
+            f"unsupported type {arr.dtype}"
+        )
+    arr, dtype = converted
+    if dtype == BS_DATA_INT64 and (
+        arr.size == 0
+        or (arr.min() >= np.iinfo(np.int32).min and arr.max() <= np.iinfo(np.int32).max)
+    ):
+        arr, dtype = arr.astype(np.int32), BS_DATA_INT32
+    # not np.ascontiguousarray, which makes scalars one-dimensional
+    return arr.astype(arr.dtype.newbyteorder("="), order="C", copy=False), dtype
+
+
+def dump_binary_data(path: Union[str, os.PathLike], data: Mapping[str, Any]) -> None:
+    """
+    Save data in the BridgeStan binary format.
+
+    A model given the path of this file as its data, which must end in
+    ``.bsdata``, memory maps the file instead of parsing it. This makes
+    construction fast for large data, and processes which construct models
+    from the same file share one copy of it in the operating system's page
+    cache.
+
+    Values can be anything compatible with :func:`numpy.asarray` with a
+    floating point, integer, boolean or complex type. Integers are stored
+    as 32-bit integers when they fit. The file uses the byte order of this
+    machine, and can only be read on machines with the same byte order.
+
+    :param path: The file to write, which must end with ``.bsdata``. It is
+        replaced atomically, so models constructed from it concurrently
+        see either the old or the new data.
+    :param data: A mapping from variable names to values.
+    :raises ValueError: If ``path`` does not end with ``.bsdata`` or a
+        value has an unsupported type.
+    """
+    path = Path(path)
+    if path.suffix != BINARY_DATA_SUFFIX:
+        raise ValueError(f"Binary data files must end with '{BINARY_DATA_SUFFIX}'")
+    arrays = [
+        (str(name), *_as_binary_array(name, value)) for name, value in data.items()
+    ]
+
+    header_size = len(BINARY_DATA_MAGIC) + 8
+    for name, arr, _ in arrays:
+        header_size += 4 + len(name.encode("utf-8")) + 8 + 8 * arr.ndim + 8
+    header = bytearray(BINARY_DATA_MAGIC)
+    header += struct.pack("=II", BINARY_DATA_BYTE_ORDER_MARK, len(arrays))
+    offsets = []
+    offset = header_size
+    for name, arr, dtype in arrays:
+        offset = -(-offset // BINARY_DATA_ALIGNMENT) * BINARY_DATA_ALIGNMENT
+        offsets.append(offset)
+        encoded = name.encode("utf-8")
+        header += struct.pack("=I", len(encoded)) + encoded
+        header += struct.pack(f"=II{arr.ndim}QQ", dtype, arr.ndim, *arr.shape, offset)
+        offset += arr.nbytes
+
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(header)
+            for (_, arr, _), offset in zip(arrays, offsets):
+                file.write(b"\0" * (offset - file.tell()))
+                file.write(memoryview(arr).cast("B"))
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def convert_json_data(
+    json_file: Union[str, os.PathLike],
+    path: Optional[Union[str, os.PathLike]] = None,
+) -> Path:
+    """
+    Convert a data file in the JSON format to the BridgeStan binary format.
+    See :func:`dump_binary_data`.
+
+    :param json_file: The JSON data file.
+    :param path: The binary data file to write. Defaults to ``json_file``
+        with its suffix replaced by ``.bsdata``.
+    :return: The path of the binary data file.
+    :raises ValueError: If a variable cannot be stored in the binary
+        format, such as a tuple.
+    """
+    json_file = Path(json_file)
+    path = json_file.with_suffix(BINARY_DATA_SUFFIX) if path is None else Path(path)
+    with open(json_file, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    dump_binary_data(path, data)
+    return path
@@ -0,0 +1,158 @@
+"""
+The layout of the flat vectors of parameters of a model, parsed from the
+indexed names of their columns.
+"""
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+import stanio
+from numpy.lib.stride_tricks import as_strided
+from stanio.reshape import VariableType
+
+
+class ParamIndex:
+    """
+    The layout of the flat vectors of parameters of a model: which
+    columns hold each variable, and its shape.
+
+    This should not be constructed directly. Instead, use
+    :meth:`StanModel.param_index` or :meth:`StanModel.param_unc_index`,
+    which build it once per model.
+
+    For example, to get the draws of each variable of a batch as arrays
+    of shape ``(N, *dims)`` without copying::
+
+        index = model.param_index(include_tp=True)
+        draws, _ = model.param_constrain_batch(theta_unc, include_tp=True)
+        views = index.views(draws)
+        views["sigma"]
+    """
+
+    def __init__(self, names: Sequence[str]) -> None:
+        #: The indexed name of each column, as from :meth:`StanModel.param_names`.
+        self.names: Tuple[str, ...] = tuple(names)
+        self._variables: Optional[Dict[str, stanio.Variable]] = None
+        self._positions: Optional[Dict[str, int]] = None
+
+    @property
+    def variables(self) -> Dict[str, stanio.Variable]:
+        """
+        The :class:`stanio.Variable` describing each variable, by name, in
+        the order of the model.
+        """
+        if self._variables is None:
+            self._variables = (
+                stanio.parse_header(",".join(self.names)) if self.names else {}
+            )
+        return self._variables
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.variables)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.variables
+
+    def __repr__(self) -> str:
+        return f"ParamIndex({list(self.variables)!r}, columns={len(self)})"
+
+    def slice(self, name: str) -> slice:
+        """
+        Return the slice of the columns which hold the variable ``name``.
+
+        :raises KeyError: If there is no variable ``name``.
+        """
+        var = self.variables[name]
+        return slice(var.start_idx, var.end_idx)
+
+    def shape(self, name: str) -> Tuple[int, ...]:
+        """
+        Return the shape of the variable ``name``, which is ``()`` for a
+        scalar.
+
+        :raises KeyError: If there is no variable ``name``.
+        """
+        return tuple(self.variables[name].dimensions)
+
+    def columns(self, name: str) -> List[int]:
+        """
+        Return the indices of the columns selected by ``name``, which is
+        either the name of a variable, an indexed name such as ``a.2.3``,
+        or a prefix of indexed names such as ``a.2``, in column order.
+
+        :raises KeyError: If ``name`` selects no columns.
+        """
+        if name in self.variables:
+            return list(self.variables[name].columns())
+        if self._positions is None:
+            self._positions = {n: i for i, n in enumerate(self.names)}
+        if name in self._positions:
+            return [self._positions[name]]
+        prefix = name + "."
+        columns = [i for i, n in enumerate(self.names) if n.startswith(prefix)]
+        if not columns:
+            raise KeyError(name)
+        return columns
+
+    def view(self, values: npt.NDArray[np.float64], name: str) -> npt.NDArray:
+        """
+        Return the variable ``name`` from an array whose last axis holds
+        the flat parameters, with that axis replaced by the shape of the
+        variable.
+
+        Real variables are returned as views of ``values``, which share its
+        memory, as are complex variables when the last axis of ``values``
+        is contiguous. Tuples, and complex variables otherwise, are copied.
+
+        :param values: Array of shape ``(..., P)``, where ``P`` is the
+            number of columns of this index.
+        :param name: The name of a variable.
+        :return: Array of shape ``(..., *dims)``.
+        :raises ValueError: If the last axis of ``values`` is not of length ``P``.
+        :raises KeyError: If there is no variable ``name``.
+        """
+        if values.shape[-1:] != (len(self),):
+            raise ValueError(
+                f"Error: values must have shape (..., {len(self)}), "
+                f"got {values.shape}"
+            )
+        var = self.variables[name]
+        dims = tuple(var.dimensions)
+        lead = values.shape[:-1]
+        step = values.strides[-1]
+        if var.type == VariableType.SCALAR:
+            part = values[..., var.start_idx :]
+        elif (
+            var.type == VariableType.COMPLEX
+            and step == values.itemsize
+            and values.dtype == np.float64
+        ):
+            part = values[..., var.start_idx : var.end_idx].view(np.complex128)
+            step = part.strides[-1]
+        else:
+            return var.extract_reshape(values)
+        # the variable is stored in column-major order
+        strides = tuple(step * int(np.prod(dims[:i])) for i in range(len(dims)))
+        return as_strided(
+            part,
+            shape=lead + dims,
+            strides=values.strides[:-1] + strides,
+            writeable=values.flags.writeable,
+        )
+
+    def views(self, values: npt.NDArray[np.float64]) -> Dict[str, npt.NDArray]:
+        """
+        Return a dictionary of every variable from an array whose last axis
+        holds the flat parameters, as from :meth:`view`.
+
+        :param values: Array of shape ``(..., P)``, where ``P`` is the
+            number of columns of this index.
+        :return: A dictionary from the name of each variable to an array
+            of shape ``(..., *dims)``.
+        :raises ValueError: If the last axis of ``values`` is not of length ``P``.
+        """
+        return {name: self.view(values, name) for name in self.variables}
@@ -1,19 +1,54 @@
 import ctypes
+import os
+import tempfile
+import threading
 import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from os import PathLike, fspath
 from pathlib import Path
-from typing import Any, List, Mapping, Optional, Tuple, Union
+from types import SimpleNamespace
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-import dllist
 import numpy as np
 import numpy.typing as npt
 import stanio
 from numpy.ctypeslib import ndpointer
 
+from . import registry, sparse
 from .__version import __version_info__
+from .cache import get_cache_dir
 from .compile import compile_model, windows_dll_path_setup
+from .data import (
+    BINARY_DATA_SUFFIX,
+    DataBuffer,
+    buffer_table,
+    dump_binary_data,
+    sequence_buffer_table,
+)
+from .index import ParamIndex
+from .objective import StanObjective
 from .util import validate_readable
 
+if TYPE_CHECKING:
+    import scipy.sparse
+
+try:
+    from ._fastcall import FastModel
+except ImportError:  # the optional extension was not built
+    FastModel = None
+
 
 def array_ptr(*args, **kwargs):
     """
@@ -40,20 +75,42 @@ FloatArray = Union[
     "ctypes._Pointer[ctypes.c_double]",
     ctypes.Array[ctypes.c_double],
 ]
+# the columns of the constrained parameters to return, by index or name
+Columns = Union[npt.ArrayLike, Iterable[str]]
 
 double_array = array_ptr(dtype=ctypes.c_double, flags=("C_CONTIGUOUS"))
 writeable_double_array = array_ptr(
     dtype=ctypes.c_double, flags=("C_CONTIGUOUS", "WRITEABLE")
 )
+writeable_int_array = array_ptr(dtype=ctypes.c_int, flags=("C_CONTIGUOUS", "WRITEABLE"))
+size_t_array = array_ptr(dtype=ctypes.c_size_t, flags=("C_CONTIGUOUS"))
 star_star_char = ctypes.POINTER(ctypes.c_char_p)
 c_print_callback = ctypes.CFUNCTYPE(None, ctypes.POINTER(ctypes.c_char), ctypes.c_int)
 
 
+def _address(func: ctypes._CFuncPtr) -> int:
+    """Return the address of a function in a loaded shared library."""
+    return ctypes.cast(func, ctypes.c_void_p).value
+
+
 @c_print_callback
 def _print_callback(s, n):
     print(ctypes.string_at(s, n).decode("utf-8"), end="")
 
 
+# batch calls on threads which set ``quiet`` do not warn about the rows
+# which failed, for callers which report those failures themselves
+_batch_warnings = threading.local()
+
+
+def _shape(value: Any) -> Any:
+    """Return the shape of a data value, or its type if it is not an array."""
+    try:
+        return np.shape(value)
+    except ValueError:
+        return type(value).__name__
+
+
 class StanModel:
     """
     A StanModel instance encapsulates a Stan model instantiated with data
@@ -69,6 +126,7 @@ class StanModel:
         seed: int = 1234,
         stanc_args: List[str] = [],
         make_args: List[str] = [],
+        cache_dir: Optional[Union[str, PathLike]] = None,
         capture_stan_prints: bool = True,
         warn: bool = True,
         model_data: Optional[str] = None,
@@ -80,8 +138,11 @@ class StanModel:
         :param model_lib: A system path to compiled shared object or a ``.stan``
             file to be compiled.
         :param data: Data for the model. Either a JSON string literal, a
-            system path to a data file in JSON format ending in ``.json``, or
-            a dictionary which will be turned into a JSON string.
+            system path to a data file in JSON format ending in ``.json``,
+            a system path to a binary data file ending in ``.bsdata`` (see
+            :func:`bridgestan.dump_binary_data`), or a dictionary. A dictionary of NumPy arrays and numbers is
+            passed to the model in memory, without converting it to JSON;
+            other dictionaries are turned into a JSON string.
             If the model does not require data, this can be either the
             empty string or ``None`` (the default).
         :param seed: A pseudo random number generator seed, used for RNG functions
@@ -93,6 +154,8 @@ class StanModel:
             model is not compiled. For example, ``["STAN_THREADS=True"]`` will enable
             threading for the compiled model. If the same flags are defined
             in ``make/local``, the versions passed here will take precedent.
+        :param cache_dir: A directory in which to cache the compiled model if
+            it is not compiled. See :func:`bridgestan.compile_model`.
         :param capture_stan_prints: If ``True``, capture all ``print`` statements
             from the Stan model and print them from Python. This has no effect if
             the model does not contain any ``print`` statements, but may have
@@ -124,60 +187,40 @@ class StanModel:
                 DeprecationWarning,
             )
             data = model_data
-        if data is not None:
-            if isinstance(data, (str, PathLike)):
-                data = fspath(data)
-                if data.endswith(".json"):
-                    validate_readable(data)
-                    with open(data, "r", encoding="utf-8") as file:
-                        data = file.read()
-            else:
-                data = stanio.dump_stan_json(data)
+        self._set_data(data)
 
         windows_dll_path_setup()
 
+        cached = False
         if str(model_lib).endswith(".stan"):
             model_lib = compile_model(
-                model_lib, make_args=make_args, stanc_args=stanc_args
+                model_lib,
+                make_args=make_args,
+                stanc_args=stanc_args,
+                cache_dir=cache_dir,
             )
+            # cached libraries are never rebuilt in place
+            cached = get_cache_dir(cache_dir) is not None
 
         self.lib_path = fspath(Path(model_lib).absolute().resolve())
-        if warn and hasattr(dllist, "dllist") and self.lib_path in dllist.dllist():
+        if warn and not cached and registry.was_loaded_elsewhere(self.lib_path):
             warnings.warn(
                 f"Loading a shared object {self.lib_path} that has already been loaded.\n"
                 "If the file has changed since the last time it was loaded, this load may "
                 "not update the library!"
             )
-        self.stanlib = ctypes.CDLL(self.lib_path)
-
-        self.data = data or ""
+        # shared with every other model using the same library, and
+        # reloaded from a new copy if the library has been rebuilt
+        self._library = registry.acquire_library(self.lib_path)
+        self.stanlib = self._library.cdll
         self.seed = seed
+        self._capture_stan_prints = capture_stan_prints
 
-        self._construct = self.stanlib.bs_model_construct
-        self._construct.restype = ctypes.c_void_p
-        self._construct.argtypes = [
-            ctypes.c_char_p,
-            ctypes.c_uint,
-            star_star_char,
-        ]
-
-        self._free_error = self.stanlib.bs_free_error_msg
-        self._free_error.restype = None
-        self._free_error.argtypes = [ctypes.c_char_p]
-
-        self._set_print_callback = self.stanlib.bs_set_print_callback
-        self._set_print_callback.restype = None
-        self._set_print_callback.argtypes = [c_print_callback, star_star_char]
+        self._bind_library()
         if capture_stan_prints:
             self._set_print_callback(_print_callback, None)
 
-        err = ctypes.c_char_p()
-        self.model = self._construct(
-            str.encode(self.data), self.seed, ctypes.byref(err)
-        )
-
-        if not self.model:
-            raise self._handle_error(err, "bs_model_construct")
+        self._construct_model()
 
         if self.model_version() != __version_info__:
             warnings.warn(
@@ -186,135 +229,80 @@ class StanModel:
                 RuntimeWarning,
             )
 
-        self._name = self.stanlib.bs_name
-        self._name.restype = ctypes.c_char_p
-        self._name.argtypes = [ctypes.c_void_p]
-
-        self._model_info = self.stanlib.bs_model_info
-        self._model_info.restype = ctypes.c_char_p
-        self._model_info.argtypes = [ctypes.c_void_p]
-
-        self._param_num = self.stanlib.bs_param_num
-        self._param_num.restype = ctypes.c_int
-        self._param_num.argtypes = [ctypes.c_void_p, ctypes.c_bool, ctypes.c_bool]
+        self._bind_sized(self._param_unc_num(self.model))
 
-        self._param_unc_num = self.stanlib.bs_param_unc_num
-        self._param_unc_num.restype = ctypes.c_int
-        self._param_unc_num.argtypes = [ctypes.c_void_p]
-
-        num_params = self._param_unc_num(self.model)
+    def _set_data(self, data: Union[str, PathLike, None, Mapping[str, Any]]) -> None:
+        self._data_file: Optional[str] = None
+        self._data_tempfile = False
+        self._data_mapping: Optional[Mapping[str, Any]] = None
+        if data is not None:
+            if isinstance(data, (str, PathLike)):
+                data = fspath(data)
+                if data.endswith(".json") or data.endswith(BINARY_DATA_SUFFIX):
+                    # read by the C++ side, and by Python only if needed
+                    validate_readable(data)
+                    self._data_file = os.path.abspath(data)
+            else:
+                # converted to JSON only if it cannot be passed in memory
+                self._data_mapping = data
+        # None until the data property converts or reads the data
+        self._data: Optional[str] = None
+        if self._data_file is None and self._data_mapping is None:
+            self._data = data or ""
+
+    def _bind_library(self) -> None:
+        self.__dict__.update(self._library.cached("functions", _library_functions))
+
+    def _construct_model(self) -> None:
+        """Construct the C++ model from the data and seed of this object."""
+        table = None
+        if self._data_mapping is not None:
+            if self._construct_buffers is not None:
+                table = buffer_table(self._data_mapping)
 
-        param_sized_array = array_ptr(
-            dtype=ctypes.c_double,
-            flags=("C_CONTIGUOUS",),
-            shape=(num_params,),
-        )
+        err = ctypes.c_char_p()
+        if table is not None:
+            buffers, _keep_alive = table
+            self.model = self._construct_buffers(
+                buffers, len(buffers), self.seed, ctypes.byref(err)
+            )
+            method = "bs_model_construct_buffers"
+        else:
+            data = self.data if self._data_file is None else self._data_file
+            self.model = self._construct(str.encode(data), self.seed, ctypes.byref(err))
+            method = "bs_model_construct"
 
-        param_sized_out_array = array_ptr(
-            dtype=ctypes.c_double,
-            flags=("C_CONTIGUOUS", "WRITEABLE"),
-            shape=(num_params,),
-        )
-        param_sqrd_sized_out_array = array_ptr(
-            dtype=ctypes.c_double,
-            flags=("C_CONTIGUOUS", "WRITEABLE"),
-            shape=(num_params, num_params),
+        if not self.model:
+            raise self._handle_error(err, method)
+        # the sparsity pattern of the Hessian for each (propto, jacobian),
+        # which depends on the data
+        self._hessian_sparsity: Dict[Tuple[bool, bool], Any] = {}
+        # the index of the parameters for each (include_tp, include_gq), or
+        # None for the unconstrained parameters, whose sizes depend on the data
+        self._param_indices: Dict[Optional[Tuple[bool, bool]], ParamIndex] = {}
+
+    def _bind_sized(self, num_params: int) -> None:
+        self.__dict__.update(
+            self._library.cached(
+                ("sized", num_params), lambda lib: _sized_functions(lib, num_params)
+            )
         )
-
-        self._param_names = self.stanlib.bs_param_names
-        self._param_names.restype = ctypes.c_char_p
-        self._param_names.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_bool,
-            ctypes.c_bool,
-        ]
-
-        self._param_unc_names = self.stanlib.bs_param_unc_names
-        self._param_unc_names.restype = ctypes.c_char_p
-        self._param_unc_names.argtypes = [ctypes.c_void_p]
-
-        self._param_constrain = self.stanlib.bs_param_constrain
-        self._param_constrain.restype = ctypes.c_int
-        self._param_constrain.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_bool,
-            ctypes.c_bool,
-            param_sized_array,
-            writeable_double_array,
-            ctypes.c_void_p,
-            star_star_char,
-        ]
-
-        self._param_unconstrain = self.stanlib.bs_param_unconstrain
-        self._param_unconstrain.restype = ctypes.c_int
-        self._param_unconstrain.argtypes = [
-            ctypes.c_void_p,
-            double_array,
-            param_sized_out_array,
-            star_star_char,
-        ]
-
-        self._param_unconstrain_json = self.stanlib.bs_param_unconstrain_json
-        self._param_unconstrain_json.restype = ctypes.c_int
-        self._param_unconstrain_json.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_char_p,
-            param_sized_out_array,
-            star_star_char,
-        ]
-
-        self._log_density = self.stanlib.bs_log_density
-        self._log_density.restype = ctypes.c_int
-        self._log_density.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_bool,
-            ctypes.c_bool,
-            param_sized_array,
-            ctypes.POINTER(ctypes.c_double),
-            star_star_char,
-        ]
-
-        self._log_density_gradient = self.stanlib.bs_log_density_gradient
-        self._log_density_gradient.restype = ctypes.c_int
-        self._log_density_gradient.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_bool,
-            ctypes.c_bool,
-            param_sized_array,
-            ctypes.POINTER(ctypes.c_double),
-            param_sized_out_array,
-            star_star_char,
-        ]
-
-        self._log_density_hessian = self.stanlib.bs_log_density_hessian
-        self._log_density_hessian.restype = ctypes.c_int
-        self._log_density_hessian.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_bool,
-            ctypes.c_bool,
-            param_sized_array,
-            ctypes.POINTER(ctypes.c_double),
-            param_sized_out_array,
-            param_sqrd_sized_out_array,
-            star_star_char,
-        ]
-
-        self._log_density_hvp = self.stanlib.bs_log_density_hessian_vector_product
-        self._log_density_hvp.restype = ctypes.c_int
-        self._log_density_hvp.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_bool,
-            ctypes.c_bool,
-            param_sized_array,
-            param_sized_array,
-            ctypes.POINTER(ctypes.c_double),
-            param_sized_out_array,
-            star_star_char,
-        ]
-
-        self._destruct = self.stanlib.bs_model_destruct
-        self._destruct.restype = None
-        self._destruct.argtypes = [ctypes.c_void_p]
+        self._make_fast(num_params)
+
+    def _make_fast(self, num_params: int) -> None:
+        # calls the most frequently used functions without ctypes, falling
+        # back to the methods above for any input it does not handle
+        self._fast = None
+        if FastModel is not None:
+            self._fast = FastModel(
+                self.model,
+                num_params,
+                _address(self._free_error),
+                _address(self._log_density),
+                _address(self._log_density_gradient),
+                np.empty,
+                np.ndarray,
+            )
 
     def __del__(self) -> None:
         """
@@ -322,10 +310,171 @@ class StanModel:
         """
         if hasattr(self, "model") and hasattr(self, "_destruct"):
             self._destruct(self.model)
+        if hasattr(self, "_library"):
+            self._library.release()
+        if getattr(self, "_data_tempfile", False):
+            try:
+                os.unlink(self._data_file)
+            except OSError:
+                pass
+
+    def __reduce__(self):
+        """
+        Support pickling, for example to send a model to the workers of a
+        :class:`concurrent.futures.ProcessPoolExecutor`, by reconstructing
+        it from the library path, data, seed and ``capture_stan_prints``.
+
+        Data which was read from a file is pickled as the path of that
+        file. Other data larger than ``PICKLE_DATA_INLINE_LIMIT`` bytes is
+        written to a temporary file the first time the model is pickled,
+        and that path is pickled instead, so large data is not serialized
+        again for every task. Data which was passed as a dictionary of
+        arrays is written in the binary format, which the workers memory
+        map. The temporary file is deleted when this model is garbage
+        collected.
+
+        Each process keeps the last few models it unpickled, so a worker
+        that receives the same model for many tasks constructs it once.
+        """
+        if self._data_file is None and self._data_mapping is not None:
+            # passed in memory, so every value is an array or a number
+            size = sum(np.asarray(v).nbytes for v in self._data_mapping.values())
+            if size > PICKLE_DATA_INLINE_LIMIT:
+                fd, path = tempfile.mkstemp(
+                    prefix="bridgestan-", suffix=BINARY_DATA_SUFFIX
+                )
+                os.close(fd)
+                dump_binary_data(path, self._data_mapping)
+                self._data_file = path
+                self._data_tempfile = True
+        data = self.data if self._data_file is None else self._data_file
+        if self._data_file is None and len(data) > PICKLE_DATA_INLINE_LIMIT:
+            fd, path = tempfile.mkstemp(prefix="bridgestan-", suffix=".json")
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(data)
+            self._data_file = path
+            self._data_tempfile = True
+        if self._data_file is not None:
+            data = self._data_file
+        return (
+            _unpickle_model,
+            (self.lib_path, data, self.seed, self._capture_stan_prints),
+        )
+
+    @property
+    def data(self) -> str:
+        """
+        The data of the model as a JSON string, the path of a binary data
+        file, or the empty string if the model has no data.
+
+        A JSON data file is read by the model directly, and only read again
+        here the first time this is accessed. Data given as a dictionary of
+        arrays is passed to the model in memory, and only converted to JSON
+        the first time this is accessed.
+        """
+        if self._data is None:
+            if self._data_mapping is not None:
+                self._data = stanio.dump_stan_json(self._data_mapping)
+            elif self._data_file.endswith(BINARY_DATA_SUFFIX):
+                self._data = self._data_file
+            else:
+                with open(self._data_file, "r", encoding="utf-8") as file:
+                    self._data = file.read()
+        return self._data
 
     def __repr__(self) -> str:
-        data = f"{self.data!r}, " if self.data else ""
-        return f"StanModel({self.lib_path!r}, {data}, seed={self.seed})"
+        if self._data_mapping is not None:
+            # a summary, rather than every value of possibly large arrays
+            shapes = {k: _shape(v) for k, v in self._data_mapping.items()}
+            data = f"{shapes!r}, "
+        elif self._data_file is not None and not self._data_tempfile:
+            data = f"{self._data_file!r}, "
+        else:
+            data = f"{self._data!r}, " if self._data else ""
+        return f"StanModel({self.lib_path!r}, {data}seed={self.seed})"
+
+    def with_data(
+        self,
+        data: Union[str, PathLike, None, Mapping[str, Any]],
+        *,
+        seed: Optional[int] = None,
+    ) -> "StanModel":
+        """
+        Construct a new model from the same shared library with different
+        data or seed.
+
+        This is much cheaper than constructing a new :class:`StanModel`:
+        the library is not located, checked or loaded again, and the
+        function signatures declared for this model are shared by the new
+        one when it has the same number of unconstrained parameters. Only
+        the C++ model itself is constructed.
+
+        :param data: Data for the new model, as for :class:`StanModel`.
+        :param seed: A pseudo random number generator seed, used for RNG
+            functions in the ``transformed data`` block. Defaults to the seed
+            of this model.
+        :return: A new model.
+        :raises FileNotFoundError or PermissionError: If ``data`` is a path to a
+            file which is not readable.
+        :raises RuntimeError: If there is an error instantiating the
+            model from C++.
+        """
+        new = object.__new__(type(self))
+        new.__dict__.update(
+            (k, v) for k, v in self.__dict__.items() if k not in _MODEL_STATE
+        )
+        new._library = self._library.retain()
+        new.seed = self.seed if seed is None else seed
+        new._set_data(data)
+        new._construct_model()
+        num_params = new._param_unc_num(new.model)
+        if num_params == self.param_unc_num():
+            new._make_fast(num_params)
+        else:
+            new._bind_sized(num_params)
+        return new
+
+    def with_datasets(
+        self,
+        datasets: Iterable[Union[str, PathLike, None, Mapping[str, Any]]],
+        *,
+        seeds: Optional[Iterable[int]] = None,
+        jobs: Optional[int] = None,
+    ) -> List["StanModel"]:
+        """
+        Construct a new model from the same shared library for each of
+        several datasets, as with :meth:`with_data`, for example for each
+        fold of cross-validation.
+
+        The models are constructed in parallel threads, since construction
+        does not hold the global interpreter lock. Models which are not
+        compiled with ``STAN_THREADS`` share the global autodiff stack used
+        by the ``transformed data`` block, so they are constructed one at a
+        time.
+
+        :param datasets: Data for each of the new models.
+        :param seeds: A seed for each of the new models. Defaults to the
+            seed of this model for every model.
+        :param jobs: The maximum number of threads to use. Defaults to the
+            number of processors.
+        :return: A list of the new models, in the order of ``datasets``.
+        :raises RuntimeError: If there is an error instantiating any of the
+            models from C++.
+        """
+        datasets = list(datasets)
+        seeds = [self.seed] * len(datasets) if seeds is None else list(seeds)
+        if len(seeds) != len(datasets):
+            raise ValueError(
+                f"Error: expected {len(datasets)} seeds, found {len(seeds)}"
+            )
+        if "STAN_THREADS=true" not in self.model_info():
+            jobs = 1
+        if jobs == 1 or len(datasets) <= 1:
+            return [self.with_data(d, seed=s) for d, s in zip(datasets, seeds)]
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            return list(
+                executor.map(lambda d, s: self.with_data(d, seed=s), datasets, seeds)
+            )
 
     def name(self) -> str:
         """
@@ -391,11 +540,8 @@ class StanModel:
         :param include_gq: ``True`` to include generated quantities.
         :return: The indexed names of the parameters.
         """
-        return (
-            self._param_names(self.model, include_tp, include_gq)
-            .decode("utf-8")
-            .split(",")
-        )
+        index = self.param_index(include_tp=include_tp, include_gq=include_gq)
+        return list(index.names)
 
     def param_unc_names(self) -> List[str]:
         """
@@ -405,7 +551,47 @@ class StanModel:
 
         :return: The indexed names of the unconstrained parameters.
         """
-        return self._param_unc_names(self.model).decode("utf-8").split(",")
+        return list(self.param_unc_index().names)
+
+    def param_index(
+        self, *, include_tp: bool = False, include_gq: bool = False
+    ) -> ParamIndex:
+        """
+        Return the index of the constrained parameters, including
+        transformed parameters and/or generated quantities as indicated,
+        which gives the shape of each variable and the columns which hold
+        it in the output of :meth:`~StanModel.param_constrain` and
+        :meth:`~StanModel.param_constrain_batch`.
+
+        The index is built once per model and shared by every call.
+
+        :param include_tp: ``True`` to include transformed parameters.
+        :param include_gq: ``True`` to include generated quantities.
+        :return: The index of the parameters.
+        """
+        key = (bool(include_tp), bool(include_gq))
+        index = self._param_indices.get(key)
+        if index is None:
+            names = self._param_names(self.model, include_tp, include_gq)
+            index = ParamIndex(_split_names(names))
+            self._param_indices[key] = index
+        return index
+
+    def param_unc_index(self) -> ParamIndex:
+        """
+        Return the index of the unconstrained parameters, which gives the
+        shape of each variable on the unconstrained scale and the columns
+        which hold it in the unconstrained parameter vector.
+
+        The index is built once per model and shared by every call.
+
+        :return: The index of the unconstrained parameters.
+        """
+        index = self._param_indices.get(None)
+        if index is None:
+            index = ParamIndex(_split_names(self._param_unc_names(self.model)))
+            self._param_indices[None] = index
+        return index
 
     def param_constrain(
         self,
@@ -415,6 +601,7 @@ class StanModel:
         include_gq: bool = False,
         out: Optional[FloatArray] = None,
         rng: Optional["StanRNG"] = None,
+        columns: Optional[Columns] = None,
     ) -> FloatArray:
         """
         Return the constrained parameters derived from the specified
@@ -423,6 +610,10 @@ class StanModel:
         Including generated quantities uses the PRNG and may update its state.
         Setting ``out`` avoids allocation of a new array for the return value.
 
+        Setting ``columns`` returns only the selected columns, which are
+        copied directly from the model into ``out``, so no array with
+        every column is allocated.
+
         :param theta_unc: Unconstrained parameter array.
         :param include_tp: ``True`` to include transformed parameters.
         :param include_gq: ``True`` to include generated quantities.
@@ -433,10 +624,18 @@ class StanModel:
         :param rng: A ``StanRNG`` object to use for generating random
             numbers, see :meth:`~StanModel.new_rng``. Must be specified
             if ``include_gq`` is ``True``.
+        :param columns: The columns to return, either as an array of their
+            indices, in the order to return them, or as a collection of
+            variable names, such as ``["log_lik"]``, in which case every
+            column of each variable is returned in the model's order. An
+            indexed name, such as ``"log_lik.3"``, selects a single column.
+            If ``None``, every column is returned.
         :return: The constrained parameter array.
         :raises ValueError: If ``out`` is specified and is not the same
             shape as the return.
         :raises ValueError: If ``rng`` is ``None`` and ``include_gq`` is ``True``.
+        :raises ValueError: If ``columns`` contains an unknown name or an
+            index which is out of range.
         :raises RuntimeError: If the C++ Stan model throws an exception.
         """
         if rng is None:
@@ -448,7 +647,11 @@ class StanModel:
         else:
             rng_ptr = rng.ptr
 
-        dims = self.param_num(include_tp=include_tp, include_gq=include_gq)
+        indices = self._column_indices(columns, include_tp, include_gq)
+        if indices is None:
+            dims = self.param_num(include_tp=include_tp, include_gq=include_gq)
+        else:
+            dims = len(indices)
         if out is None:
             out = np.zeros(dims)
         elif hasattr(out, "shape") and out.shape != (dims,):
@@ -458,20 +661,221 @@ class StanModel:
 
         err = ctypes.c_char_p()
 
-        rc = self._param_constrain(
-            self.model,
-            include_tp,
-            include_gq,
-            theta_unc,
-            out,
-            rng_ptr,
-            ctypes.byref(err),
-        )
+        if indices is None:
+            rc = self._param_constrain(
+                self.model,
+                include_tp,
+                include_gq,
+                theta_unc,
+                out,
+                rng_ptr,
+                ctypes.byref(err),
+            )
+            method = "param_constrain"
+        else:
+            rc = self._param_constrain_columns(
+                self.model,
+                include_tp,
+                include_gq,
+                theta_unc,
+                len(indices),
+                indices,
+                out,
+                rng_ptr,
+                ctypes.byref(err),
+            )
+            method = "param_constrain_columns"
 
         if rc:
-            raise self._handle_error(err, "param_constrain")
+            raise self._handle_error(err, method)
         return out
 
+    def _column_indices(
+        self, columns: Optional[Columns], include_tp: bool, include_gq: bool
+    ) -> Optional[npt.NDArray[np.uintp]]:
+        """
+        Return the indices of the selected ``columns`` of the constrained
+        parameters, or ``None`` to select every column.
+        """
+        if columns is None:
+            return None
+        if isinstance(columns, str):
+            columns = [columns]
+        dims = self.param_num(include_tp=include_tp, include_gq=include_gq)
+        if isinstance(columns, np.ndarray) and columns.dtype.kind in "iu":
+            indices = columns
+        else:
+            columns = list(columns)
+            if not all(isinstance(c, str) for c in columns):
+                indices = np.asarray(columns, dtype=np.intp)
+            else:
+                index = self.param_index(include_tp=include_tp, include_gq=include_gq)
+                selected = np.zeros(dims, dtype=bool)
+                for name in columns:
+                    try:
+                        selected[index.columns(name)] = True
+                    except KeyError:
+                        raise ValueError(
+                            f"Error: unknown parameter name {name!r}"
+                        ) from None
+                (indices,) = np.nonzero(selected)
+        if indices.ndim != 1 or (
+            len(indices) and (indices.min() < 0 or indices.max() >= dims)
+        ):
+            raise ValueError(f"Error: column indices must be between 0 and {dims - 1}")
+        return np.ascontiguousarray(indices, dtype=ctypes.c_size_t)
+
+    def param_constrain_batch(
+        self,
+        theta_unc: npt.NDArray[np.float64],
+        *,
+        include_tp: bool = False,
+        include_gq: bool = False,
+        out: Optional[npt.NDArray[np.float64]] = None,
+        rng: Union["StanRNG", Sequence["StanRNG"], None] = None,
+        seed: Optional[int] = None,
+        n_threads: int = 1,
+        columns: Optional[Columns] = None,
+    ) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.intc]]:
+        """
+        Return a tuple of the constrained parameters derived from each row
+        of the specified array of unconstrained parameters and the status
+        code of each row, optionally including the transformed parameters
+        and/or generated quantities as specified.
+
+        Setting ``columns`` returns only the selected columns, as for
+        :meth:`~StanModel.param_constrain`, so the size of the result only
+        depends on the number of selected columns.
+
+        The whole batch is evaluated in a single call into the model.
+        A failure in one row does not prevent the others from being
+        evaluated; instead, the status code of that row is set to ``-1``
+        (and ``0`` otherwise), and the error message of the first row which
+        failed is issued as a :class:`RuntimeWarning`.
+
+        If the model was compiled with ``STAN_THREADS=True``, the rows are
+        split into contiguous chunks, one per thread, and each thread
+        draws from its own PRNG. The results are therefore reproducible
+        for the same PRNGs (or ``seed``) and number of threads.
+
+        :param theta_unc: Unconstrained parameter array of shape ``(N, D)``,
+            where ``D`` is the number of unconstrained parameters.
+        :param include_tp: ``True`` to include transformed parameters.
+        :param include_gq: ``True`` to include generated quantities.
+        :param out: A location into which the result is stored.  If
+            provided, it must have shape ``(N, P)``, where ``P`` is the number
+            of constrained parameters.  If not provided or ``None``, a freshly
+            allocated array is returned.
+        :param rng: A ``StanRNG`` object, or a sequence of them with one for
+            each thread, see :meth:`~StanModel.new_rng`. If a sequence is
+            given, one thread is used per PRNG and ``n_threads`` is ignored.
+            Either this or ``seed`` must be specified if ``include_gq`` is
+            ``True``.
+        :param seed: A seed used to create a new PRNG for each thread, where
+            thread ``w`` uses seed ``seed + w``.
+        :param n_threads: The number of threads to evaluate the batch with.
+            Values less than 1 use all available hardware threads. This is
+            ignored if the model was not compiled with ``STAN_THREADS=True``.
+        :param columns: The columns to return, as for
+            :meth:`~StanModel.param_constrain`. If ``None``, every column is
+            returned.
+        :return: A tuple consisting of the constrained parameter array and the
+            status codes.
+        :raises ValueError: If ``theta_unc`` does not have shape ``(N, D)``, or
+            if ``out`` is specified and is not the same shape as the return.
+        :raises ValueError: If ``include_gq`` is ``True`` and neither or both
+            of ``rng`` and ``seed`` are specified, or if a single ``rng`` is
+            given with more than one thread.
+        :raises ValueError: If ``columns`` contains an unknown name or an
+            index which is out of range.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        if isinstance(rng, StanRNG):
+            if n_threads != 1:
+                raise ValueError(
+                    "Error: a single rng cannot be shared between threads, "
+                    "pass one for each thread instead"
+                )
+            rngs = [rng]
+        elif rng is not None:
+            rngs = list(rng)
+            n_threads = len(rngs)
+        else:
+            rngs = None
+
+        if seed is not None:
+            if rngs is not None:
+                raise ValueError("Error: cannot specify both rng and seed")
+            if n_threads < 1:
+                n_threads = os.cpu_count() or 1
+            rngs = [self.new_rng(seed + w) for w in range(n_threads)]
+        elif rngs is None and include_gq:
+            raise ValueError(
+                "Error: must specify rng or seed when including generated quantities"
+            )
+
+        unc_dims = self.param_unc_num()
+        if theta_unc.ndim != 2 or theta_unc.shape[1] != unc_dims:
+            raise ValueError(
+                f"Error: theta_unc must have shape (N, {unc_dims}), "
+                f"got {theta_unc.shape}"
+            )
+        n = theta_unc.shape[0]
+        indices = self._column_indices(columns, include_tp, include_gq)
+        if indices is None:
+            dims = self.param_num(include_tp=include_tp, include_gq=include_gq)
+        else:
+            dims = len(indices)
+        if out is None:
+            out = np.zeros(shape=(n, dims))
+        elif out.shape != (n, dims):
+            raise ValueError(
+                "Error: out must have shape (N, P), where P is the number of "
+                "constrained parameters"
+            )
+        status = np.zeros(shape=n, dtype=np.intc)
+
+        if rngs is None:
+            rng_ptrs = None
+        else:
+            if not rngs:
+                raise ValueError("Error: rng must not be empty")
+            rng_ptrs = (ctypes.c_void_p * len(rngs))(*(r.ptr for r in rngs))
+
+        err = ctypes.c_char_p()
+        if indices is None:
+            rc = self._param_constrain_batch(
+                self.model,
+                include_tp,
+                include_gq,
+                n,
+                theta_unc,
+                out,
+                rng_ptrs,
+                n_threads,
+                status,
+                ctypes.byref(err),
+            )
+            method = "param_constrain_batch"
+        else:
+            rc = self._param_constrain_columns_batch(
+                self.model,
+                include_tp,
+                include_gq,
+                n,
+                theta_unc,
+                len(indices),
+                indices,
+                out,
+                rng_ptrs,
+                n_threads,
+                status,
+                ctypes.byref(err),
+            )
+            method = "param_constrain_columns_batch"
+        self._check_batch(rc, err, status, method)
+        return out, status
+
     def new_rng(self, seed) -> "StanRNG":
         """
         Return a new PRNG for use in :meth:`~StanModel.param_constrain``.
@@ -479,7 +883,51 @@ class StanModel:
         :param seed: A seed for the PRNG.
         :return: A new PRNG wrapper.
         """
-        return StanRNG(self.stanlib, seed)
+        return StanRNG(self._library, seed)
+
+    def workspace(
+        self, *, propto: bool = True, jacobian: bool = True
+    ) -> "StanWorkspace":
+        """
+        Return a new workspace for repeatedly evaluating the log density
+        and its derivatives into the same output arrays.
+
+        :param propto: ``True`` if constant terms should be dropped from the log density.
+        :param jacobian: ``True`` if change-of-variables terms for
+            constrained parameters should be included in the log density.
+        :return: A new workspace, see :class:`StanWorkspace`.
+        """
+        return StanWorkspace(self, propto=propto, jacobian=jacobian)
+
+    def objective(
+        self,
+        *,
+        propto: bool = True,
+        jacobian: bool = True,
+        cache_size: int = 4,
+        negate: bool = True,
+    ) -> StanObjective:
+        """
+        Return a memoizing objective for use with optimizers such as
+        :func:`scipy.optimize.minimize`, which evaluates the log density and
+        its gradient together and caches them for the most recent points.
+
+        :param propto: ``True`` if constant terms should be dropped from the log density.
+        :param jacobian: ``True`` if change-of-variables terms for
+            constrained parameters should be included in the log density.
+        :param cache_size: The number of points to keep results for.
+        :param negate: If ``True``, the objective is the negative log
+            density, so minimizing it maximizes the density.
+        :return: A new objective, see :class:`~bridgestan.objective.StanObjective`.
+        :raises ValueError: If ``cache_size`` is less than 1.
+        """
+        return StanObjective(
+            self,
+            propto=propto,
+            jacobian=jacobian,
+            cache_size=cache_size,
+            negate=negate,
+        )
 
     def param_unconstrain(
         self, theta: FloatArray, *, out: Optional[FloatArray] = None
@@ -543,6 +991,225 @@ class StanModel:
             raise self._handle_error(err, "param_unconstrain_json")
         return out
 
+    def param_unconstrain_dict(
+        self,
+        theta: Mapping[str, Any],
+        *,
+        out: Optional[FloatArray] = None,
+    ) -> FloatArray:
+        """
+        Return an array of the unconstrained parameters derived from the
+        specified dictionary of constrained parameters.
+
+        This is equivalent to :meth:`~StanModel.param_unconstrain_json`,
+        but NumPy arrays, numbers and lists of numbers are read in place by
+        the model rather than encoded as JSON and parsed. Dictionaries
+        with other values, such as tuples, are passed as JSON instead.
+
+        :param theta: A dictionary from the names of the parameters to
+            their values, with the dimensions of the parameters.
+        :param out: A location into which the result is stored.  If
+            provided, it must have shape ``(D, )``, where ``D`` is the number of
+            unconstrained parameters.  If not provided or ``None``, a freshly
+            allocated array is returned.
+        :return: The unconstrained parameter array.
+        :raises ValueError: If ``out`` is specified and is not the same
+            shape as the return value.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        table = sequence_buffer_table(theta)
+        if table is None:
+            return self.param_unconstrain_json(theta, out=out)
+        dims = self.param_unc_num()
+        if out is None:
+            out = np.zeros(shape=dims)
+        buffers, _keep_alive = table
+        err = ctypes.c_char_p()
+        rc = self._param_unconstrain_buffers(
+            self.model, buffers, len(buffers), out, ctypes.byref(err)
+        )
+        if rc:
+            raise self._handle_error(err, "param_unconstrain_buffers")
+        return out
+
+    def param_unconstrain_batch(
+        self,
+        theta: npt.NDArray[np.float64],
+        *,
+        out: Optional[npt.NDArray[np.float64]] = None,
+        n_threads: int = 1,
+    ) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.intc]]:
+        """
+        Return a tuple of the unconstrained parameters derived from each row
+        of the specified array of constrained parameters and the status code
+        of each row.
+
+        The whole batch is evaluated in a single call into the model.
+        A failure in one row does not prevent the others from being
+        evaluated; instead, the status code of that row is set to ``-1``
+        (and ``0`` otherwise), and the error message of the first row which
+        failed is issued as a :class:`RuntimeWarning`.
+
+        :param theta: Constrained parameter array of shape ``(N, P)``, where
+            ``P`` is the number of parameters.
+        :param out: A location into which the result is stored.  If
+            provided, it must have shape ``(N, D)``, where ``D`` is the number of
+            unconstrained parameters.  If not provided or ``None``, a freshly
+            allocated array is returned.
+        :param n_threads: The number of threads to evaluate the batch with.
+            Values less than 1 use all available hardware threads. This is
+            ignored if the model was not compiled with ``STAN_THREADS=True``.
+        :return: A tuple consisting of the unconstrained parameter array and
+            the status codes.
+        :raises ValueError: If ``theta`` does not have shape ``(N, P)``, or if
+            ``out`` is specified and is not the same shape as the return.
+        :raises RuntimeError: If the batch fails other than in a row.
+        """
+        param_dims = self.param_num()
+        if theta.ndim != 2 or theta.shape[1] != param_dims:
+            raise ValueError(
+                f"Error: theta must have shape (N, {param_dims}), got {theta.shape}"
+            )
+        n = theta.shape[0]
+        out = self._batch_out(out, n)
+        status = np.zeros(shape=n, dtype=np.intc)
+
+        err = ctypes.c_char_p()
+        rc = self._param_unconstrain_batch(
+            self.model, n, theta, out, n_threads, status, ctypes.byref(err)
+        )
+        self._check_batch(rc, err, status, "param_unconstrain_batch")
+        return out, status
+
+    def param_unconstrain_json_batch(
+        self,
+        thetas_json: Sequence[Union[str, Mapping[str, Any]]],
+        *,
+        out: Optional[npt.NDArray[np.float64]] = None,
+        n_threads: int = 1,
+    ) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.intc]]:
+        """
+        Return a tuple of the unconstrained parameters derived from each of
+        the specified JSON documents and the status code of each document.
+        The JSON is expected to be in the `JSON Format for CmdStan <https://mc-stan.org/docs/cmdstan-guide/json.html>`__.
+
+        The whole batch is evaluated in a single call into the model.
+        A failure for one document does not prevent the others from being
+        evaluated; instead, the status code of that document is set to
+        ``-1`` (and ``0`` otherwise), and the error message of the first
+        document which failed is issued as a :class:`RuntimeWarning`.
+
+        :param thetas_json: A sequence of JSON encoded constrained parameters
+            or dictionaries which will be converted to JSON strings.
+        :param out: A location into which the result is stored.  If
+            provided, it must have shape ``(N, D)``, where ``N`` is the number of
+            documents and ``D`` is the number of unconstrained parameters.  If
+            not provided or ``None``, a freshly allocated array is returned.
+        :param n_threads: The number of threads to evaluate the batch with.
+            Values less than 1 use all available hardware threads. This is
+            ignored if the model was not compiled with ``STAN_THREADS=True``.
+        :return: A tuple consisting of the unconstrained parameter array and
+            the status codes.
+        :raises ValueError: If ``out`` is specified and is not the same
+            shape as the return value.
+        :raises RuntimeError: If the batch fails other than in a row.
+        """
+        n = len(thetas_json)
+        out = self._batch_out(out, n)
+        status = np.zeros(shape=n, dtype=np.intc)
+        chars = (ctypes.c_char_p * n)(
+            *(
+                (
+                    theta_json
+                    if isinstance(theta_json, str)
+                    else stanio.dump_stan_json(theta_json)
+                ).encode("UTF-8")
+                for theta_json in thetas_json
+            )
+        )
+
+        err = ctypes.c_char_p()
+        rc = self._param_unconstrain_json_batch(
+            self.model, n, chars, out, n_threads, status, ctypes.byref(err)
+        )
+        self._check_batch(rc, err, status, "param_unconstrain_json_batch")
+        return out, status
+
+    def param_unconstrain_dict_batch(
+        self,
+        thetas: Sequence[Mapping[str, Any]],
+        *,
+        out: Optional[npt.NDArray[np.float64]] = None,
+        n_threads: int = 1,
+    ) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.intc]]:
+        """
+        Return a tuple of the unconstrained parameters derived from each of
+        the specified dictionaries of constrained parameters and the status
+        code of each dictionary.
+
+        This is equivalent to :meth:`~StanModel.param_unconstrain_json_batch`,
+        but the values are read in place by the model, as for
+        :meth:`~StanModel.param_unconstrain_dict`. If any dictionary has
+        a value which cannot be, the whole batch is passed as JSON instead.
+
+        The whole batch is evaluated in a single call into the model.
+        A failure for one dictionary does not prevent the others from being
+        evaluated; instead, the status code of that dictionary is set to
+        ``-1`` (and ``0`` otherwise), and the error message of the first
+        dictionary which failed is issued as a :class:`RuntimeWarning`.
+
+        :param thetas: A sequence of dictionaries from the names of the
+            parameters to their values.
+        :param out: A location into which the result is stored.  If
+            provided, it must have shape ``(N, D)``, where ``N`` is the number of
+            dictionaries and ``D`` is the number of unconstrained parameters.
+            If not provided or ``None``, a freshly allocated array is returned.
+        :param n_threads: The number of threads to evaluate the batch with.
+            Values less than 1 use all available hardware threads. This is
+            ignored if the model was not compiled with ``STAN_THREADS=True``.
+        :return: A tuple consisting of the unconstrained parameter array and
+            the status codes.
+        :raises ValueError: If ``out`` is specified and is not the same
+            shape as the return value.
+        :raises RuntimeError: If the batch fails other than in a row.
+        """
+        tables = [sequence_buffer_table(theta) for theta in thetas]
+        if any(table is None for table in tables):
+            return self.param_unconstrain_json_batch(
+                thetas, out=out, n_threads=n_threads
+            )
+        n = len(tables)
+        out = self._batch_out(out, n)
+        status = np.zeros(shape=n, dtype=np.intc)
+        buffers = (ctypes.POINTER(DataBuffer) * n)(
+            *(ctypes.cast(table, ctypes.POINTER(DataBuffer)) for table, _ in tables)
+        )
+        n_buffers = np.array([len(table) for table, _ in tables], dtype=ctypes.c_size_t)
+
+        err = ctypes.c_char_p()
+        rc = self._param_unconstrain_buffers_batch(
+            self.model, n, buffers, n_buffers, out, n_threads, status, ctypes.byref(err)
+        )
+        self._check_batch(rc, err, status, "param_unconstrain_buffers_batch")
+        return out, status
+
+    def _batch_out(
+        self, out: Optional[npt.NDArray[np.float64]], n: int
+    ) -> npt.NDArray[np.float64]:
+        """
+        Return ``out``, or a freshly allocated array if it is ``None``, after
+        checking it can hold ``n`` rows of unconstrained parameters.
+        """
+        dims = self.param_unc_num()
+        if out is None:
+            return np.zeros(shape=(n, dims))
+        if out.shape != (n, dims):
+            raise ValueError(
+                "Error: out must have shape (N, D), where D is the number of "
+                "unconstrained parameters"
+            )
+        return out
+
     def log_density(
         self,
         theta_unc: FloatArray,
@@ -563,6 +1230,11 @@ class StanModel:
         :return: The log density.
         :raises RuntimeError: If the C++ Stan model throws an exception.
         """
+        if self._fast is not None:
+            lp = self._fast.log_density(theta_unc, propto, jacobian)
+            if lp is not NotImplemented:
+                return lp
+
         lp = ctypes.c_double()
         err = ctypes.c_char_p()
         rc = self._log_density(
@@ -605,6 +1277,11 @@ class StanModel:
             shape as the gradient.
         :raises RuntimeError: If the C++ Stan model throws an exception.
         """
+        if self._fast is not None:
+            result = self._fast.log_density_gradient(theta_unc, propto, jacobian, out)
+            if result is not NotImplemented:
+                return result
+
         dims = self.param_unc_num()
         if out is None:
             out = np.zeros(shape=dims)
@@ -625,6 +1302,88 @@ class StanModel:
             raise self._handle_error(err, "log_density_gradient")
         return lp.value, out
 
+    def log_density_gradient_batch(
+        self,
+        theta_unc: npt.NDArray[np.float64],
+        *,
+        propto: bool = True,
+        jacobian: bool = True,
+        out_lp: Optional[npt.NDArray[np.float64]] = None,
+        out_grad: Optional[npt.NDArray[np.float64]] = None,
+        n_threads: int = 1,
+    ) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.intc]]:
+        """
+        Return a tuple of the log densities, gradients, and status codes
+        of each row of the specified array of unconstrained parameters,
+        dropping constant terms that do not depend on the parameters if
+        ``propto`` is ``True`` and including change of variables terms for
+        constrained parameters if ``jacobian`` is ``True``.
+
+        The whole batch is evaluated in a single call into the model.
+        A failure in one row does not prevent the others from being
+        evaluated; instead, the status code of that row is set to ``-1``
+        (and ``0`` otherwise) and its log density is set to ``NaN``. The
+        error message of the first row which failed is issued as a
+        :class:`RuntimeWarning`; use :meth:`~StanModel.log_density_gradient`
+        on any other failing row to retrieve its error message.
+
+        If the model was compiled with ``STAN_THREADS=True``, the rows are
+        split between ``n_threads`` threads inside the library, and the GIL is
+        released once for the whole batch.
+
+        :param theta_unc: Unconstrained parameter array of shape ``(N, D)``,
+            where ``D`` is the number of unconstrained parameters.
+        :param propto: ``True`` if constant terms should be dropped from the log density.
+        :param jacobian: ``True`` if change-of-variables terms for
+            constrained parameters should be included in the log density.
+        :param out_lp: A location into which the log densities are stored.  If
+            provided, it must have shape ``(N, )``.  If not provided, a freshly
+            allocated array is returned.
+        :param out_grad: A location into which the gradients are stored.  If
+            provided, it must have shape ``(N, D)``.  If not provided, a freshly
+            allocated array is returned.
+        :param n_threads: The number of threads to evaluate the batch with. Values
+            less than 1 use all available hardware threads. This is ignored if
+            the model was not compiled with ``STAN_THREADS=True``.
+        :return: A tuple consisting of the log densities, gradients, and
+            status codes.
+        :raises ValueError: If ``theta_unc`` does not have shape ``(N, D)``, or
+            if ``out_lp`` or ``out_grad`` are specified and do not have the
+            same shape as the return values.
+        :raises RuntimeError: If the batch fails other than in a row.
+        """
+        dims = self.param_unc_num()
+        if theta_unc.ndim != 2 or theta_unc.shape[1] != dims:
+            raise ValueError(
+                f"Error: theta_unc must have shape (N, {dims}), got {theta_unc.shape}"
+            )
+        n = theta_unc.shape[0]
+        if out_lp is None:
+            out_lp = np.zeros(shape=n)
+        elif out_lp.shape != (n,):
+            raise ValueError("Error: out_lp must have shape (N, )")
+        if out_grad is None:
+            out_grad = np.zeros(shape=(n, dims))
+        elif out_grad.shape != (n, dims):
+            raise ValueError("Error: out_grad must have the same shape as theta_unc")
+        status = np.zeros(shape=n, dtype=np.intc)
+
+        err = ctypes.c_char_p()
+        rc = self._log_density_gradient_batch(
+            self.model,
+            propto,
+            jacobian,
+            n,
+            theta_unc,
+            out_lp,
+            out_grad,
+            n_threads,
+            status,
+            ctypes.byref(err),
+        )
+        self._check_batch(rc, err, status, "log_density_gradient_batch")
+        return out_lp, out_grad, status
+
     def log_density_hessian(
         self,
         theta_unc: FloatArray,
@@ -633,6 +1392,7 @@ class StanModel:
         jacobian: bool = True,
         out_grad: Optional[FloatArray] = None,
         out_hess: Optional[FloatArray] = None,
+        n_threads: int = 1,
     ) -> Tuple[float, FloatArray, FloatArray]:
         """
         Return a tuple of the log density, gradient, and Hessian of the
@@ -641,6 +1401,10 @@ class StanModel:
         change of variables terms for constrained parameters if
         ``jacobian`` is ``True``.
 
+        If the model was compiled with ``STAN_THREADS=True``, the columns of
+        the Hessian are computed by ``n_threads`` threads inside the library.
+        The result is the same for any number of threads.
+
         :param theta_unc: Unconstrained parameter array.
         :param propto: ``True`` if constant terms should be dropped from the log density.
         :param jacobian: ``True`` if change-of-variables terms for
@@ -653,6 +1417,9 @@ class StanModel:
             provided, it must have shape `(D, D)`, where ``D`` is the
             number of parameters.  If not provided, a freshly allocated
             array is returned.
+        :param n_threads: The number of threads to compute the Hessian with.
+            Values less than 1 use all available hardware threads. This is
+            ignored if the model was not compiled with ``STAN_THREADS=True``.
         :return: A tuple consisting of the log density, gradient, and Hessian.
         :raises ValueError: If ``out_grad`` is specified and is not the
             same shape as the gradient or if ``out_hess`` is specified and it
@@ -669,18 +1436,33 @@ class StanModel:
         lp = ctypes.c_double()
         err = ctypes.c_char_p()
 
-        rc = self._log_density_hessian(
-            self.model,
-            propto,
-            jacobian,
-            theta_unc,
-            ctypes.byref(lp),
-            out_grad,
-            out_hess,
-            ctypes.byref(err),
-        )
+        if n_threads == 1:
+            rc = self._log_density_hessian(
+                self.model,
+                propto,
+                jacobian,
+                theta_unc,
+                ctypes.byref(lp),
+                out_grad,
+                out_hess,
+                ctypes.byref(err),
+            )
+            method = "log_density_hessian"
+        else:
+            rc = self._log_density_hessian_parallel(
+                self.model,
+                propto,
+                jacobian,
+                theta_unc,
+                ctypes.byref(lp),
+                out_grad,
+                out_hess,
+                n_threads,
+                ctypes.byref(err),
+            )
+            method = "log_density_hessian_parallel"
         if rc:
-            raise self._handle_error(err, "log_density_hessian")
+            raise self._handle_error(err, method)
         if isinstance(out_hess, np.ndarray):
             out_hess = out_hess.reshape(dims, dims)
         return lp.value, out_grad, out_hess
@@ -693,11 +1475,17 @@ class StanModel:
         propto: bool = True,
         jacobian: bool = True,
         out: Optional[FloatArray] = None,
+        n_threads: int = 1,
     ) -> Tuple[float, FloatArray]:
         """
         Return a tuple of the log density and the product of the Hessian
         with the specified vector.
 
+        If ``n_threads`` is not 1, the product is computed as the single
+        column of :meth:`~StanModel.log_density_hessian_matrix_product`,
+        whose gradient evaluations are split between threads if the model
+        was compiled with ``STAN_THREADS=True``. The result is the same.
+
         :param theta_unc: Unconstrained parameter array.
         :param v: Vector to multiply by the Hessian.
         :param propto: ``True`` if constant terms should be dropped from the log density.
@@ -707,6 +1495,9 @@ class StanModel:
             provided, it must have shape `(D, )` where ``D`` is the number
             of parameters.  If not provided, a freshly allocated array
             is returned.
+        :param n_threads: The number of threads to use. Values less than 1
+            use all available hardware threads. This is ignored if the model
+            was not compiled with ``STAN_THREADS=True``.
         :return: A tuple consisting of the log density and the product.
         :raises ValueError: If ``out`` is specified and is not the same
             shape as the product.
@@ -714,6 +1505,16 @@ class StanModel:
         dims = self.param_unc_num()
         if out is None:
             out = np.zeros(shape=dims)
+        if n_threads != 1:
+            lp_value, _ = self.log_density_hessian_matrix_product(
+                theta_unc,
+                np.asarray(v, dtype=np.float64)[:, np.newaxis],
+                propto=propto,
+                jacobian=jacobian,
+                out=out[:, np.newaxis],
+                n_threads=n_threads,
+            )
+            return lp_value, out
         lp = ctypes.c_double()
         err = ctypes.c_char_p()
 
@@ -732,6 +1533,170 @@ class StanModel:
 
         return lp.value, out
 
+    def log_density_hessian_matrix_product(
+        self,
+        theta_unc: FloatArray,
+        V: npt.NDArray[np.float64],
+        *,
+        propto: bool = True,
+        jacobian: bool = True,
+        out: Optional[npt.NDArray[np.float64]] = None,
+        out_grad: Optional[FloatArray] = None,
+        n_threads: int = 1,
+    ) -> Tuple[float, npt.NDArray[np.float64]]:
+        """
+        Return a tuple of the log density and the product of the Hessian
+        with the specified matrix, dropping constant terms that do not
+        depend on the parameters if ``propto`` is ``True`` and including
+        change of variables terms for constrained parameters if
+        ``jacobian`` is ``True``.
+
+        Each column of the product is the same as from
+        :meth:`~StanModel.log_density_hessian_vector_product`, but they are
+        all computed in a single call into the model. With finite
+        differences, the gradients for all of the columns are evaluated as
+        one batch, which is split between ``n_threads`` threads if the model
+        was compiled with ``STAN_THREADS=True``.
+
+        :param theta_unc: Unconstrained parameter array.
+        :param V: Matrix to multiply by the Hessian, of shape ``(D, k)``,
+            where ``D`` is the number of unconstrained parameters.
+        :param propto: ``True`` if constant terms should be dropped from the log density.
+        :param jacobian: ``True`` if change-of-variables terms for
+            constrained parameters should be included in the log density.
+        :param out: A location into which the product is stored.  If
+            provided, it must have shape ``(D, k)`` and be C-contiguous.
+            If not provided, a freshly allocated array is returned.
+        :param out_grad: If provided, the gradient is also computed, in
+            the same call, and stored in this array of shape ``(D, )``.
+        :param n_threads: The number of threads to use. Values less than 1
+            use all available hardware threads. This is ignored if the model
+            was not compiled with ``STAN_THREADS=True``.
+        :return: A tuple consisting of the log density and the product.
+        :raises ValueError: If ``V`` does not have shape ``(D, k)``, or if
+            ``out`` or ``out_grad`` is specified and is not the same shape
+            as the product or the gradient, or if ``out`` is not
+            C-contiguous.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        dims = self.param_unc_num()
+        V = np.asarray(V, dtype=np.float64)
+        if V.ndim != 2 or V.shape[0] != dims:
+            raise ValueError(f"Error: V must have shape ({dims}, k), got {V.shape}")
+        k = V.shape[1]
+        if out is None:
+            out = np.zeros(shape=(dims, k))
+        elif out.shape != (dims, k):
+            raise ValueError("Error: out must have the same shape as V")
+        elif not out.flags.c_contiguous:
+            raise ValueError("Error: out must be C-contiguous")
+        if out_grad is None:
+            out_grad = ctypes.POINTER(ctypes.c_double)()
+        lp = ctypes.c_double()
+        err = ctypes.c_char_p()
+
+        rc = self._log_density_hmp(
+            self.model,
+            propto,
+            jacobian,
+            theta_unc,
+            k,
+            np.ascontiguousarray(V),
+            ctypes.byref(lp),
+            out_grad,
+            out,
+            n_threads,
+            ctypes.byref(err),
+        )
+        if rc:
+            raise self._handle_error(err, "log_density_hessian_matrix_product")
+
+        return lp.value, out
+
+    def log_density_hessian_sparse(
+        self,
+        theta_unc: FloatArray,
+        *,
+        propto: bool = True,
+        jacobian: bool = True,
+        pattern: Any = None,
+    ) -> Tuple[float, FloatArray, "scipy.sparse.csr_matrix"]:
+        """
+        Return a tuple of the log density, gradient, and Hessian of the
+        specified unconstrained parameters, as in
+        :meth:`~StanModel.log_density_hessian`, with the Hessian as a
+        :class:`scipy.sparse.csr_matrix`.
+
+        The parameters are grouped so that no two in a group share a
+        nonzero row of the Hessian, and each call then takes one
+        Hessian-vector product per group, which for a sparse Hessian is
+        far fewer than the number of parameters. The products, log density
+        and gradient are computed in one call into the model. A dense
+        Hessian is never stored.
+
+        The entries of the Hessian which can be nonzero are given by
+        ``pattern``, or, the first time no pattern is given, detected
+        numerically at ``theta_unc`` and a random point near it, using one
+        Hessian-vector product per parameter. A detected pattern misses any
+        entry which is zero at both points but not elsewhere, so a pattern
+        should be given where it is known. The pattern and grouping are
+        cached for the model, and a pattern passed later replaces the
+        cached one. This requires :mod:`scipy`.
+
+        :param theta_unc: Unconstrained parameter array.
+        :param propto: ``True`` if constant terms should be dropped from the log density.
+        :param jacobian: ``True`` if change-of-variables terms for
+            constrained parameters should be included in the log density.
+        :param pattern: The sparsity pattern of the Hessian, as a matrix of
+            shape ``(D, D)`` (dense or :mod:`scipy.sparse`) whose nonzero
+            entries are those of the Hessian which can be nonzero. It is
+            made symmetric.
+        :return: A tuple consisting of the log density, gradient, and Hessian.
+        :raises ValueError: If ``pattern`` is not of shape ``(D, D)``.
+        :raises ImportError: If scipy is not installed.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        key = (propto, jacobian)
+        if pattern is not None:
+            pattern = sparse.symmetric_pattern(pattern, self.param_unc_num())
+            self._hessian_sparsity[key] = (pattern, sparse.color_columns(pattern))
+        elif key not in self._hessian_sparsity:
+            pattern = sparse.hessian_sparsity(
+                self, theta_unc, propto=propto, jacobian=jacobian
+            )
+            self._hessian_sparsity[key] = (pattern, sparse.color_columns(pattern))
+        pattern, colors = self._hessian_sparsity[key]
+        return sparse.compressed_hessian(
+            self, theta_unc, pattern, colors, propto=propto, jacobian=jacobian
+        )
+
+    def _check_batch(
+        self,
+        rc: int,
+        err: ctypes.c_char_p,
+        status: npt.NDArray[np.intc],
+        method: str,
+    ) -> None:
+        """
+        Raise the error of a batch call which failed other than in its rows.
+        The failures of rows are reported through ``status`` instead, and
+        the error message of the first row which failed as a warning.
+
+        :raises RuntimeError: If the call failed and no row failed.
+        """
+        if rc:
+            failed = np.count_nonzero(status)
+            if not failed:
+                raise self._handle_error(err, method)
+            message = str(self._handle_error(err, method)).strip()
+            if getattr(_batch_warnings, "quiet", False):
+                return
+            warnings.warn(
+                f"{failed} of {len(status)} rows failed. The first: {message}",
+                RuntimeWarning,
+                stacklevel=3,
+            )
+
     def _handle_error(self, err: ctypes.c_char_p, method: str) -> Exception:
         """
         Creates an exception based on a string from C++,
@@ -800,14 +1765,566 @@ class StanModel:
         )
 
 
+def _split_names(names: bytes) -> List[str]:
+    return names.decode("utf-8").split(",") if names else []
+
+
+# data larger than this is pickled as the path of a file
+PICKLE_DATA_INLINE_LIMIT = 1 << 20
+
+# the attributes of a StanModel which belong to its C++ model, rather
+# than to its shared library, and so are not shared by StanModel.with_data
+_MODEL_STATE = frozenset(
+    [
+        "model",
+        "seed",
+        "_data",
+        "_data_file",
+        "_data_tempfile",
+        "_data_mapping",
+        "_fast",
+        "_library",
+        "_hessian_sparsity",
+        "_param_indices",
+    ]
+)
+
+_UNPICKLED_MODELS: "OrderedDict[Tuple[str, str, int, bool], StanModel]" = OrderedDict()
+_UNPICKLED_MODELS_SIZE = 4
+
+
+def _unpickle_model(
+    lib_path: str, data: str, seed: int, capture_stan_prints: bool
+) -> StanModel:
+    key = (lib_path, data, seed, capture_stan_prints)
+    model = _UNPICKLED_MODELS.get(key)
+    if model is None:
+        model = StanModel(
+            lib_path,
+            data or None,
+            seed=seed,
+            capture_stan_prints=capture_stan_prints,
+            warn=False,
+        )
+        _UNPICKLED_MODELS[key] = model
+        if len(_UNPICKLED_MODELS) > _UNPICKLED_MODELS_SIZE:
+            _UNPICKLED_MODELS.popitem(last=False)
+    _UNPICKLED_MODELS.move_to_end(key)
+    return model
+
+
+class StanWorkspace:
+    """
+    Preallocated buffers for evaluating the log density of a model and
+    its derivatives in a loop, such as the leapfrog steps of a sampler.
+
+    The log density, gradient, Hessian, Hessian-vector product and error
+    slot are allocated once, when the workspace is created. Each method
+    writes into them and returns the arrays themselves, so the returned
+    arrays are only valid until the next call of a method which writes to
+    them. Copy them to keep them longer.
+
+    The outputs are passed to the library as pointers converted once, but
+    the parameters are not: :meth:`log_density` and
+    :meth:`log_density_gradient` take the same compiled fast path as
+    :class:`StanModel` when it is available, and otherwise, like the
+    Hessian methods, check and convert ``theta_unc`` through :mod:`ctypes`
+    on each call, which creates a few small Python objects.
+
+    A workspace is not thread-safe; create one per thread instead.
+    """
+
+    def __init__(self, model: StanModel, *, propto: bool, jacobian: bool) -> None:
+        """
+        Construct a workspace for a model.
+        This should not be called directly. Instead, use
+        :meth:`StanModel.workspace`.
+        """
+        self.model = model
+        self.propto = propto
+        self.jacobian = jacobian
+
+        dims = model.param_unc_num()
+        self.grad = np.zeros(shape=dims)
+        self.hessian = np.zeros(shape=(dims, dims))
+        self.hvp = np.zeros(shape=dims)
+        self._hvp_column = self.hvp[:, np.newaxis]
+
+        # converting these once saves the argument checks on each call
+        double_p = ctypes.POINTER(ctypes.c_double)
+        self._grad_p = self.grad.ctypes.data_as(double_p)
+        self._hessian_p = self.hessian.ctypes.data_as(double_p)
+        self._hvp_p = self.hvp.ctypes.data_as(double_p)
+        self._lp = ctypes.c_double()
+        self._lp_ref = ctypes.byref(self._lp)
+        self._err = ctypes.c_char_p()
+        self._err_ref = ctypes.byref(self._err)
+
+    def _raise(self, method: str) -> None:
+        error = self.model._handle_error(self._err, method)
+        self._err.value = None
+        raise error
+
+    def log_density(self, theta_unc: FloatArray) -> float:
+        """
+        Return the log density of the specified unconstrained parameters.
+        See :meth:`StanModel.log_density`.
+
+        :param theta_unc: Unconstrained parameter array.
+        :return: The log density.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        if self.model._fast is not None:
+            lp = self.model._fast.log_density(theta_unc, self.propto, self.jacobian)
+            if lp is not NotImplemented:
+                return lp
+
+        rc = self.model._log_density(
+            self.model.model,
+            self.propto,
+            self.jacobian,
+            theta_unc,
+            self._lp_ref,
+            self._err_ref,
+        )
+        if rc:
+            self._raise("log_density")
+        return self._lp.value
+
+    def log_density_gradient(self, theta_unc: FloatArray) -> Tuple[float, FloatArray]:
+        """
+        Return a tuple of the log density and gradient of the specified
+        unconstrained parameters. See :meth:`StanModel.log_density_gradient`.
+
+        :param theta_unc: Unconstrained parameter array.
+        :return: A tuple consisting of the log density and the gradient,
+            which is the workspace's ``grad`` array.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        if self.model._fast is not None:
+            result = self.model._fast.log_density_gradient(
+                theta_unc, self.propto, self.jacobian, self.grad
+            )
+            if result is not NotImplemented:
+                return result
+
+        rc = self.model._log_density_gradient(
+            self.model.model,
+            self.propto,
+            self.jacobian,
+            theta_unc,
+            self._lp_ref,
+            self._grad_p,
+            self._err_ref,
+        )
+        if rc:
+            self._raise("log_density_gradient")
+        return self._lp.value, self.grad
+
+    def log_density_hessian(
+        self, theta_unc: FloatArray, *, n_threads: int = 1
+    ) -> Tuple[float, FloatArray, FloatArray]:
+        """
+        Return a tuple of the log density, gradient, and Hessian of the
+        specified unconstrained parameters.
+        See :meth:`StanModel.log_density_hessian`.
+
+        :param theta_unc: Unconstrained parameter array.
+        :param n_threads: The number of threads to compute the Hessian with.
+            Values less than 1 use all available hardware threads. This is
+            ignored if the model was not compiled with ``STAN_THREADS=True``.
+        :return: A tuple consisting of the log density, the gradient, and the
+            Hessian, which are the workspace's ``grad`` and ``hessian`` arrays.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        if n_threads == 1:
+            rc = self.model._log_density_hessian(
+                self.model.model,
+                self.propto,
+                self.jacobian,
+                theta_unc,
+                self._lp_ref,
+                self._grad_p,
+                self._hessian_p,
+                self._err_ref,
+            )
+            method = "log_density_hessian"
+        else:
+            rc = self.model._log_density_hessian_parallel(
+                self.model.model,
+                self.propto,
+                self.jacobian,
+                theta_unc,
+                self._lp_ref,
+                self._grad_p,
+                self._hessian_p,
+                n_threads,
+                self._err_ref,
+            )
+            method = "log_density_hessian_parallel"
+        if rc:
+            self._raise(method)
+        return self._lp.value, self.grad, self.hessian
+
+    def log_density_hessian_vector_product(
+        self, theta_unc: FloatArray, v: FloatArray, *, n_threads: int = 1
+    ) -> Tuple[float, FloatArray]:
+        """
+        Return a tuple of the log density and the product of the Hessian
+        with the specified vector.
+        See :meth:`StanModel.log_density_hessian_vector_product`.
+
+        :param theta_unc: Unconstrained parameter array.
+        :param v: Vector to multiply by the Hessian.
+        :param n_threads: The number of threads to use. Values less than 1
+            use all available hardware threads. This is ignored if the model
+            was not compiled with ``STAN_THREADS=True``.
+        :return: A tuple consisting of the log density and the product,
+            which is the workspace's ``hvp`` array.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        if n_threads != 1:
+            lp, _ = self.model.log_density_hessian_matrix_product(
+                theta_unc,
+                np.asarray(v, dtype=np.float64)[:, np.newaxis],
+                propto=self.propto,
+                jacobian=self.jacobian,
+                out=self._hvp_column,
+                n_threads=n_threads,
+            )
+            return lp, self.hvp
+
+        rc = self.model._log_density_hvp(
+            self.model.model,
+            self.propto,
+            self.jacobian,
+            theta_unc,
+            v,
+            self._lp_ref,
+            self._hvp_p,
+            self._err_ref,
+        )
+        if rc:
+            self._raise("log_density_hessian_vector_product")
+        return self._lp.value, self.hvp
+
+
+def _library_functions(lib: ctypes.CDLL) -> Dict[str, Any]:
+    """Declare the signatures of the functions which do not depend on
+    the number of parameters of the model."""
+    f = SimpleNamespace()
+
+    f._construct = lib.bs_model_construct
+    f._construct.restype = ctypes.c_void_p
+    f._construct.argtypes = [
+        ctypes.c_char_p,
+        ctypes.c_uint,
+        star_star_char,
+    ]
+
+    # not exported by libraries compiled with older versions
+    f._construct_buffers = getattr(lib, "bs_model_construct_buffers", None)
+    if f._construct_buffers is not None:
+        f._construct_buffers.restype = ctypes.c_void_p
+        f._construct_buffers.argtypes = [
+            ctypes.POINTER(DataBuffer),
+            ctypes.c_size_t,
+            ctypes.c_uint,
+            star_star_char,
+        ]
+
+    f._free_error = lib.bs_free_error_msg
+    f._free_error.restype = None
+    f._free_error.argtypes = [ctypes.c_char_p]
+
+    f._set_print_callback = lib.bs_set_print_callback
+    f._set_print_callback.restype = None
+    f._set_print_callback.argtypes = [c_print_callback, star_star_char]
+
+    f._name = lib.bs_name
+    f._name.restype = ctypes.c_char_p
+    f._name.argtypes = [ctypes.c_void_p]
+
+    f._model_info = lib.bs_model_info
+    f._model_info.restype = ctypes.c_char_p
+    f._model_info.argtypes = [ctypes.c_void_p]
+
+    f._param_num = lib.bs_param_num
+    f._param_num.restype = ctypes.c_int
+    f._param_num.argtypes = [ctypes.c_void_p, ctypes.c_bool, ctypes.c_bool]
+
+    f._param_unc_num = lib.bs_param_unc_num
+    f._param_unc_num.restype = ctypes.c_int
+    f._param_unc_num.argtypes = [ctypes.c_void_p]
+
+    f._destruct = lib.bs_model_destruct
+    f._destruct.restype = None
+    f._destruct.argtypes = [ctypes.c_void_p]
+    return vars(f)
+
+
+def _sized_functions(lib: ctypes.CDLL, num_params: int) -> Dict[str, Any]:
+    """Declare the signatures of the functions which take arrays sized
+    by the number of unconstrained parameters."""
+    f = SimpleNamespace()
+
+    param_sized_array = array_ptr(
+        dtype=ctypes.c_double,
+        flags=("C_CONTIGUOUS",),
+        shape=(num_params,),
+    )
+
+    param_sized_out_array = array_ptr(
+        dtype=ctypes.c_double,
+        flags=("C_CONTIGUOUS", "WRITEABLE"),
+        shape=(num_params,),
+    )
+    param_sqrd_sized_out_array = array_ptr(
+        dtype=ctypes.c_double,
+        flags=("C_CONTIGUOUS", "WRITEABLE"),
+        shape=(num_params, num_params),
+    )
+
+    f._param_names = lib["bs_param_names"]
+    f._param_names.restype = ctypes.c_char_p
+    f._param_names.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+    ]
+
+    f._param_unc_names = lib["bs_param_unc_names"]
+    f._param_unc_names.restype = ctypes.c_char_p
+    f._param_unc_names.argtypes = [ctypes.c_void_p]
+
+    f._param_constrain = lib["bs_param_constrain"]
+    f._param_constrain.restype = ctypes.c_int
+    f._param_constrain.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        param_sized_array,
+        writeable_double_array,
+        ctypes.c_void_p,
+        star_star_char,
+    ]
+
+    f._param_constrain_batch = lib["bs_param_constrain_batch"]
+    f._param_constrain_batch.restype = ctypes.c_int
+    f._param_constrain_batch.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        ctypes.c_size_t,
+        double_array,
+        writeable_double_array,
+        ctypes.POINTER(ctypes.c_void_p),
+        ctypes.c_int,
+        writeable_int_array,
+        star_star_char,
+    ]
+
+    f._param_constrain_columns = lib["bs_param_constrain_columns"]
+    f._param_constrain_columns.restype = ctypes.c_int
+    f._param_constrain_columns.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        param_sized_array,
+        ctypes.c_size_t,
+        size_t_array,
+        writeable_double_array,
+        ctypes.c_void_p,
+        star_star_char,
+    ]
+
+    f._param_constrain_columns_batch = lib["bs_param_constrain_columns_batch"]
+    f._param_constrain_columns_batch.restype = ctypes.c_int
+    f._param_constrain_columns_batch.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        ctypes.c_size_t,
+        double_array,
+        ctypes.c_size_t,
+        size_t_array,
+        writeable_double_array,
+        ctypes.POINTER(ctypes.c_void_p),
+        ctypes.c_int,
+        writeable_int_array,
+        star_star_char,
+    ]
+
+    f._param_unconstrain = lib["bs_param_unconstrain"]
+    f._param_unconstrain.restype = ctypes.c_int
+    f._param_unconstrain.argtypes = [
+        ctypes.c_void_p,
+        double_array,
+        param_sized_out_array,
+        star_star_char,
+    ]
+
+    f._param_unconstrain_json = lib["bs_param_unconstrain_json"]
+    f._param_unconstrain_json.restype = ctypes.c_int
+    f._param_unconstrain_json.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_char_p,
+        param_sized_out_array,
+        star_star_char,
+    ]
+
+    f._param_unconstrain_batch = lib["bs_param_unconstrain_batch"]
+    f._param_unconstrain_batch.restype = ctypes.c_int
+    f._param_unconstrain_batch.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_size_t,
+        double_array,
+        writeable_double_array,
+        ctypes.c_int,
+        writeable_int_array,
+        star_star_char,
+    ]
+
+    f._param_unconstrain_json_batch = lib["bs_param_unconstrain_json_batch"]
+    f._param_unconstrain_json_batch.restype = ctypes.c_int
+    f._param_unconstrain_json_batch.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_size_t,
+        ctypes.POINTER(ctypes.c_char_p),
+        writeable_double_array,
+        ctypes.c_int,
+        writeable_int_array,
+        star_star_char,
+    ]
+
+    f._param_unconstrain_buffers = lib["bs_param_unconstrain_buffers"]
+    f._param_unconstrain_buffers.restype = ctypes.c_int
+    f._param_unconstrain_buffers.argtypes = [
+        ctypes.c_void_p,
+        ctypes.POINTER(DataBuffer),
+        ctypes.c_size_t,
+        param_sized_out_array,
+        star_star_char,
+    ]
+
+    f._param_unconstrain_buffers_batch = lib["bs_param_unconstrain_buffers_batch"]
+    f._param_unconstrain_buffers_batch.restype = ctypes.c_int
+    f._param_unconstrain_buffers_batch.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_size_t,
+        ctypes.POINTER(ctypes.POINTER(DataBuffer)),
+        size_t_array,
+        writeable_double_array,
+        ctypes.c_int,
+        writeable_int_array,
+        star_star_char,
+    ]
+
+    f._log_density = lib["bs_log_density"]
+    f._log_density.restype = ctypes.c_int
+    f._log_density.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        param_sized_array,
+        ctypes.POINTER(ctypes.c_double),
+        star_star_char,
+    ]
+
+    f._log_density_gradient = lib["bs_log_density_gradient"]
+    f._log_density_gradient.restype = ctypes.c_int
+    f._log_density_gradient.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        param_sized_array,
+        ctypes.POINTER(ctypes.c_double),
+        param_sized_out_array,
+        star_star_char,
+    ]
+
+    f._log_density_gradient_batch = lib["bs_log_density_gradient_batch"]
+    f._log_density_gradient_batch.restype = ctypes.c_int
+    f._log_density_gradient_batch.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        ctypes.c_size_t,
+        double_array,
+        writeable_double_array,
+        writeable_double_array,
+        ctypes.c_int,
+        writeable_int_array,
+        star_star_char,
+    ]
+
+    f._log_density_hessian = lib["bs_log_density_hessian"]
+    f._log_density_hessian.restype = ctypes.c_int
+    f._log_density_hessian.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        param_sized_array,
+        ctypes.POINTER(ctypes.c_double),
+        param_sized_out_array,
+        param_sqrd_sized_out_array,
+        star_star_char,
+    ]
+
+    f._log_density_hessian_parallel = lib["bs_log_density_hessian_parallel"]
+    f._log_density_hessian_parallel.restype = ctypes.c_int
+    f._log_density_hessian_parallel.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        param_sized_array,
+        ctypes.POINTER(ctypes.c_double),
+        param_sized_out_array,
+        param_sqrd_sized_out_array,
+        ctypes.c_int,
+        star_star_char,
+    ]
+
+    f._log_density_hmp = lib["bs_log_density_hessian_matrix_product"]
+    f._log_density_hmp.restype = ctypes.c_int
+    f._log_density_hmp.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        param_sized_array,
+        ctypes.c_size_t,
+        double_array,
+        ctypes.POINTER(ctypes.c_double),
+        param_sized_out_array,
+        writeable_double_array,
+        ctypes.c_int,
+        star_star_char,
+    ]
+
+    f._log_density_hvp = lib["bs_log_density_hessian_vector_product"]
+    f._log_density_hvp.restype = ctypes.c_int
+    f._log_density_hvp.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_bool,
+        ctypes.c_bool,
+        param_sized_array,
+        param_sized_array,
+        ctypes.POINTER(ctypes.c_double),
+        param_sized_out_array,
+        star_star_char,
+    ]
+    return vars(f)
+
+
 class StanRNG:
-    def __init__(self, lib: ctypes.CDLL, seed: int) -> None:
+    def __init__(self, lib: registry.SharedLibrary, seed: int) -> None:
         """
         Construct a Stan random number generator.
         This should not be called directly. Instead, use
         :meth:`StanModel.new_rng`.
         """
-        self.stanlib = lib
+        self._library = lib.retain()
+        self.stanlib = lib.cdll
 
         construct = self.stanlib.bs_rng_construct
         construct.restype = ctypes.c_void_p
@@ -827,3 +2344,5 @@ class StanRNG:
         """
         if hasattr(self, "ptr") and hasattr(self, "_destruct"):
             self._destruct(self.ptr)
+        if hasattr(self, "_library"):
+            self._library.release()
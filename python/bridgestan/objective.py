@@ -0,0 +1,176 @@
+from collections import OrderedDict, namedtuple
+from typing import TYPE_CHECKING, Dict, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+if TYPE_CHECKING:
+    from .model import StanModel
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class StanObjective:
+    """
+    A memoizing wrapper around the log density of a model and its
+    derivatives, with callables in the form expected by
+    :func:`scipy.optimize.minimize`.
+
+    Optimizers typically evaluate the objective and its gradient
+    separately at the same point. Here, evaluating either computes both,
+    and the results for the most recently used points are kept in a small
+    least recently used cache keyed on the bytes of the parameters, so the
+    other is returned without calling the model again.
+
+    For example::
+
+        obj = model.objective()
+        scipy.optimize.minimize(obj.fun, x0, jac=obj.jac, hessp=obj.hessp)
+        print(obj.cache_info())
+    """
+
+    def __init__(
+        self,
+        model: "StanModel",
+        *,
+        propto: bool,
+        jacobian: bool,
+        cache_size: int,
+        negate: bool,
+    ) -> None:
+        """
+        Construct an objective for a model.
+        This should not be called directly. Instead, use
+        :meth:`StanModel.objective`.
+        """
+        if cache_size < 1:
+            raise ValueError("Error: cache_size must be at least 1")
+        self.model = model
+        self.propto = propto
+        self.jacobian = jacobian
+        self.cache_size = cache_size
+        self.sign = -1.0 if negate else 1.0
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[bytes, Dict[str, object]]" = OrderedDict()
+
+    def _entry(self, theta_unc: npt.ArrayLike, hessian: bool) -> Dict[str, object]:
+        theta = np.ascontiguousarray(theta_unc, dtype=np.float64)
+        key = theta.tobytes()
+        entry = self._cache.get(key)
+        if entry is not None and (not hessian or "hess" in entry):
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        if hessian:
+            lp, grad, hess = self.model.log_density_hessian(
+                theta, propto=self.propto, jacobian=self.jacobian
+            )
+            entry = {"lp": lp, "grad": grad, "hess": hess}
+        else:
+            lp, grad = self.model.log_density_gradient(
+                theta, propto=self.propto, jacobian=self.jacobian
+            )
+            entry = {"lp": lp, "grad": grad}
+        for name in entry:
+            entry[name] = self.sign * entry[name]
+
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    def fun(self, theta_unc: npt.ArrayLike) -> float:
+        """
+        Return the objective, which is the log density (negated if
+        ``negate`` was set) of the specified unconstrained parameters.
+
+        :param theta_unc: Unconstrained parameter array.
+        :return: The value of the objective.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        return self._entry(theta_unc, False)["lp"]  # type: ignore
+
+    def jac(self, theta_unc: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        """
+        Return the gradient of the objective.
+
+        :param theta_unc: Unconstrained parameter array.
+        :return: The gradient of the objective.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        return self._entry(theta_unc, False)["grad"].copy()  # type: ignore
+
+    def fun_and_jac(
+        self, theta_unc: npt.ArrayLike
+    ) -> Tuple[float, npt.NDArray[np.float64]]:
+        """
+        Return a tuple of the objective and its gradient, as expected by
+        :func:`scipy.optimize.minimize` with ``jac=True``.
+
+        :param theta_unc: Unconstrained parameter array.
+        :return: A tuple consisting of the objective and its gradient.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        entry = self._entry(theta_unc, False)
+        return entry["lp"], entry["grad"].copy()  # type: ignore
+
+    def hess(self, theta_unc: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        """
+        Return the Hessian of the objective. The Hessian is cached along
+        with the value and gradient, and is then also used by :meth:`hessp`
+        at the same point.
+
+        :param theta_unc: Unconstrained parameter array.
+        :return: The Hessian of the objective.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        return self._entry(theta_unc, True)["hess"].copy()  # type: ignore
+
+    def hessp(
+        self, theta_unc: npt.ArrayLike, p: npt.ArrayLike
+    ) -> npt.NDArray[np.float64]:
+        """
+        Return the product of the Hessian of the objective with ``p``. This
+        uses :meth:`StanModel.log_density_hessian_vector_product`, which does
+        not form the full Hessian, unless the Hessian at ``theta_unc`` is
+        already cached by :meth:`hess`, which counts as a cache hit.
+        Products are not cached, as each one is for a different ``p``, and
+        computing one does not count as a cache miss.
+
+        :param theta_unc: Unconstrained parameter array.
+        :param p: Vector to multiply by the Hessian.
+        :return: The Hessian-vector product.
+        :raises RuntimeError: If the C++ Stan model throws an exception.
+        """
+        theta = np.ascontiguousarray(theta_unc, dtype=np.float64)
+        entry = self._cache.get(theta.tobytes())
+        if entry is not None and "hess" in entry:
+            self.hits += 1
+            self._cache.move_to_end(theta.tobytes())
+            return entry["hess"] @ p  # type: ignore
+        # products are not cached, so computing one is not a cache miss
+        _, hvp = self.model.log_density_hessian_vector_product(
+            theta,
+            np.asarray(p, dtype=np.float64),
+            propto=self.propto,
+            jacobian=self.jacobian,
+        )
+        return self.sign * hvp
+
+    def cache_info(self) -> CacheInfo:
+        """
+        Return the number of cache hits and misses and the maximum and
+        current size of the cache, in the style of
+        :func:`functools.lru_cache`.
+        """
+        return CacheInfo(self.hits, self.misses, self.cache_size, len(self._cache))
+
+    def cache_clear(self) -> None:
+        """Clear the cache and its statistics."""
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
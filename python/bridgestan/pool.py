@@ -0,0 +1,482 @@
+import math
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from os import PathLike
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from .model import StanModel
+
+Errors = List[Optional[str]]
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+
+def _layout(
+    model: StanModel, method: str, kwargs: Mapping[str, Any]
+) -> Tuple[int, int]:
+    """Return the number of input and output columns of a bulk method."""
+    D = model.param_unc_num()
+    if method == "log_density":
+        return D, 1
+    if method == "log_density_gradient":
+        return D, 1 + D
+    if method == "log_density_hessian":
+        return D, 1 + D + D * D
+    if method == "log_density_hessian_vector_product":
+        return 2 * D, 1 + D
+    if method == "param_constrain":
+        return D, model.param_num(**kwargs)
+    if method == "param_unconstrain":
+        return model.param_num(), D
+    raise ValueError(f"Unknown method {method}")
+
+
+def _evaluate(
+    model: StanModel,
+    rng: Any,
+    method: str,
+    kwargs: Dict[str, Any],
+    x: npt.NDArray[np.float64],
+    out: npt.NDArray[np.float64],
+) -> None:
+    """Evaluate one row, writing the results into ``out`` in place."""
+    D = model.param_unc_num()
+    if method == "log_density":
+        out[0] = model.log_density(x, **kwargs)
+    elif method == "log_density_gradient":
+        out[0], _ = model.log_density_gradient(x, out=out[1:], **kwargs)
+    elif method == "log_density_hessian":
+        out[0], _, _ = model.log_density_hessian(
+            x,
+            out_grad=out[1 : 1 + D],
+            out_hess=out[1 + D :].reshape(D, D),
+            **kwargs,
+        )
+    elif method == "log_density_hessian_vector_product":
+        out[0], _ = model.log_density_hessian_vector_product(
+            x[:D], x[D:], out=out[1:], **kwargs
+        )
+    elif method == "param_constrain":
+        model.param_constrain(x, out=out, rng=rng, **kwargs)
+    elif method == "param_unconstrain":
+        model.param_unconstrain(x, out=out)
+
+
+def _worker(
+    conn: Any,
+    model: StanModel,
+    in_name: str,
+    out_name: str,
+    rng_seed: int,
+) -> None:
+    in_shm = shared_memory.SharedMemory(in_name)
+    out_shm = shared_memory.SharedMemory(out_name)
+    rng = model.new_rng(rng_seed)
+    try:
+        while True:
+            task = conn.recv()
+            if task is None:
+                break
+            method, kwargs, n, in_cols, out_cols = task
+            xs = np.ndarray((n, in_cols), buffer=in_shm.buf)
+            outs = np.ndarray((n, out_cols), buffer=out_shm.buf)
+            errors = {}
+            for i in range(n):
+                try:
+                    _evaluate(model, rng, method, kwargs, xs[i], outs[i])
+                except Exception as e:
+                    outs[i] = np.nan
+                    errors[i] = str(e)
+            del xs, outs
+            conn.send(errors)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        in_shm.close()
+        out_shm.close()
+
+
+class ModelPool:
+    """
+    A pool of worker processes which each hold an instance of the same
+    model, for evaluating many parameter values in parallel.
+
+    This is useful for models compiled without ``STAN_THREADS``, and for
+    models whose ``transformed data`` or ``print`` statements are not
+    thread-friendly. The model is constructed once in the parent process,
+    and each worker constructs its own instance from a pickled copy. The
+    data is not shared copy-on-write between the processes: every worker
+    loads the library and reads the data itself, so starting the pool
+    costs about one model construction per worker, as well as starting a
+    Python interpreter per worker.
+
+    Workers are started with the ``forkserver`` start method where it is
+    available and with ``spawn`` otherwise, since forking a process which
+    has loaded a model is unsafe on macOS and can deadlock if the model
+    has started threads (for example, TBB worker threads). Another start
+    method can be chosen with ``start_method``.
+
+    Parameter values and results are exchanged through a pair of
+    :mod:`multiprocessing.shared_memory` buffers per worker rather than
+    being pickled. These are not ring buffers: each worker is given one
+    chunk of rows at a time, which fits in its buffers, and is given the
+    next chunk once it has replied.
+
+    Every bulk method evaluates each row independently and returns, along
+    with its results, a list with the error message of each failed row
+    (or ``None`` for rows which succeeded). The results of failed rows
+    are ``NaN``.
+
+    The pool should be closed with :meth:`close`, or used as a context
+    manager, to stop the workers and free the shared memory. If a worker
+    exits, or a call is interrupted, the pool is closed, since the results
+    of the other workers can no longer be matched to their rows, and later
+    calls raise :class:`RuntimeError`.
+    """
+
+    def __init__(
+        self,
+        model_lib: Union[str, PathLike, StanModel],
+        data: Union[str, PathLike, None, Mapping[str, Any]] = None,
+        *,
+        workers: Optional[int] = None,
+        seed: int = 1234,
+        rng_seed: Optional[int] = None,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        start_method: Optional[str] = None,
+        **kwargs: Any,
+    ) -> None:
+        """
+        Construct a pool of workers.
+
+        :param model_lib: A system path to a compiled shared object or a
+            ``.stan`` file, as for :class:`StanModel`, or a :class:`StanModel`
+            to share with the workers.
+        :param data: Data for the model, as for :class:`StanModel`.
+        :param workers: The number of worker processes. If ``None``, the
+            number of CPUs is used.
+        :param seed: A pseudo random number generator seed, used for RNG
+            functions in the ``transformed data`` block.
+        :param rng_seed: The seed of the PRNGs used by
+            :meth:`param_constrain_many` to generate quantities. Worker
+            ``w`` uses ``rng_seed + w``. If ``None``, ``seed`` is used.
+            Since chunks are given to whichever worker is idle, generated
+            quantities are not reproducible across calls.
+        :param buffer_size: The size in bytes of each shared memory buffer.
+            It is increased if needed to hold at least one row of the
+            largest result.
+        :param start_method: The :mod:`multiprocessing` start method used
+            to start the workers. If ``None``, ``forkserver`` is used where
+            it is available and ``spawn`` otherwise.
+        :param kwargs: Other arguments to pass to :class:`StanModel`.
+        :raises ValueError: If ``workers`` is less than 1 or ``start_method``
+            is not a start method of this platform.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("Error: workers must be at least 1")
+        if isinstance(model_lib, StanModel):
+            self.model = model_lib
+        else:
+            self.model = StanModel(model_lib, data, seed=seed, **kwargs)
+        if rng_seed is None:
+            rng_seed = seed
+
+        D = self.model.param_unc_num()
+        widest = max(
+            1 + D + D * D, 2 * D, self.model.param_num(include_tp=True, include_gq=True)
+        )
+        self.buffer_size = max(buffer_size, 8 * widest)
+
+        if start_method is None:
+            methods = multiprocessing.get_all_start_methods()
+            start_method = "forkserver" if "forkserver" in methods else "spawn"
+        ctx = multiprocessing.get_context(start_method)
+
+        self._shms: List[shared_memory.SharedMemory] = []
+        self._conns: List[Any] = []
+        self._processes: List[Any] = []
+        try:
+            for w in range(workers):
+                in_shm = shared_memory.SharedMemory(create=True, size=self.buffer_size)
+                self._shms.append(in_shm)
+                out_shm = shared_memory.SharedMemory(create=True, size=self.buffer_size)
+                self._shms.append(out_shm)
+                conn, child_conn = ctx.Pipe()
+                process = ctx.Process(
+                    target=_worker,
+                    args=(
+                        child_conn,
+                        self.model,
+                        in_shm.name,
+                        out_shm.name,
+                        rng_seed + w,
+                    ),
+                    daemon=True,
+                )
+                process.start()
+                child_conn.close()
+                self._conns.append(conn)
+                self._processes.append(process)
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def workers(self) -> int:
+        """The number of worker processes."""
+        return len(self._processes)
+
+    def close(self) -> None:
+        """Stop the workers and free the shared memory."""
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self._conns, self._processes, self._shms = [], [], []
+
+    def __enter__(self) -> "ModelPool":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        if hasattr(self, "_shms"):
+            self.close()
+
+    def _run(
+        self,
+        method: str,
+        x: npt.NDArray[np.float64],
+        kwargs: Dict[str, Any],
+    ) -> Tuple[npt.NDArray[np.float64], Errors]:
+        if not self._processes:
+            raise RuntimeError("Error: the pool is closed")
+        in_cols, out_cols = _layout(self.model, method, kwargs)
+        x = np.ascontiguousarray(x, dtype=np.float64)
+        if x.ndim != 2 or x.shape[1] != in_cols:
+            raise ValueError(
+                f"Error: parameters must have shape (N, {in_cols}), got {x.shape}"
+            )
+        n = x.shape[0]
+        out = np.empty((n, out_cols))
+        errors: Errors = [None] * n
+
+        rows = self.buffer_size // (8 * max(in_cols, out_cols, 1))
+        chunk = max(1, min(rows, math.ceil(n / self.workers)))
+        chunks = [(start, min(start + chunk, n)) for start in range(0, n, chunk)]
+        chunks.reverse()
+
+        running: Dict[Any, Tuple[int, int, int]] = {}
+
+        def submit(w: int) -> None:
+            start, end = chunks.pop()
+            size = end - start
+            xs = np.ndarray((size, in_cols), buffer=self._shms[2 * w].buf)
+            xs[...] = x[start:end]
+            del xs
+            try:
+                self._conns[w].send((method, kwargs, size, in_cols, out_cols))
+            except OSError:
+                raise RuntimeError(f"Error: worker {w} of the pool exited") from None
+            running[self._conns[w]] = (w, start, end)
+
+        try:
+            for w in range(self.workers):
+                if chunks:
+                    submit(w)
+            while running:
+                for conn in wait(list(running)):
+                    w, start, end = running.pop(conn)
+                    try:
+                        chunk_errors = conn.recv()
+                    except (EOFError, OSError):
+                        raise RuntimeError(
+                            f"Error: worker {w} of the pool exited"
+                        ) from None
+                    outs = np.ndarray(
+                        (end - start, out_cols), buffer=self._shms[2 * w + 1].buf
+                    )
+                    out[start:end] = outs
+                    del outs
+                    for i, message in chunk_errors.items():
+                        errors[start + i] = message
+                    if chunks:
+                        submit(w)
+        except BaseException:
+            # the replies of the other workers are still in their pipes,
+            # and would be read as the results of the next call
+            self.close()
+            raise
+        return out, errors
+
+    def log_density_many(
+        self,
+        theta_unc: npt.NDArray[np.float64],
+        *,
+        propto: bool = True,
+        jacobian: bool = True,
+    ) -> Tuple[npt.NDArray[np.float64], Errors]:
+        """
+        Return the log density of each row of unconstrained parameters.
+        See :meth:`StanModel.log_density`.
+
+        :param theta_unc: Unconstrained parameter array of shape ``(N, D)``.
+        :param propto: ``True`` if constant terms should be dropped from the log density.
+        :param jacobian: ``True`` if change-of-variables terms for
+            constrained parameters should be included in the log density.
+        :return: A tuple of the log densities, of shape ``(N,)``, and the
+            error message of each row.
+        :raises ValueError: If ``theta_unc`` is not of shape ``(N, D)``.
+        """
+        out, errors = self._run(
+            "log_density", theta_unc, {"propto": propto, "jacobian": jacobian}
+        )
+        return out[:, 0], errors
+
+    def log_density_gradient_many(
+        self,
+        theta_unc: npt.NDArray[np.float64],
+        *,
+        propto: bool = True,
+        jacobian: bool = True,
+    ) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], Errors]:
+        """
+        Return the log density and gradient of each row of unconstrained
+        parameters. See :meth:`StanModel.log_density_gradient`.
+
+        :param theta_unc: Unconstrained parameter array of shape ``(N, D)``.
+        :param propto: ``True`` if constant terms should be dropped from the log density.
+        :param jacobian: ``True`` if change-of-variables terms for
+            constrained parameters should be included in the log density.
+        :return: A tuple of the log densities, of shape ``(N,)``, the
+            gradients, of shape ``(N, D)``, and the error message of each row.
+        :raises ValueError: If ``theta_unc`` is not of shape ``(N, D)``.
+        """
+        out, errors = self._run(
+            "log_density_gradient",
+            theta_unc,
+            {"propto": propto, "jacobian": jacobian},
+        )
+        return out[:, 0], out[:, 1:], errors
+
+    def log_density_hessian_many(
+        self,
+        theta_unc: npt.NDArray[np.float64],
+        *,
+        propto: bool = True,
+        jacobian: bool = True,
+    ) -> Tuple[
+        npt.NDArray[np.float64],
+        npt.NDArray[np.float64],
+        npt.NDArray[np.float64],
+        Errors,
+    ]:
+        """
+        Return the log density, gradient and Hessian of each row of
+        unconstrained parameters. See :meth:`StanModel.log_density_hessian`.
+
+        :param theta_unc: Unconstrained parameter array of shape ``(N, D)``.
+        :param propto: ``True`` if constant terms should be dropped from the log density.
+        :param jacobian: ``True`` if change-of-variables terms for
+            constrained parameters should be included in the log density.
+        :return: A tuple of the log densities, of shape ``(N,)``, the
+            gradients, of shape ``(N, D)``, the Hessians, of shape
+            ``(N, D, D)``, and the error message of each row.
+        :raises ValueError: If ``theta_unc`` is not of shape ``(N, D)``.
+        """
+        D = self.model.param_unc_num()
+        out, errors = self._run(
+            "log_density_hessian",
+            theta_unc,
+            {"propto": propto, "jacobian": jacobian},
+        )
+        hess = out[:, 1 + D :].reshape(-1, D, D)
+        return out[:, 0], out[:, 1 : 1 + D], hess, errors
+
+    def log_density_hessian_vector_product_many(
+        self,
+        theta_unc: npt.NDArray[np.float64],
+        v: npt.NDArray[np.float64],
+        *,
+        propto: bool = True,
+        jacobian: bool = True,
+    ) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], Errors]:
+        """
+        Return the log density and the product of the Hessian with the
+        corresponding row of ``v`` for each row of unconstrained parameters.
+        See :meth:`StanModel.log_density_hessian_vector_product`.
+
+        :param theta_unc: Unconstrained parameter array of shape ``(N, D)``.
+        :param v: Vectors to multiply by the Hessians, of shape ``(N, D)``.
+        :param propto: ``True`` if constant terms should be dropped from the log density.
+        :param jacobian: ``True`` if change-of-variables terms for
+            constrained parameters should be included in the log density.
+        :return: A tuple of the log densities, of shape ``(N,)``, the
+            products, of shape ``(N, D)``, and the error message of each row.
+        :raises ValueError: If ``theta_unc`` or ``v`` is not of shape ``(N, D)``.
+        """
+        if np.shape(theta_unc) != np.shape(v):
+            raise ValueError("Error: theta_unc and v must have the same shape")
+        out, errors = self._run(
+            "log_density_hessian_vector_product",
+            np.hstack([theta_unc, v]),
+            {"propto": propto, "jacobian": jacobian},
+        )
+        return out[:, 0], out[:, 1:], errors
+
+    def param_constrain_many(
+        self,
+        theta_unc: npt.NDArray[np.float64],
+        *,
+        include_tp: bool = False,
+        include_gq: bool = False,
+    ) -> Tuple[npt.NDArray[np.float64], Errors]:
+        """
+        Return the constrained parameters of each row of unconstrained
+        parameters. See :meth:`StanModel.param_constrain`. Generated
+        quantities use the PRNG of the worker which evaluates the row.
+
+        :param theta_unc: Unconstrained parameter array of shape ``(N, D)``.
+        :param include_tp: ``True`` to include transformed parameters.
+        :param include_gq: ``True`` to include generated quantities.
+        :return: A tuple of the constrained parameters, of shape ``(N, P)``,
+            and the error message of each row.
+        :raises ValueError: If ``theta_unc`` is not of shape ``(N, D)``.
+        """
+        return self._run(
+            "param_constrain",
+            theta_unc,
+            {"include_tp": include_tp, "include_gq": include_gq},
+        )
+
+    def param_unconstrain_many(
+        self, theta: npt.NDArray[np.float64]
+    ) -> Tuple[npt.NDArray[np.float64], Errors]:
+        """
+        Return the unconstrained parameters of each row of constrained
+        parameters. See :meth:`StanModel.param_unconstrain`.
+
+        :param theta: Constrained parameter array of shape ``(N, P)``.
+        :return: A tuple of the unconstrained parameters, of shape
+            ``(N, D)``, and the error message of each row.
+        :raises ValueError: If ``theta`` is not of shape ``(N, P)``.
+        """
+        return self._run("param_unconstrain", theta, {})
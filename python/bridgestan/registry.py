@@ -0,0 +1,264 @@
+"""
+A process-wide registry of the shared libraries of compiled models.
+
+Each library is loaded once, however many models use it, and the
+function signatures declared for it are cached so they are only declared
+once. The registry counts the models (and random number generators) using
+each library. A library which is no longer used is kept loaded in case it
+is needed again, up to a budget set with :func:`set_library_budget`, after
+which the least recently used idle libraries are unloaded.
+
+If a library is rebuilt in place while it is loaded, the next model which
+uses it loads the new build from a versioned copy, because loading the
+same path again would return the image which is already loaded. A library
+which has been unloaded is loaded from its own path again, unless the
+operating system still has it mapped. Models
+created before the rebuild keep using the old image, which is unloaded
+once they are all gone.
+"""
+
+import atexit
+import ctypes
+import os
+import platform
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import dllist
+
+if platform.system() == "Windows":
+    from _ctypes import FreeLibrary as _dlclose
+else:
+    from _ctypes import dlclose as _dlclose
+
+DEFAULT_MAX_IDLE = 16
+
+_Stat = Tuple[int, int, int]
+
+
+def _stat(path: str) -> _Stat:
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class SharedLibrary:
+    """
+    A loaded shared library of a compiled model.
+    This should not be constructed directly; libraries are returned by
+    :func:`acquire_library`.
+    """
+
+    def __init__(self, path: str, load_path: str, stat: _Stat) -> None:
+        #: The path of the library, as given to :class:`StanModel`.
+        self.path = path
+        #: The path which was loaded, which is a versioned copy of
+        #: ``path`` if it was rebuilt while loaded.
+        self.load_path = load_path
+        self.stat = stat
+        self.size = stat[1]
+        self.cdll: Optional[ctypes.CDLL] = ctypes.CDLL(load_path)
+        self.refs = 0
+        self.stale = False
+        self._cache: Dict[Any, Any] = {}
+
+    def cached(self, key: Any, factory: Callable[[ctypes.CDLL], Any]) -> Any:
+        """
+        Return the value cached under ``key``, such as a table of declared
+        functions, calling ``factory`` with the library to create it the
+        first time.
+        """
+        with _lock:
+            if key not in self._cache:
+                self._cache[key] = factory(self.cdll)
+            return self._cache[key]
+
+    def retain(self) -> "SharedLibrary":
+        """Add a reference to this library, which must already have one."""
+        with _lock:
+            self.refs += 1
+        return self
+
+    def release(self) -> None:
+        """
+        Remove a reference to this library. Nothing loaded from the library
+        may be used by the caller afterwards.
+        """
+        with _lock:
+            self.refs -= 1
+            if self.refs == 0:
+                if self.stale:
+                    self._unload()
+                else:
+                    _idle[self.path] = self
+                    _evict()
+
+    def _unload(self) -> None:
+        # called with the lock held
+        if self.cdll is None:
+            return
+        handle = self.cdll._handle
+        self.cdll = None
+        self._cache.clear()
+        _dlclose(handle)
+        if self.load_path == self.path:
+            _open_paths.discard(self.path)
+        else:
+            try:
+                os.unlink(self.load_path)
+            except OSError:  # still in use on Windows
+                pass
+
+    def __repr__(self) -> str:
+        state = "unloaded" if self.cdll is None else f"refs={self.refs}"
+        return f"SharedLibrary({self.load_path!r}, {state})"
+
+
+_lock = threading.RLock()
+# the current version of each library, by path
+_current: Dict[str, SharedLibrary] = {}
+# libraries with no references, least recently used first
+_idle: "OrderedDict[str, SharedLibrary]" = OrderedDict()
+# paths which have been loaded by the registry
+_loaded_paths = set()
+# paths which were loaded directly and are still open, and so cannot be
+# loaded again
+_open_paths = set()
+_versions: Dict[str, int] = {}
+_copies_dir: Optional[str] = None
+_max_idle: Optional[int] = DEFAULT_MAX_IDLE
+_max_idle_bytes: Optional[int] = None
+
+
+def _versioned_copy(path: str) -> str:
+    global _copies_dir
+    if _copies_dir is None:
+        _copies_dir = tempfile.mkdtemp(prefix="bridgestan-libs-")
+        atexit.register(shutil.rmtree, _copies_dir, ignore_errors=True)
+    version = _versions.get(path, 0) + 1
+    _versions[path] = version
+    p = Path(path)
+    copy = os.path.join(_copies_dir, f"{p.stem}.{version}{p.suffix}")
+    shutil.copy2(path, copy)
+    return copy
+
+
+def _still_loaded(path: str) -> bool:
+    # called with the lock held
+    if path in _open_paths:
+        return True
+    if path not in _loaded_paths:
+        return False
+    # closed, but the operating system may not have unloaded it, for
+    # example if it has unique symbols or thread-local variables in use
+    return not hasattr(dllist, "dllist") or path in dllist.dllist()
+
+
+def _evict() -> None:
+    # called with the lock held
+    def over_budget() -> bool:
+        if _max_idle is not None and len(_idle) > _max_idle:
+            return True
+        if _max_idle_bytes is not None:
+            return sum(lib.size for lib in _idle.values()) > _max_idle_bytes
+        return False
+
+    while _idle and over_budget():
+        _, lib = _idle.popitem(last=False)
+        del _current[lib.path]
+        lib._unload()
+
+
+def is_registered(path: str) -> bool:
+    """Return whether the library at ``path`` has been loaded by the registry."""
+    with _lock:
+        return path in _loaded_paths
+
+
+def was_loaded_elsewhere(path: str) -> bool:
+    """
+    Return whether the library at ``path`` was loaded into this process
+    other than by the registry, in which case loading it again may return
+    an outdated image.
+    """
+    with _lock:
+        if path in _loaded_paths or not hasattr(dllist, "dllist"):
+            return False
+    return path in dllist.dllist()
+
+
+def acquire_library(path: str) -> SharedLibrary:
+    """
+    Return the loaded library at ``path``, loading it if needed, with a
+    new reference which must be released with :meth:`SharedLibrary.release`.
+
+    :param path: The absolute, resolved path to the library.
+    :return: The library.
+    """
+    stat = _stat(path)
+    with _lock:
+        lib = _current.get(path)
+        if lib is not None and lib.stat != stat:
+            # rebuilt since it was loaded
+            del _current[path]
+            _idle.pop(path, None)
+            lib.stale = True
+            if lib.refs == 0:
+                lib._unload()
+            lib = None
+        if lib is None:
+            if _still_loaded(path):
+                load_path = _versioned_copy(path)
+            else:
+                load_path = path
+            lib = SharedLibrary(path, load_path, stat)
+            _loaded_paths.add(path)
+            if load_path == path:
+                _open_paths.add(path)
+            _current[path] = lib
+        _idle.pop(path, None)
+        lib.refs += 1
+        return lib
+
+
+def set_library_budget(
+    max_idle: Optional[int] = DEFAULT_MAX_IDLE, max_idle_bytes: Optional[int] = None
+) -> None:
+    """
+    Set how many shared libraries which are not used by any model are kept
+    loaded. When either limit is exceeded, the least recently used idle
+    libraries are unloaded.
+
+    Note that the operating system may keep an unloaded library in
+    memory, for example if it contains thread-local variables which are
+    still in use.
+
+    :param max_idle: The maximum number of idle libraries, or ``None`` for
+        no limit.
+    :param max_idle_bytes: The maximum total size of the files of the idle
+        libraries, or ``None`` for no limit.
+    """
+    global _max_idle, _max_idle_bytes
+    with _lock:
+        _max_idle = max_idle
+        _max_idle_bytes = max_idle_bytes
+        _evict()
+
+
+def unload_idle_libraries() -> None:
+    """Unload every shared library which is not used by any model."""
+    with _lock:
+        while _idle:
+            _, lib = _idle.popitem(last=False)
+            del _current[lib.path]
+            lib._unload()
+
+
+def loaded_libraries() -> List[SharedLibrary]:
+    """Return the shared libraries which are currently loaded."""
+    with _lock:
+        libs = list(_current.values())
+        return libs
@@ -0,0 +1,153 @@
+"""
+Sparse Hessians, computed from fewer Hessian-vector products than there
+are parameters by grouping the columns which have no nonzero rows in
+common (Curtis, Powell and Reid, 1974).
+
+These functions require :mod:`scipy`, which is imported when they are
+first used.
+"""
+
+from typing import TYPE_CHECKING, Any, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+if TYPE_CHECKING:
+    import scipy.sparse
+
+    from .model import StanModel
+
+
+# the number of columns of the Hessian probed at once by hessian_sparsity
+_DETECT_BLOCK = 256
+
+
+def _scipy_sparse() -> Any:
+    try:
+        import scipy.sparse
+    except ImportError as e:
+        raise ImportError("Sparse Hessians require scipy to be installed") from e
+    return scipy.sparse
+
+
+def symmetric_pattern(pattern: Any, dims: int) -> "scipy.sparse.csr_matrix":
+    """
+    Convert a sparsity pattern, dense or sparse, to a symmetric boolean
+    CSR matrix of its nonzero entries.
+
+    :raises ValueError: If ``pattern`` is not of shape ``(dims, dims)``.
+    """
+    sp = _scipy_sparse()
+    pattern = sp.csr_matrix(pattern, dtype=bool)
+    pattern.eliminate_zeros()
+    if pattern.shape != (dims, dims):
+        raise ValueError(
+            f"Error: pattern must have shape ({dims}, {dims}), got {pattern.shape}"
+        )
+    return (pattern + pattern.T).astype(bool).tocsr()
+
+
+def hessian_sparsity(
+    model: "StanModel",
+    theta_unc: npt.NDArray[np.float64],
+    *,
+    propto: bool,
+    jacobian: bool,
+) -> "scipy.sparse.csr_matrix":
+    """
+    Detect the sparsity pattern of the Hessian of the log density of a
+    model, as the entries which are nonzero at ``theta_unc`` or at a
+    random point near it. The pattern is made symmetric.
+
+    This takes one Hessian-vector product per parameter at each point,
+    but only stores a block of the columns of the Hessian at a time.
+
+    :return: A boolean CSR matrix of shape ``(D, D)``.
+    """
+    sp = _scipy_sparse()
+    dims = model.param_unc_num()
+    theta_unc = np.asarray(theta_unc, dtype=np.float64)
+    rng = np.random.default_rng(dims)
+    points = [theta_unc, theta_unc + rng.uniform(-0.5, 0.5, size=dims)]
+
+    rows, cols = [], []
+    # the columns of the identity, a block at a time to bound the memory
+    for start in range(0, dims, _DETECT_BLOCK):
+        block = np.eye(dims, min(_DETECT_BLOCK, dims - start), -start)
+        nonzero = np.zeros(block.shape, dtype=bool)
+        for point in points:
+            _, products = model.log_density_hessian_matrix_product(
+                point, block, propto=propto, jacobian=jacobian
+            )
+            nonzero |= products != 0
+        r, c = np.nonzero(nonzero)
+        rows.append(r)
+        cols.append(c + start)
+
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.intp)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.intp)
+    pattern = sp.csr_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(dims, dims)
+    )
+    return symmetric_pattern(pattern, dims)
+
+
+def color_columns(pattern: "scipy.sparse.csr_matrix") -> npt.NDArray[np.intp]:
+    """
+    Assign a color to each column of a sparsity pattern so that no two
+    columns of the same color have a nonzero in the same row, using a
+    greedy coloring in order of decreasing number of nonzeros.
+
+    :return: The color of each column, numbered from 0.
+    """
+    sp = _scipy_sparse()
+    csc = sp.csc_matrix(pattern, dtype=bool)
+    csr = csc.tocsr()
+    dims = csc.shape[1]
+    colors = np.full(dims, -1, dtype=np.intp)
+    # the colors already used by the columns with a nonzero in each row
+    forbidden = np.full(dims + 1, -1, dtype=np.intp)
+    for j in np.argsort(-np.diff(csc.indptr), kind="stable"):
+        for r in csc.indices[csc.indptr[j] : csc.indptr[j + 1]]:
+            neighbors = csr.indices[csr.indptr[r] : csr.indptr[r + 1]]
+            used = colors[neighbors]
+            forbidden[used[used >= 0]] = j
+        color = 0
+        while forbidden[color] == j:
+            color += 1
+        colors[j] = color
+    return colors
+
+
+def compressed_hessian(
+    model: "StanModel",
+    theta_unc: npt.NDArray[np.float64],
+    pattern: "scipy.sparse.csr_matrix",
+    colors: npt.NDArray[np.intp],
+    *,
+    propto: bool,
+    jacobian: bool,
+) -> Tuple[float, npt.NDArray[np.float64], "scipy.sparse.csr_matrix"]:
+    """
+    Compute the Hessian with the sparsity ``pattern`` from the product of
+    the Hessian with one vector per color of the columns, along with the
+    log density and gradient, in one call.
+
+    :return: A tuple of the log density, gradient, and the Hessian as a
+        CSR matrix.
+    """
+    sp = _scipy_sparse()
+    dims = model.param_unc_num()
+    n_colors = int(colors.max()) + 1 if dims else 0
+    seeds = np.zeros((dims, n_colors))
+    seeds[np.arange(dims), colors] = 1.0
+    grad = np.zeros(dims)
+    lp, products = model.log_density_hessian_matrix_product(
+        theta_unc, seeds, propto=propto, jacobian=jacobian, out_grad=grad
+    )
+
+    coo = pattern.tocoo()
+    values = products[coo.row, colors[coo.col]]
+    hess = sp.csr_matrix((values, (coo.row, coo.col)), shape=(dims, dims))
+    # finite differences are not exactly symmetric
+    return lp, grad, ((hess + hess.T) * 0.5).tocsr()
@@ -1,3 +1,7 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pytest
@@ -43,6 +47,129 @@ def test_compile_user_header():
     assert lib.exists()
 
 
+def test_compile_cache(tmp_path, monkeypatch):
+    stanfile = STAN_FOLDER / "multi" / "multi.stan"
+    res = bs.compile_model(stanfile, cache_dir=tmp_path)
+    assert res.parent.parent == tmp_path
+    assert res.name == bs.compile.generate_so_name(stanfile).name
+    # a hit does not run make, and returns the same library
+    with monkeypatch.context() as m:
+        m.setattr(bs.compile, "MAKE", "not-make")
+        assert bs.compile_model(stanfile, cache_dir=tmp_path) == res
+
+    res2 = bs.compile_model(stanfile, stanc_args=["--O1"], cache_dir=tmp_path)
+    assert res2 != res
+    assert res2.name == res.name
+
+    model = bs.StanModel(
+        stanfile, data=STAN_FOLDER / "multi" / "multi.data.json", cache_dir=tmp_path
+    )
+    assert model.lib_path == str(res)
+
+
+def test_cache_key(tmp_path):
+    bs_path = bs.compile.get_bridgestan_path()
+    (tmp_path / "inc.stan").write_text("real y;")
+    stanfile = tmp_path / "model.stan"
+    stanfile.write_text("parameters {\n  #include inc.stan\n}")
+
+    key = bs.cache.cache_key(stanfile, bs_path, [], [])
+    assert key == bs.cache.cache_key(stanfile, bs_path, [], [])
+    assert key != bs.cache.cache_key(stanfile, bs_path, ["--O1"], [])
+    assert key != bs.cache.cache_key(stanfile, bs_path, [], ["STAN_THREADS=true"])
+    assert key != bs.cache.cache_key(stanfile, bs_path, [], ["CXX=clang++"])
+
+    (tmp_path / "inc.stan").write_text("real z;")
+    key2 = bs.cache.cache_key(stanfile, bs_path, [], [])
+    assert key2 != key
+
+    stanfile.write_text("parameters {\n  #include inc.stan\n} // changed")
+    assert bs.cache.cache_key(stanfile, bs_path, [], []) != key2
+
+
+def test_cache_evict(tmp_path):
+    for i, name in enumerate(["a", "b", "c"]):
+        entry = tmp_path / name
+        entry.mkdir()
+        (entry / "lib.so").write_bytes(b"0" * 100)
+        os.utime(entry, (i, i))
+
+    bs.cache.evict(tmp_path, 250, keep=tmp_path / "a")
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == ["a", "c"]
+
+    with bs.cache.file_lock(tmp_path / ".c.lock"):
+        bs.cache.evict(tmp_path, 0)
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == ["c"]
+
+
+def test_cache_include_paths():
+    assert bs.cache.merge_include_paths(["--O1"], [".", "/models"]) == [
+        "--include-paths=.,/models",
+        "--O1",
+    ]
+    assert bs.cache.merge_include_paths(
+        ["--include-paths=a,b", "--O1"], [".", "/models"]
+    ) == ["--include-paths=.,/models,a,b", "--O1"]
+
+
+def test_compile_models():
+    stanfiles = [STAN_FOLDER / name / f"{name}.stan" for name in ["multi", "simple"]]
+    lines = []
+    libs = bs.compile_models(
+        stanfiles,
+        make_args=["STAN_THREADS=true"],
+        progress=lambda f, line: lines.append((f, line)),
+        jobs=2,
+    )
+    assert [bs.compile.generate_so_name(f) for f in stanfiles] == libs
+    assert all(f in stanfiles for f, _ in lines)
+
+    future = bs.compile_model_async(stanfiles[0], make_args=["STAN_THREADS=true"])
+    assert future.result() == libs[0]
+
+    with pytest.raises(RuntimeError, match=r"Syntax error"):
+        bs.compile_models(
+            stanfiles + [STAN_FOLDER / "syntax_error" / "syntax_error.stan"]
+        )
+
+
+def test_compile_model_shared_targets(monkeypatch):
+    commands = []
+    lock = threading.Lock()
+
+    def run(cmd, output_callback):
+        with lock:
+            commands.append(cmd)
+        if any(arg.startswith("print-") for arg in cmd):
+            time.sleep(0.1)
+            return "BRIDGE_O = src/bridgestan.o\n"
+        return ""
+
+    monkeypatch.setattr(bs.compile, "_run", run)
+    stanfile = STAN_FOLDER / "simple" / "simple.stan"
+    lib = os.fspath(bs.compile.generate_so_name(stanfile))
+    make_args = ["BRIDGESTAN_TEST=shared_targets"]
+
+    # concurrent calls build the shared object files once, before the models
+    with ThreadPoolExecutor(2) as executor:
+        futures = [
+            executor.submit(bs.compile_model, stanfile, make_args=make_args)
+            for _ in range(2)
+        ]
+    assert [os.fspath(future.result()) for future in futures] == [lib, lib]
+    shared = [i for i, cmd in enumerate(commands) if "src/bridgestan.o" in cmd]
+    models = [i for i, cmd in enumerate(commands) if lib in cmd]
+    assert len(shared) == 1 and len(models) == 2
+    assert shared[0] < min(models)
+
+
+def test_compile_async_errors():
+    with pytest.raises(ValueError, match=r".stan"):
+        bs.compile_model_async(STAN_FOLDER / "multi" / "multi.data.json").result()
+    with pytest.raises(FileNotFoundError):
+        bs.compile_models([STAN_FOLDER / "multi" / "multi-nothere.stan"])
+
+
 def test_compile_bad_ext():
     not_stanfile = STAN_FOLDER / "multi" / "multi.data.json"
     with pytest.raises(ValueError, match=r".stan"):
@@ -1,5 +1,11 @@
+import array
+import asyncio
 import ctypes
+import json
+import os
+import pickle
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import numpy as np
@@ -57,6 +63,190 @@ def test_constructor():
     bs.StanModel(load_sundials, ode_sundials_data)
 
 
+def test_constructor_buffers():
+    logistic_so = STAN_FOLDER / "logistic" / "logistic_model.so"
+    logistic_data = STAN_FOLDER / "logistic" / "logistic.data.json"
+    data = json.loads(logistic_data.read_text())
+    x = np.array(data["x"])
+    y = np.array(data["y"], dtype=np.int32)
+    b1 = bs.StanModel(logistic_so, logistic_data)
+    theta = np.linspace(-1, 1, b1.param_unc_num())
+    expected = b1.log_density(theta)
+
+    # C order, Fortran order, and non-contiguous views are read in place
+    for x_arr in [x, np.asfortranarray(x), np.ascontiguousarray(x.T).T, x[::-1][::-1]]:
+        b2 = bs.StanModel(
+            logistic_so, {"N": data["N"], "K": np.int64(data["K"]), "x": x_arr, "y": y}
+        )
+        np.testing.assert_allclose(b2.log_density(theta), expected)
+    # the data is only converted to JSON when it is needed
+    assert b2._data is None
+    assert repr(b2) == (
+        f"StanModel({str(logistic_so)!r}, {{'N': (), 'K': (), "
+        f"'x': {x.shape!r}, 'y': {y.shape!r}}}, seed=1234)"
+    )
+    assert b2._data is None
+    assert json.loads(b2.data)["K"] == data["K"]
+
+    # other integer and floating point types are converted
+    b3 = bs.StanModel(
+        logistic_so,
+        {
+            "N": data["N"],
+            "K": data["K"],
+            "x": x.astype(np.float32),
+            "y": y.astype(np.bool_),
+        },
+    )
+    # lists are passed as JSON
+    b4 = bs.StanModel(logistic_so, {**data, "x": x.astype(np.float32).tolist()})
+    assert b4._data is not None
+    np.testing.assert_allclose(b3.log_density(theta), b4.log_density(theta))
+
+    with pytest.raises(RuntimeError, match="int variable contained non-int"):
+        bs.StanModel(logistic_so, {**data, "x": x, "y": y.astype(np.float64)})
+    with pytest.raises(RuntimeError, match="mismatch in dimension"):
+        bs.StanModel(logistic_so, {**data, "x": x.T, "y": y})
+    with pytest.raises(RuntimeError, match="variable does not exist"):
+        bs.StanModel(logistic_so, {"N": data["N"], "K": data["K"], "y": y})
+    with pytest.raises(RuntimeError, match="out of range"):
+        bs.StanModel(logistic_so, {"N": 2**40, "K": data["K"], "x": x, "y": y})
+
+
+def test_binary_data(tmp_path, monkeypatch):
+    logistic_so = STAN_FOLDER / "logistic" / "logistic_model.so"
+    logistic_data = STAN_FOLDER / "logistic" / "logistic.data.json"
+    b1 = bs.StanModel(logistic_so, logistic_data)
+    theta = np.linspace(-1, 1, b1.param_unc_num())
+    expected = b1.log_density(theta)
+
+    converted = bs.convert_json_data(logistic_data, tmp_path / "logistic.bsdata")
+    b2 = bs.StanModel(logistic_so, converted)
+    np.testing.assert_allclose(b2.log_density(theta), expected)
+    assert b2.data == str(converted)
+
+    data = json.loads(logistic_data.read_text())
+    data["x"] = np.asfortranarray(data["x"])
+    bs.dump_binary_data(tmp_path / "dumped.bsdata", data)
+    b3 = bs.StanModel(logistic_so, tmp_path / "dumped.bsdata")
+    np.testing.assert_allclose(b3.log_density(theta), expected)
+
+    # large data passed in memory is pickled in the binary format
+    monkeypatch.setattr(bs.model, "PICKLE_DATA_INLINE_LIMIT", 10)
+    data["y"] = np.array(data["y"])
+    b4 = bs.StanModel(logistic_so, data)
+    pickle.dumps(b4)
+    assert b4._data_file.endswith(".bsdata")
+    assert b4._data is None
+    np.testing.assert_allclose(
+        pickle.loads(pickle.dumps(b4)).log_density(theta), expected
+    )
+
+    with pytest.raises(ValueError, match="must end with"):
+        bs.dump_binary_data(tmp_path / "data.json", data)
+    with pytest.raises(ValueError, match="cannot be saved"):
+        bs.dump_binary_data(tmp_path / "bad.bsdata", {"x": ["a", "b"]})
+    with pytest.raises(ValueError, match="cannot be saved"):
+        bs.dump_binary_data(tmp_path / "bad.bsdata", {"x": {"1": 1, "2": 2.0}})
+
+    bad = tmp_path / "bad.bsdata"
+    bad.write_bytes(b"not binary data")
+    with pytest.raises(RuntimeError, match="not a BridgeStan binary data file"):
+        bs.StanModel(logistic_so, bad)
+    bad.write_bytes(converted.read_bytes()[:100])
+    with pytest.raises(RuntimeError, match="larger than the file"):
+        bs.StanModel(logistic_so, bad)
+
+
+_PEAK_RSS_SCRIPT = """
+import resource, sys
+import bridgestan as bs
+
+def peak():
+    # kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+lib, data = sys.argv[1:]
+bs.StanModel(lib, {"N": 1, "K": 1, "x": [[0.0]], "y": [0]})
+before = peak()
+model = bs.StanModel(lib, data, warn=False)
+print(peak() - before)
+"""
+
+
+def test_json_file_peak_rss(tmp_path):
+    pytest.importorskip("resource")
+    import subprocess
+    import sys
+
+    logistic_so = STAN_FOLDER / "logistic" / "logistic_model.so"
+    rng = np.random.default_rng(1234)
+    N, K = 40_000, 24
+    data_file = tmp_path / "large.json"
+    data_file.write_text(
+        json.dumps(
+            {
+                "N": N,
+                "K": K,
+                "x": rng.normal(size=(N, K)).tolist(),
+                "y": rng.integers(0, 2, size=N).tolist(),
+            }
+        )
+    )
+    file_size = data_file.stat().st_size
+    data_size = N * K * 8
+
+    proc = subprocess.run(
+        [sys.executable, "-c", _PEAK_RSS_SCRIPT, str(logistic_so), str(data_file)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    growth = int(proc.stdout.split()[-1])
+    # the file is streamed, so construction holds the parsed values and the
+    # model's copy of them, but never the whole text of the file, which is
+    # much larger
+    assert file_size > 2 * data_size
+    assert growth < file_size
+
+
+def test_with_data():
+    simple_so = STAN_FOLDER / "simple" / "simple_model.so"
+    b1 = bs.StanModel(simple_so, {"N": 3}, seed=7)
+
+    b2 = b1.with_data({"N": 3})
+    assert b2.model != b1.model
+    assert b2.seed == 7
+    assert b2.stanlib is b1.stanlib
+    x = np.array([0.1, 0.2, 0.3])
+    assert b2.log_density(x) == b1.log_density(x)
+    lp, grad = b2.log_density_gradient(x)
+    np.testing.assert_allclose(grad, -x)
+
+    # a different number of parameters needs its own signatures
+    b3 = b1.with_data(json.dumps({"N": 5}), seed=3)
+    assert b3.seed == 3
+    assert b3.param_unc_num() == 5
+    np.testing.assert_allclose(b3.log_density_gradient(np.ones(5))[1], -np.ones(5))
+    np.testing.assert_allclose(b1.log_density_gradient(x)[1], -x)
+    with pytest.raises(ctypes.ArgumentError):
+        b1.log_density_hessian(np.ones(5))
+
+    with pytest.raises(RuntimeError, match="variable does not exist"):
+        b1.with_data(None)
+    with pytest.raises(FileNotFoundError):
+        b1.with_data("nope.json")
+
+    models = b1.with_datasets([{"N": n} for n in range(1, 6)], jobs=3)
+    assert [m.param_unc_num() for m in models] == [1, 2, 3, 4, 5]
+    assert all(m.seed == 7 for m in models)
+    models = b1.with_datasets([{"N": 2}] * 3, seeds=[1, 2, 3])
+    assert [m.seed for m in models] == [1, 2, 3]
+    with pytest.raises(ValueError, match="seeds"):
+        b1.with_datasets([{"N": 2}] * 3, seeds=[1])
+
+
 def test_name():
     std_so = STAN_FOLDER / "stdnormal" / "stdnormal_model.so"
     b = bs.StanModel(std_so)
@@ -185,6 +375,44 @@ def test_param_unc_names():
     )
 
 
+def test_param_index():
+    matrix_so = STAN_FOLDER / "matrix" / "matrix_model.so"
+    b1 = bs.StanModel(matrix_so)
+    index = b1.param_index(include_tp=True, include_gq=True)
+    assert index is b1.param_index(include_tp=True, include_gq=True)
+    assert list(index) == ["A", "B", "c"]
+    assert len(index) == 13
+    assert index.shape("A") == (3, 2)
+    assert index.shape("c") == ()
+    assert index.slice("B") == slice(6, 12)
+    assert index.columns("A.2") == [1, 4]
+    assert list(index.names) == b1.param_names(include_tp=True, include_gq=True)
+    assert list(b1.param_index()) == ["A"]
+
+    draws = np.arange(3 * 13, dtype=np.float64).reshape(3, 13)
+    views = index.views(draws)
+    assert views["A"].shape == (3, 3, 2)
+    assert views["c"].shape == (3,)
+    np.testing.assert_array_equal(views["A"][1], draws[1, :6].reshape(2, 3).T)
+    np.testing.assert_array_equal(views["B"][2, 0], draws[2, [6, 9]])
+    np.testing.assert_array_equal(views["c"], draws[:, 12])
+    # the views share the memory of the draws
+    views["A"][0, 2, 1] = -1.0
+    assert draws[0, 5] == -1.0
+    np.testing.assert_array_equal(index.view(np.asfortranarray(draws), "B"), views["B"])
+    np.testing.assert_array_equal(index.view(draws[0], "A"), views["A"][0])
+    with pytest.raises(ValueError):
+        index.views(draws[:, :6])
+
+    unc = b1.param_unc_index()
+    assert list(unc) == ["A"] and unc.shape("A") == (3, 2)
+
+    simplex_so = STAN_FOLDER / "simplex" / "simplex_model.so"
+    b2 = bs.StanModel(simplex_so)
+    assert b2.param_index().shape("theta") == (5,)
+    assert b2.param_unc_index().shape("theta") == (4,)
+
+
 def cov_constrain(v, D):
     L = np.zeros([D, D])
     idxL = np.tril_indices(D)
@@ -269,6 +497,132 @@ def test_param_constrain():
         bridge3.param_constrain(y, include_gq=True, rng=bridge3.new_rng(seed=1))
 
 
+def test_param_constrain_batch():
+    fr_gaussian_so = STAN_FOLDER / "fr_gaussian" / "fr_gaussian_model.so"
+    fr_gaussian_data = STAN_FOLDER / "fr_gaussian" / "fr_gaussian.data.json"
+    bridge = bs.StanModel(fr_gaussian_so, fr_gaussian_data)
+
+    N = 7
+    a = np.random.normal(size=(N, bridge.param_unc_num()))
+    b, status = bridge.param_constrain_batch(a)
+    np.testing.assert_equal(status, 0)
+    assert b.shape == (N, 16)
+    for i in range(N):
+        np.testing.assert_allclose(b[i].reshape(4, 4), cov_constrain(a[i], 4))
+
+    scratch = np.zeros((N, 16))
+    b2, _ = bridge.param_constrain_batch(a, out=scratch, n_threads=3)
+    assert b2 is scratch
+    np.testing.assert_allclose(b2, b)
+    with pytest.raises(ValueError):
+        bridge.param_constrain_batch(a, out=np.zeros((N, 10)))
+    with pytest.raises(ValueError):
+        bridge.param_constrain_batch(a[0])
+
+    full_so = STAN_FOLDER / "full" / "full_model.so"
+    bridge2 = bs.StanModel(full_so)
+    N = 10
+    a = np.random.normal(size=(N, bridge2.param_unc_num()))
+
+    b, _ = bridge2.param_constrain_batch(a, include_tp=True)
+    assert b.shape == (N, 2)
+    np.testing.assert_allclose(b[:, 1], np.exp(a[:, 0]))
+
+    # generated quantities match a serial loop with the same PRNG
+    b, status = bridge2.param_constrain_batch(
+        a, include_tp=True, include_gq=True, rng=bridge2.new_rng(seed=1234)
+    )
+    np.testing.assert_equal(status, 0)
+    rng = bridge2.new_rng(seed=1234)
+    for i in range(N):
+        np.testing.assert_equal(
+            b[i],
+            bridge2.param_constrain(a[i], include_tp=True, include_gq=True, rng=rng),
+        )
+
+    # one PRNG per contiguous chunk of rows, seeded with seed + thread
+    b, _ = bridge2.param_constrain_batch(a, include_gq=True, seed=99, n_threads=2)
+    b2, _ = bridge2.param_constrain_batch(
+        a, include_gq=True, rng=[bridge2.new_rng(99), bridge2.new_rng(100)]
+    )
+    np.testing.assert_equal(b, b2)
+    if "STAN_THREADS=true" in bridge2.model_info():
+        rngs = [bridge2.new_rng(99), bridge2.new_rng(100)]
+        for i in range(N):
+            expected = bridge2.param_constrain(
+                a[i], include_gq=True, rng=rngs[i // (N // 2)]
+            )
+            np.testing.assert_equal(b[i], expected)
+
+    with pytest.raises(ValueError):
+        bridge2.param_constrain_batch(a, include_gq=True)
+    with pytest.raises(ValueError):
+        bridge2.param_constrain_batch(
+            a, include_gq=True, rng=bridge2.new_rng(1), seed=1
+        )
+    with pytest.raises(ValueError):
+        bridge2.param_constrain_batch(
+            a, include_gq=True, rng=bridge2.new_rng(1), n_threads=2
+        )
+
+    # failures are reported per row
+    throw_gq_so = STAN_FOLDER / "throw_gq" / "throw_gq_model.so"
+    bridge3 = bs.StanModel(throw_gq_so)
+    y = np.random.uniform(size=(3, 1))
+    _, status = bridge3.param_constrain_batch(y)
+    np.testing.assert_equal(status, 0)
+    with pytest.warns(RuntimeWarning, match="3 of 3 rows failed.*row 0.*gqfails"):
+        _, status = bridge3.param_constrain_batch(y, include_gq=True, seed=1)
+    np.testing.assert_equal(status, -1)
+
+
+def test_param_constrain_columns():
+    full = bs.StanModel(STAN_FOLDER / "full" / "full_model.so")
+    a = np.array([0.3])
+    rng = full.new_rng(seed=4)
+    out = np.zeros(2)
+    d = full.param_constrain(
+        a, include_tp=True, include_gq=True, rng=rng, columns=["d"], out=out
+    )
+    assert d is out
+    assert set(d) <= {1.0, 2.0, 3.0, 4.0, 5.0}
+
+    b = full.param_constrain(a, include_tp=True, columns=["b"])
+    np.testing.assert_allclose(b, [np.exp(0.3)])
+    ba = full.param_constrain(a, include_tp=True, columns=np.array([1, 0]))
+    np.testing.assert_allclose(ba, [np.exp(0.3), 0.3])
+    assert full.param_constrain(a, include_tp=True, columns=[1])[0] == b[0]
+    assert full.param_constrain(a, columns=[]).shape == (0,)
+
+    # selected by name in the model's order
+    selected = full.param_constrain(
+        a, include_tp=True, include_gq=True, rng=rng, columns={"d.2", "a"}
+    )
+    assert selected[0] == 0.3 and selected[1] in {1.0, 2.0, 3.0, 4.0, 5.0}
+
+    thetas = np.random.default_rng(2).normal(size=(10, 1))
+    everything, _ = full.param_constrain_batch(thetas, include_tp=True)
+    for columns in [["b"], np.array([1]), [1]]:
+        b, status = full.param_constrain_batch(
+            thetas, include_tp=True, columns=columns, n_threads=2
+        )
+        assert b.shape == (10, 1) and not status.any()
+        np.testing.assert_array_equal(b, everything[:, [1]])
+    d, _ = full.param_constrain_batch(
+        thetas, include_tp=True, include_gq=True, seed=1, columns="d"
+    )
+    assert d.shape == (10, 2)
+
+    with pytest.raises(ValueError, match="unknown parameter name"):
+        full.param_constrain(a, columns=["b"])
+    with pytest.raises(ValueError, match="column indices"):
+        full.param_constrain(a, columns=[1])
+    with pytest.raises(ValueError, match="column indices"):
+        full.param_constrain_batch(thetas, columns=np.array([-1]))
+    with pytest.raises(ValueError):
+        full.param_constrain(a, include_tp=True, columns=["b"], out=np.zeros(2))
+
+
 def test_param_unconstrain():
     fr_gaussian_so = STAN_FOLDER / "fr_gaussian" / "fr_gaussian_model.so"
     fr_gaussian_data = STAN_FOLDER / "fr_gaussian" / "fr_gaussian.data.json"
@@ -311,6 +665,121 @@ def test_param_unconstrain_json():
         bridge.param_unconstrain_json(theta_json, out=scratch_bad)
 
 
+def test_param_unconstrain_dict():
+    gaussian_so = STAN_FOLDER / "gaussian" / "gaussian_model.so"
+    gaussian_data = STAN_FOLDER / "gaussian" / "gaussian.data.json"
+    bridge = bs.StanModel(gaussian_so, gaussian_data)
+
+    theta_unc = np.array([0.2, np.log(1.9)])
+    np.testing.assert_allclose(
+        theta_unc, bridge.param_unconstrain_dict({"mu": 0.2, "sigma": 1.9})
+    )
+    scratch = np.zeros(2)
+    out = bridge.param_unconstrain_dict(
+        {"mu": np.float32(0.2), "sigma": np.array(1.9)}, out=scratch
+    )
+    assert out is scratch
+    np.testing.assert_allclose(theta_unc, out, rtol=1e-6)
+    with pytest.raises(RuntimeError, match="Lower bounded"):
+        bridge.param_unconstrain_dict({"mu": 0.2, "sigma": -1.0})
+    with pytest.raises(RuntimeError):
+        bridge.param_unconstrain_dict({"mu": 0.2})
+
+    # arrays are read in row-major order, like JSON, with any strides
+    matrix_so = STAN_FOLDER / "matrix" / "matrix_model.so"
+    b2 = bs.StanModel(matrix_so)
+    A = np.arange(6.0).reshape(3, 2)
+    expected = A.flatten(order="F")
+    np.testing.assert_allclose(expected, b2.param_unconstrain_dict({"A": A}))
+    np.testing.assert_allclose(
+        expected, b2.param_unconstrain_dict({"A": np.asfortranarray(A)})
+    )
+    np.testing.assert_allclose(expected, b2.param_unconstrain_dict({"A": A.tolist()}))
+    np.testing.assert_allclose(
+        expected,
+        b2.param_unconstrain_json({"A": A}),
+    )
+
+    simplex_so = STAN_FOLDER / "simplex" / "simplex_model.so"
+    b3 = bs.StanModel(simplex_so)
+    theta = np.array([0.1, 0.2, 0.3, 0.15, 0.25])
+    np.testing.assert_allclose(
+        b3.param_unconstrain(theta), b3.param_unconstrain_dict({"theta": theta})
+    )
+
+    thetas = [{"mu": 0.1 * i, "sigma": 1.0 + i} for i in range(5)]
+    thetas[3] = {"mu": 0.3, "sigma": -2.0}
+    with pytest.warns(RuntimeWarning, match="1 of 5 rows failed.*row 3"):
+        out, status = bridge.param_unconstrain_dict_batch(thetas)
+    np.testing.assert_equal([0, 0, 0, -1, 0], status)
+    with pytest.warns(RuntimeWarning, match="row 3"):
+        json_out, json_status = bridge.param_unconstrain_json_batch(thetas)
+    np.testing.assert_equal(json_status, status)
+    np.testing.assert_allclose(np.delete(json_out, 3, 0), np.delete(out, 3, 0))
+
+    scratch = np.zeros((5, 2))
+    with pytest.warns(RuntimeWarning, match="row 3"):
+        out, _ = bridge.param_unconstrain_dict_batch(thetas, out=scratch, n_threads=2)
+    assert out is scratch
+    out, status = bridge.param_unconstrain_dict_batch([])
+    assert out.shape == (0, 2) and status.shape == (0,)
+
+
+def test_param_unconstrain_batch():
+    gaussian_so = STAN_FOLDER / "gaussian" / "gaussian_model.so"
+    gaussian_data = STAN_FOLDER / "gaussian" / "gaussian.data.json"
+    bridge = bs.StanModel(gaussian_so, gaussian_data)
+
+    N = 25
+    rng = np.random.default_rng(1234)
+    theta = np.column_stack([rng.normal(size=N), rng.uniform(0.5, 3, size=N)])
+    theta_unc = np.column_stack([theta[:, 0], np.log(theta[:, 1])])
+
+    out, status = bridge.param_unconstrain_batch(theta)
+    np.testing.assert_allclose(theta_unc, out)
+    np.testing.assert_equal(np.zeros(N), status)
+
+    # negative scale fails for that row only
+    theta[7, 1] = -1.0
+    with pytest.warns(RuntimeWarning, match="row 7"):
+        out, status = bridge.param_unconstrain_batch(theta)
+    assert status[7] == -1
+    assert np.sum(status) == -1
+    np.testing.assert_allclose(np.delete(theta_unc, 7, 0), np.delete(out, 7, 0))
+    theta[7, 1] = 1.0
+    theta_unc[7, 1] = 0.0
+
+    for n_threads in [2, 4, 0]:
+        scratch = np.zeros((N, 2))
+        out, status = bridge.param_unconstrain_batch(
+            theta, out=scratch, n_threads=n_threads
+        )
+        assert out is scratch
+        np.testing.assert_allclose(theta_unc, out)
+        np.testing.assert_equal(np.zeros(N), status)
+
+    with pytest.raises(ValueError):
+        bridge.param_unconstrain_batch(theta[0])
+    with pytest.raises(ValueError):
+        bridge.param_unconstrain_batch(theta, out=np.zeros((N, 3)))
+
+    thetas_json = [f'{{"mu": {m}, "sigma": {s}}}' for m, s in theta]
+    thetas_json[3] = {"mu": theta[3, 0], "sigma": theta[3, 1]}
+    out, status = bridge.param_unconstrain_json_batch(thetas_json, n_threads=2)
+    np.testing.assert_allclose(theta_unc, out)
+    np.testing.assert_equal(np.zeros(N), status)
+
+    thetas_json[11] = '{"mu": 0.2}'
+    with pytest.warns(RuntimeWarning, match="row 11"):
+        out, status = bridge.param_unconstrain_json_batch(thetas_json)
+    assert status[11] == -1
+    assert np.sum(status) == -1
+
+    out, status = bridge.param_unconstrain_json_batch([])
+    assert out.shape == (0, 2)
+    assert status.shape == (0,)
+
+
 def _log_jacobian(p):
     return np.log(p * (1 - p))
 
@@ -425,6 +894,115 @@ def test_log_density_gradient():
         bridge.log_density_gradient(y_unc_wrong)
 
 
+def test_log_density_gradient_batch():
+    bernoulli_so = STAN_FOLDER / "bernoulli" / "bernoulli_model.so"
+    bernoulli_data = STAN_FOLDER / "bernoulli" / "bernoulli.data.json"
+    bridge = bs.StanModel(bernoulli_so, bernoulli_data)
+
+    N = 20
+    thetas = np.random.normal(size=(N, bridge.param_unc_num()))
+    lps, grads, status = bridge.log_density_gradient_batch(thetas, jacobian=False)
+    np.testing.assert_equal(status, 0)
+    for i in range(N):
+        lp, grad = bridge.log_density_gradient(thetas[i], jacobian=False)
+        np.testing.assert_allclose(lps[i], lp)
+        np.testing.assert_allclose(grads[i], grad)
+
+    # a failure in one row does not stop the others
+    thetas[17] = np.nan
+    out_lp = np.zeros(N)
+    out_grad = np.zeros_like(thetas)
+    with pytest.warns(RuntimeWarning, match="1 of 20 rows failed.*row 17"):
+        lps2, grads2, status = bridge.log_density_gradient_batch(
+            thetas, jacobian=False, out_lp=out_lp, out_grad=out_grad
+        )
+    assert lps2 is out_lp
+    assert grads2 is out_grad
+    np.testing.assert_equal(status[17], -1)
+    assert np.isnan(lps2[17])
+    mask = np.arange(N) != 17
+    np.testing.assert_equal(status[mask], 0)
+    np.testing.assert_allclose(lps2[mask], lps[mask])
+    np.testing.assert_allclose(grads2[mask], grads[mask])
+
+    # threaded evaluation matches serial evaluation
+    for n_threads in [2, 4, 0]:
+        with pytest.warns(RuntimeWarning, match="row 17"):
+            lps3, grads3, status3 = bridge.log_density_gradient_batch(
+                thetas, jacobian=False, n_threads=n_threads
+            )
+        np.testing.assert_equal(status3, status)
+        np.testing.assert_allclose(lps3, lps2)
+        np.testing.assert_allclose(grads3[mask], grads2[mask])
+
+    # empty batch
+    lps, grads, status = bridge.log_density_gradient_batch(np.zeros((0, 1)))
+    assert lps.shape == (0,)
+    assert grads.shape == (0, 1)
+
+    with pytest.raises(ValueError):
+        bridge.log_density_gradient_batch(np.zeros(1))
+    with pytest.raises(ValueError):
+        bridge.log_density_gradient_batch(np.zeros((N, 2)))
+    with pytest.raises(ValueError):
+        bridge.log_density_gradient_batch(thetas, out_lp=np.zeros(N + 1))
+    with pytest.raises(ValueError):
+        bridge.log_density_gradient_batch(thetas, out_grad=np.zeros(N))
+    with pytest.raises(ctypes.ArgumentError):
+        bridge.log_density_gradient_batch(np.zeros((N, 2))[:, :1])
+
+
+def test_async_model():
+    gaussian_so = STAN_FOLDER / "gaussian" / "gaussian_model.so"
+    gaussian_data = STAN_FOLDER / "gaussian" / "gaussian.data.json"
+    bridge = bs.StanModel(gaussian_so, gaussian_data)
+
+    batches = []
+    batch = bridge.log_density_gradient_batch
+
+    def counted_batch(theta_unc, **kwargs):
+        batches.append(len(theta_unc))
+        return batch(theta_unc, **kwargs)
+
+    bridge.log_density_gradient_batch = counted_batch
+
+    rng = np.random.default_rng(1234)
+    thetas = rng.normal(size=(20, 2))
+
+    async def run():
+        async with bs.AsyncStanModel(bridge, max_batch_size=8) as amodel:
+            results = await asyncio.gather(
+                *(amodel.alog_density_gradient(theta) for theta in thetas)
+            )
+            lp = await amodel.alog_density(thetas[0], propto=False)
+            constrained = await asyncio.gather(
+                amodel.aparam_constrain(thetas[0]),
+                amodel.aparam_constrain(thetas[1], include_tp=True),
+                amodel.aparam_unconstrain([0.2, 1.9]),
+            )
+            with pytest.raises(RuntimeError, match="Lower bounded"):
+                await amodel.aparam_unconstrain([0.2, -1.0])
+            with pytest.raises(ValueError):
+                await amodel.alog_density_gradient(np.zeros(3))
+        with pytest.raises(RuntimeError):
+            await amodel.alog_density_gradient(thetas[0])
+        return results, lp, constrained
+
+    results, lp, constrained = asyncio.run(run())
+    # coalesced into batches of at most 8
+    assert batches == [8, 8, 4]
+    for theta, (lp_i, grad_i) in zip(thetas, results):
+        lp_s, grad_s = bridge.log_density_gradient(theta)
+        np.testing.assert_allclose(lp_s, lp_i)
+        np.testing.assert_allclose(grad_s, grad_i)
+    assert lp == bridge.log_density(thetas[0], propto=False)
+    np.testing.assert_allclose(constrained[0], bridge.param_constrain(thetas[0]))
+    np.testing.assert_allclose(
+        constrained[1], bridge.param_constrain(thetas[1], include_tp=True)
+    )
+    np.testing.assert_allclose(constrained[2], [0.2, np.log(1.9)])
+
+
 def test_log_density_hessian():
     def _logp(y_unc):
         y = np.exp(y_unc)
@@ -550,6 +1128,145 @@ def test_log_density_hessian():
     np.testing.assert_allclose(-np.identity(D), hess)
 
 
+def test_log_density_hessian_parallel():
+    lib = STAN_FOLDER / "logistic" / "logistic_model.so"
+    data = STAN_FOLDER / "logistic" / "logistic.data.json"
+    bridge = bs.StanModel(lib, data)
+    D = bridge.param_unc_num()
+    theta = np.random.default_rng(3).normal(size=D)
+
+    lp, grad, hess = bridge.log_density_hessian(theta)
+    for n_threads in [2, 4, 0]:
+        lp2, grad2, hess2 = bridge.log_density_hessian(theta, n_threads=n_threads)
+        assert lp2 == lp
+        np.testing.assert_array_equal(grad2, grad)
+        np.testing.assert_array_equal(hess2, hess)
+
+    out_grad = np.zeros(D)
+    out_hess = np.zeros((D, D))
+    _, grad2, hess2 = bridge.log_density_hessian(
+        theta, out_grad=out_grad, out_hess=out_hess, n_threads=2
+    )
+    assert grad2 is out_grad
+    np.testing.assert_array_equal(out_hess, hess)
+
+    throw_lp = bs.StanModel(STAN_FOLDER / "throw_lp" / "throw_lp_model.so")
+    with pytest.raises(RuntimeError, match="log_density_hessian_parallel"):
+        throw_lp.log_density_hessian(np.zeros(throw_lp.param_unc_num()), n_threads=2)
+
+
+def test_log_density_hessian_matrix_product():
+    lib = STAN_FOLDER / "logistic" / "logistic_model.so"
+    data = STAN_FOLDER / "logistic" / "logistic.data.json"
+    bridge = bs.StanModel(lib, data)
+    D = bridge.param_unc_num()
+    rng = np.random.default_rng(4)
+    theta = rng.normal(size=D)
+    V = rng.normal(size=(D, 3))
+
+    lp, HV = bridge.log_density_hessian_matrix_product(theta, V, propto=False)
+    assert HV.shape == (D, 3)
+    assert HV.flags.c_contiguous
+    np.testing.assert_allclose(lp, bridge.log_density(theta, propto=False))
+    for j in range(3):
+        _, hvp = bridge.log_density_hessian_vector_product(
+            theta, V[:, j].copy(), propto=False
+        )
+        np.testing.assert_array_equal(HV[:, j], hvp)
+        out = np.zeros(D)
+        _, hvp = bridge.log_density_hessian_vector_product(
+            theta, V[:, j], propto=False, out=out, n_threads=2
+        )
+        assert hvp is out
+        np.testing.assert_array_equal(HV[:, j], hvp)
+
+    for n_threads in [2, 0]:
+        _, HV2 = bridge.log_density_hessian_matrix_product(
+            theta, V, propto=False, n_threads=n_threads
+        )
+        np.testing.assert_array_equal(HV2, HV)
+
+    out = np.zeros((D, 3))
+    _, HV2 = bridge.log_density_hessian_matrix_product(theta, V, propto=False, out=out)
+    assert HV2 is out
+    np.testing.assert_array_equal(out, HV)
+
+    _, HV2 = bridge.log_density_hessian_matrix_product(theta, np.zeros((D, 0)))
+    assert HV2.shape == (D, 0)
+
+    # the gradient can be computed in the same call
+    grad = np.zeros(D)
+    lp2, HV2 = bridge.log_density_hessian_matrix_product(
+        theta, V, propto=False, out_grad=grad
+    )
+    lp3, grad3 = bridge.log_density_gradient(theta, propto=False)
+    assert lp2 == lp3
+    np.testing.assert_array_equal(grad, grad3)
+    np.testing.assert_array_equal(HV2, HV)
+
+    with pytest.raises(ValueError):
+        bridge.log_density_hessian_matrix_product(theta, V.T)
+    with pytest.raises(ValueError):
+        bridge.log_density_hessian_matrix_product(theta, V, out=np.zeros((D, 2)))
+    with pytest.raises(ValueError):
+        bridge.log_density_hessian_matrix_product(theta, V, out=np.zeros((3, D)).T)
+
+
+def test_log_density_hessian_sparse():
+    pytest.importorskip("scipy")
+    from bridgestan import sparse
+
+    lib = STAN_FOLDER / "multi" / "multi_model.so"
+    bridge = bs.StanModel(lib, {"M": 50, "N": 3, "P": 10})
+    theta = np.random.default_rng(5).normal(size=50)
+    lp, grad, hess = bridge.log_density_hessian_sparse(theta)
+    lp2, grad2, hess2 = bridge.log_density_hessian(theta)
+    assert hess.format == "csr" and hess.nnz == 50
+    np.testing.assert_allclose(lp, lp2)
+    np.testing.assert_allclose(grad, grad2)
+    np.testing.assert_allclose(hess.toarray(), hess2, atol=1e-6)
+    pattern, colors = bridge._hessian_sparsity[(True, True)]
+    assert colors.max() == 0
+    assert bridge.with_data({"M": 4, "N": 3, "P": 10})._hessian_sparsity == {}
+
+    # an explicit pattern replaces the detected one
+    full = np.ones((50, 50))
+    lp3, grad3, hess3 = bridge.log_density_hessian_sparse(theta, pattern=full)
+    assert lp3 == lp
+    np.testing.assert_array_equal(grad3, grad)
+    np.testing.assert_allclose(hess3.toarray(), hess2, atol=1e-6)
+    assert bridge._hessian_sparsity[(True, True)][1].max() == 49
+    bridge.log_density_hessian_sparse(theta)
+    assert bridge._hessian_sparsity[(True, True)][1].max() == 49
+    with pytest.raises(ValueError):
+        bridge.log_density_hessian_sparse(theta, pattern=np.eye(49))
+
+    # a dense Hessian takes one color per column
+    lib = STAN_FOLDER / "logistic" / "logistic_model.so"
+    data = STAN_FOLDER / "logistic" / "logistic.data.json"
+    bridge = bs.StanModel(lib, data)
+    D = bridge.param_unc_num()
+    theta = np.random.default_rng(6).normal(size=D)
+    _, _, hess = bridge.log_density_hessian_sparse(theta, jacobian=False)
+    _, _, hess2 = bridge.log_density_hessian(theta, jacobian=False)
+    np.testing.assert_allclose(hess.toarray(), hess2, rtol=1e-5, atol=1e-6)
+    assert bridge._hessian_sparsity[(True, False)][1].max() == D - 1
+
+    # block diagonal and tridiagonal patterns
+    import scipy.sparse
+
+    for pattern, n_colors in [
+        (scipy.sparse.block_diag([np.ones((3, 3))] * 4), 3),
+        (scipy.sparse.diags([1.0, 1.0, 1.0], [-1, 0, 1], shape=(10, 10)), 3),
+    ]:
+        colors = sparse.color_columns(scipy.sparse.csr_matrix(pattern))
+        assert colors.max() + 1 == n_colors
+        csc = scipy.sparse.csc_matrix(pattern, dtype=bool)
+        for c in range(n_colors):
+            rows = csc[:, colors == c].sum(axis=1)
+            assert rows.max() <= 1
+
+
 def test_out_behavior():
     bernoulli_so = STAN_FOLDER / "bernoulli" / "bernoulli_model.so"
     bernoulli_data = STAN_FOLDER / "bernoulli" / "bernoulli.data.json"
@@ -732,19 +1449,75 @@ def test_stdout_capture():
     assert x == 500  # 2 calls per print, 10 threads, 25 iterations
 
 
-def test_reload_warning():
+def test_reload_warning(tmp_path):
     lib = STAN_FOLDER / "fr_gaussian" / "fr_gaussian_model.so"
     data = STAN_FOLDER / "fr_gaussian" / "fr_gaussian.data.json"
     model = bs.StanModel(lib, data)
 
+    # loaded and reloaded through the registry, so nothing to warn about
     relative_lib = lib.relative_to(STAN_FOLDER.parent)
     assert not relative_lib.is_absolute()
-    with pytest.warns(UserWarning, match="may not update the library"):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # fail if warning is raised
         model2 = bs.StanModel(relative_lib, data)
 
+    copy = tmp_path / "fr_gaussian_model.so"
+    copy.write_bytes(lib.read_bytes())
+    ctypes.CDLL(str(copy))
+    with pytest.warns(UserWarning, match="may not update the library"):
+        model3 = bs.StanModel(copy, data)
+
     with warnings.catch_warnings():
         warnings.simplefilter("error")  # fail if warning is raised
-        model2 = bs.StanModel(lib, data, warn=False)
+        model4 = bs.StanModel(copy, data, warn=False)
+
+
+def test_library_registry(tmp_path, monkeypatch):
+    from bridgestan import registry
+
+    lib = tmp_path / "model.so"
+    lib.write_bytes((STAN_FOLDER / "simple" / "simple_model.so").read_bytes())
+    simple_data = STAN_FOLDER / "simple" / "simple.data.json"
+    bernoulli_data = STAN_FOLDER / "bernoulli" / "bernoulli.data.json"
+
+    model = bs.StanModel(lib, simple_data)
+    model2 = model.with_data('{"N": 3}')
+    rng = model.new_rng(seed=1)
+    shared = model._library
+    assert model2._library is shared and shared.refs == 3
+    assert bs.StanModel(lib, simple_data)._library is shared
+    del model, model2, rng
+    assert shared.refs == 0 and shared.cdll is not None
+    bs.unload_idle_libraries()
+    assert shared.cdll is None
+
+    # loaded from a copy if the operating system did not unload it
+    still_mapped = registry._still_loaded(str(lib))
+    model = bs.StanModel(lib, simple_data)
+    assert (model._library.load_path != str(lib)) == still_mapped
+    old = model._library
+    lib.write_bytes((STAN_FOLDER / "bernoulli" / "bernoulli_model.so").read_bytes())
+    os.utime(lib, ns=(old.stat[0] + 10**9, old.stat[0] + 10**9))
+    model2 = bs.StanModel(lib, bernoulli_data)
+    assert model2.name() == "bernoulli_model"
+    assert model.name() == "simple_model"
+    np.testing.assert_allclose(model.log_density(np.zeros(5)), 0.0)
+    del model
+    assert old.cdll is None
+    assert old not in registry.loaded_libraries()
+
+    bs.set_library_budget(max_idle=0)
+    try:
+        current = model2._library
+        del model2
+        assert current.cdll is None
+    finally:
+        bs.set_library_budget()
+
+    # loaded from its own path again once it is really unloaded
+    assert str(lib) not in registry._open_paths
+    monkeypatch.setattr(registry.dllist, "dllist", lambda: [])
+    assert not registry._still_loaded(str(lib))
 
 
 def test_ctypes_pointers():
@@ -780,6 +1553,272 @@ def test_ctypes_pointers():
         model.log_density(params)
 
 
+def _pickled_log_density(model, x):
+    return model.log_density(x), id(model)
+
+
+def test_pickle(monkeypatch):
+    bernoulli_so = STAN_FOLDER / "bernoulli" / "bernoulli_model.so"
+    bernoulli_data = STAN_FOLDER / "bernoulli" / "bernoulli.data.json"
+    model = bs.StanModel(bernoulli_so, bernoulli_data, seed=42)
+    x = np.array([0.3])
+    # the model reads the file itself, and Python only when asked
+    assert model._data is None
+    assert model.data == bernoulli_data.read_text()
+
+    model2 = pickle.loads(pickle.dumps(model))
+    assert model2 is not model
+    assert model2.lib_path == model.lib_path
+    assert model2.data == model.data
+    assert model2.seed == 42
+    assert model2.log_density(x) == model.log_density(x)
+    # data read from a file is pickled as its path
+    assert model._data_file == str(bernoulli_data)
+    assert bernoulli_data.read_bytes() not in pickle.dumps(model)
+    # each process reuses the models it has already unpickled
+    assert pickle.loads(pickle.dumps(model)) is model2
+
+    with ProcessPoolExecutor(2) as executor:
+        results = list(executor.map(_pickled_log_density, [model] * 4, [x] * 4))
+    assert all(lp == model.log_density(x) for lp, _ in results)
+    assert len({ident for _, ident in results}) <= 2
+
+    # large data is written to a temporary file once
+    monkeypatch.setattr(bs.model, "PICKLE_DATA_INLINE_LIMIT", 10)
+    data = json.loads(bernoulli_data.read_text())
+    model3 = bs.StanModel(bernoulli_so, data)
+    pickled = pickle.dumps(model3)
+    assert model3.data.encode() not in pickled
+    tmp = model3._data_file
+    assert os.path.exists(tmp)
+    assert pickle.dumps(model3) == pickled
+    model4 = pickle.loads(pickled)
+    assert model4.log_density(x) == model.log_density(x)
+    del model3
+    assert not os.path.exists(tmp)
+
+
+def test_model_pool(monkeypatch):
+    fr_gaussian_so = STAN_FOLDER / "fr_gaussian" / "fr_gaussian_model.so"
+    fr_gaussian_data = STAN_FOLDER / "fr_gaussian" / "fr_gaussian.data.json"
+    model = bs.StanModel(fr_gaussian_so, fr_gaussian_data)
+    D = model.param_unc_num()
+    N = 37
+    rng = np.random.default_rng(1234)
+    theta_unc = rng.normal(size=(N, D))
+
+    # a small buffer makes the rows be sent in several chunks
+    with bs.ModelPool(
+        fr_gaussian_so, fr_gaussian_data, workers=3, buffer_size=64
+    ) as pool:
+        assert pool.workers == 3
+        lp, errors = pool.log_density_many(theta_unc)
+        assert not any(errors)
+        np.testing.assert_allclose(lp[3], model.log_density(theta_unc[3]))
+
+        lp, grad, errors = pool.log_density_gradient_many(theta_unc, jacobian=False)
+        assert not any(errors)
+        for i in range(N):
+            lp_i, grad_i = model.log_density_gradient(theta_unc[i], jacobian=False)
+            np.testing.assert_allclose(lp[i], lp_i)
+            np.testing.assert_allclose(grad[i], grad_i)
+
+        lp, grad, hess, errors = pool.log_density_hessian_many(theta_unc[:4])
+        assert hess.shape == (4, D, D)
+        for i in range(4):
+            _, _, hess_i = model.log_density_hessian(theta_unc[i])
+            np.testing.assert_allclose(hess[i], hess_i)
+
+        v = np.ones((4, D))
+        lp, hvp, errors = pool.log_density_hessian_vector_product_many(theta_unc[:4], v)
+        np.testing.assert_allclose(hvp, hess @ np.ones(D), atol=1e-6)
+
+        theta, errors = pool.param_constrain_many(theta_unc, include_tp=True)
+        for i in range(N):
+            np.testing.assert_allclose(
+                theta[i], model.param_constrain(theta_unc[i], include_tp=True)
+            )
+        theta, errors = pool.param_constrain_many(theta_unc)
+        theta_unc2, errors = pool.param_unconstrain_many(theta)
+        np.testing.assert_allclose(theta_unc, theta_unc2, atol=1e-8)
+
+        with pytest.raises(ValueError):
+            pool.log_density_many(theta_unc[:, :2])
+
+    with pytest.raises(RuntimeError):
+        pool.log_density_many(theta_unc)
+
+    with pytest.raises(ValueError):
+        bs.ModelPool(fr_gaussian_so, fr_gaussian_data, start_method="none")
+
+    # a worker which dies during a call closes the pool, so the results
+    # of the other workers are not read by the next call
+    pool = bs.ModelPool(fr_gaussian_so, fr_gaussian_data, workers=2, buffer_size=64)
+    real_wait = bs.pool.wait
+
+    def wait_and_kill(conns):
+        if pool._processes[0].is_alive():
+            pool._processes[0].kill()
+            pool._processes[0].join()
+        return real_wait(conns)
+
+    monkeypatch.setattr(bs.pool, "wait", wait_and_kill)
+    with pytest.raises(RuntimeError, match="exited"):
+        pool.log_density_many(theta_unc)
+    monkeypatch.setattr(bs.pool, "wait", real_wait)
+    with pytest.raises(RuntimeError, match="closed"):
+        pool.log_density_many(theta_unc)
+
+    throw_gq_so = STAN_FOLDER / "throw_gq" / "throw_gq_model.so"
+    with bs.ModelPool(throw_gq_so, workers=2, start_method="spawn") as pool:
+        theta, errors = pool.param_constrain_many(np.zeros((3, 1)), include_gq=True)
+        assert all("find this text: gqfails" in e for e in errors)
+        assert np.isnan(theta).all()
+        theta, errors = pool.param_constrain_many(np.zeros((3, 1)))
+        assert not any(errors)
+
+
+def test_workspace():
+    lib = STAN_FOLDER / "simple" / "simple_model.so"
+    data = STAN_FOLDER / "simple" / "simple.data.json"
+    model = bs.StanModel(lib, data)
+    ws = model.workspace(propto=False)
+
+    x = np.arange(5.0)
+    assert ws.log_density(x) == model.log_density(x, propto=False)
+
+    lp, grad = ws.log_density_gradient(x)
+    assert grad is ws.grad
+    lp2, grad2 = model.log_density_gradient(x, propto=False)
+    assert lp == lp2
+    np.testing.assert_equal(grad, grad2)
+
+    lp, grad, hess = ws.log_density_hessian(x)
+    assert grad is ws.grad and hess is ws.hessian
+    np.testing.assert_allclose(-np.eye(5), hess)
+
+    for n_threads in [2, 0]:
+        lp2, grad2, hess2 = ws.log_density_hessian(x, n_threads=n_threads)
+        assert lp2 == lp and hess2 is ws.hessian
+        np.testing.assert_allclose(-np.eye(5), hess2)
+
+    v = np.ones(5)
+    lp, hvp = ws.log_density_hessian_vector_product(x, v)
+    assert hvp is ws.hvp
+    np.testing.assert_allclose(-v, hvp)
+    hvp = hvp.copy()
+    lp2, hvp2 = ws.log_density_hessian_vector_product(x, v, n_threads=2)
+    assert lp2 == lp and hvp2 is ws.hvp
+    np.testing.assert_array_equal(hvp2, hvp)
+
+    # the buffers are reused by the next call
+    ws.log_density_gradient(x + 1)
+    np.testing.assert_equal(grad, -(x + 1))
+
+    with pytest.raises(ctypes.ArgumentError):
+        ws.log_density_gradient(np.zeros(4))
+
+    throw_lp = bs.StanModel(STAN_FOLDER / "throw_lp" / "throw_lp_model.so")
+    ws = throw_lp.workspace()
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="find this text: lpfails"):
+            ws.log_density(np.zeros(1))
+        with pytest.raises(RuntimeError, match="find this text: lpfails"):
+            ws.log_density_hessian(np.zeros(1))
+
+
+def test_objective():
+    lib = STAN_FOLDER / "simple" / "simple_model.so"
+    data = STAN_FOLDER / "simple" / "simple.data.json"
+    model = bs.StanModel(lib, data)
+    obj = model.objective(propto=False, cache_size=2)
+
+    x = np.arange(5.0)
+    lp, grad, hess = model.log_density_hessian(x, propto=False)
+    assert obj.fun(x) == -lp
+    np.testing.assert_equal(obj.jac(x), -grad)
+    assert obj.cache_info() == (1, 1, 2, 1)
+
+    f, g = obj.fun_and_jac(x.tolist())
+    assert f == -lp
+    np.testing.assert_equal(g, -grad)
+    assert obj.cache_info().hits == 2
+
+    # products do not form the Hessian, but reuse it once it is cached
+    p = np.ones(5)
+    np.testing.assert_allclose(obj.hessp(x, p), -hess @ p)
+    np.testing.assert_allclose(obj.hessp(x, 2 * p), -2 * hess @ p)
+    assert obj.cache_info() == (2, 1, 2, 1)
+    np.testing.assert_allclose(obj.hess(x), -hess)
+    np.testing.assert_allclose(obj.hessp(x, p), -hess @ p)
+    assert obj.cache_info() == (3, 2, 2, 1)
+
+    # least recently used points are evicted
+    obj.fun(x + 1)
+    obj.fun(x)
+    obj.fun(x + 2)
+    obj.fun(x + 1)
+    assert obj.cache_info() == (4, 5, 2, 2)
+
+    obj.cache_clear()
+    assert obj.cache_info() == (0, 0, 2, 0)
+
+    pos = model.objective(negate=False)
+    assert pos.fun(x) == model.log_density(x)
+
+    with pytest.raises(ValueError):
+        model.objective(cache_size=0)
+
+    scipy_optimize = pytest.importorskip("scipy.optimize")
+    obj = model.objective()
+    res = scipy_optimize.minimize(obj.fun, x, jac=obj.jac, method="BFGS")
+    np.testing.assert_allclose(res.x, np.zeros(5), atol=1e-5)
+    assert obj.cache_info().hits >= res.njev - 1
+
+
+@pytest.mark.skipif(
+    bs.model.FastModel is None, reason="compiled fast path is not built"
+)
+def test_fastcall():
+    lib = STAN_FOLDER / "simple" / "simple_model.so"
+    data = STAN_FOLDER / "simple" / "simple.data.json"
+    model = bs.StanModel(lib, data)
+    slow = bs.StanModel(lib, data, warn=False)
+    slow._fast = None
+
+    x = np.arange(5.0)
+    assert model.log_density(x, propto=False) == slow.log_density(x, propto=False)
+    lp, grad = model.log_density_gradient(x)
+    lp2, grad2 = slow.log_density_gradient(x)
+    assert lp == lp2
+    np.testing.assert_equal(grad, grad2)
+
+    out = np.zeros(5)
+    assert model.log_density_gradient(x, out=out)[1] is out
+    np.testing.assert_equal(out, grad2)
+
+    # inputs the fast path does not handle fall back to ctypes
+    x_ctypes = (ctypes.c_double * 5)(*x)
+    np.testing.assert_equal(model.log_density_gradient(x_ctypes)[1], grad2)
+    with pytest.raises(ctypes.ArgumentError):
+        model.log_density(np.arange(5, dtype=np.int64))
+    with pytest.raises(ctypes.ArgumentError):
+        model.log_density(np.arange(6.0))
+    with pytest.raises(ctypes.ArgumentError):
+        model.log_density(array.array("d", x))
+    with pytest.raises(ctypes.ArgumentError):
+        model.log_density(np.zeros((5, 2))[:, 0])
+    with pytest.raises(ctypes.ArgumentError):
+        model.log_density_gradient(x, out=np.zeros(4))
+
+    throw_lp = bs.StanModel(STAN_FOLDER / "throw_lp" / "throw_lp_model.so")
+    assert throw_lp._fast is not None
+    with pytest.raises(RuntimeError, match="find this text: lpfails"):
+        throw_lp.log_density(np.zeros(1))
+    with pytest.raises(RuntimeError, match="find this text: lpfails"):
+        throw_lp.log_density_gradient(np.zeros(1))
+
+
 @pytest.fixture(scope="module")
 def recompile_simple():
     """Recompile simple_model with autodiff hessian enable, then clean-up/restore it after test"""
@@ -817,3 +1856,40 @@ def test_hvp_autodiff(recompile_simple):
     x = np.random.uniform(size=D)
     lp, hvp = model.log_density_hessian_vector_product(y, x)
     np.testing.assert_allclose(-x, hvp)
+
+
+@pytest.fixture(scope="module")
+def recompile_logistic_threads():
+    """Recompile logistic_model with autodiff hessian and threads enabled, then clean-up/restore it after test"""
+
+    stanfile = STAN_FOLDER / "logistic" / "logistic.stan"
+    lib = bs.compile.generate_so_name(stanfile)
+    lib.unlink(missing_ok=True)
+    res = bs.compile_model(
+        stanfile, make_args=["BRIDGESTAN_AD_HESSIAN=true", "STAN_THREADS=true"]
+    )
+
+    yield res
+
+    lib.unlink(missing_ok=True)
+    bs.compile_model(stanfile, make_args=["STAN_THREADS=true"])
+
+
+@pytest.mark.ad_hessian
+def test_hessian_autodiff_parallel(recompile_logistic_threads):
+    data = STAN_FOLDER / "logistic" / "logistic.data.json"
+    model = bs.StanModel(recompile_logistic_threads, data)
+    info = model.model_info()
+    assert "BRIDGESTAN_AD_HESSIAN=true" in info
+    assert "STAN_THREADS=true" in info
+    D = model.param_unc_num()
+    assert D > 1
+    y = np.random.default_rng(18).normal(size=D)
+    lp, grad, hess = model.log_density_hessian(y)
+    # the Hessian of this model is not diagonal
+    assert np.count_nonzero(hess - np.diag(np.diag(hess)))
+    for n_threads in [2, 0]:
+        lp2, grad2, hess2 = model.log_density_hessian(y, n_threads=n_threads)
+        assert lp2 == lp
+        np.testing.assert_array_equal(grad2, grad)
+        np.testing.assert_array_equal(hess2, hess)
@@ -0,0 +1,181 @@
+#ifndef BRIDGESTAN_BATCH_HPP
+#define BRIDGESTAN_BATCH_HPP
+
+#include <algorithm>
+#include <atomic>
+#include <cstring>
+#include <exception>
+#include <sstream>
+#include <string>
+#include <thread>
+#include <vector>
+
+#ifdef STAN_THREADS
+#include <tbb/blocked_range.h>
+#include <tbb/parallel_for.h>
+#include <tbb/partitioner.h>
+#include <tbb/task_arena.h>
+#endif
+
+namespace bridgestan {
+
+/**
+ * Return the number of workers to use for a batch of `n` rows when
+ * `n_threads` were requested. Values of `n_threads` less than 1 select
+ * the number of hardware threads. Without `STAN_THREADS`, the autodiff
+ * stack is a global, so batches are always evaluated by a single worker.
+ *
+ * @param[in] n_threads requested number of threads
+ * @param[in] n number of rows in the batch
+ * @return number of workers, between 1 and `max(n, 1)`
+ */
+inline int num_workers(int n_threads, size_t n) {
+#ifdef STAN_THREADS
+  if (n_threads < 1)
+    n_threads = std::max(1u, std::thread::hardware_concurrency());
+  if (static_cast<size_t>(n_threads) > n)
+    n_threads = static_cast<int>(std::max<size_t>(n, 1));
+  return n_threads;
+#else
+  return 1;
+#endif
+}
+
+/**
+ * Call `run_chunk(w)` for each worker index `w` in `[0, workers)`, on
+ * separate threads if there is more than one worker.
+ *
+ * @param[in] workers number of workers, see num_workers()
+ * @param[in] run_chunk function to call with each worker index
+ */
+template <typename F>
+inline void run_workers(int workers, F& run_chunk) {
+#ifdef STAN_THREADS
+  if (workers > 1) {
+    // TBB's worker threads persist between calls, so each keeps the
+    // thread-local autodiff stack it set up on its first evaluation
+    tbb::task_arena arena(workers);
+    arena.execute([&]() {
+      tbb::parallel_for(
+          tbb::blocked_range<int>(0, workers, 1),
+          [&](const tbb::blocked_range<int>& r) {
+            for (int w = r.begin(); w < r.end(); ++w)
+              run_chunk(w);
+          },
+          tbb::simple_partitioner());
+    });
+    return;
+  }
+#endif
+  run_chunk(0);
+}
+
+/**
+ * Call `f(i)` for each index `i` in `[0, n)`, split between
+ * `num_workers(n_threads, n)` workers as in for_each_row(). Unlike
+ * for_each_row(), this is all or nothing: once any call throws, the
+ * remaining indices are skipped and the exception is rethrown on the
+ * calling thread.
+ *
+ * @param[in] n number of indices
+ * @param[in] n_threads number of threads to use, see num_workers()
+ * @param[in] f function to call on each index
+ */
+template <typename F>
+inline void for_each_index(size_t n, int n_threads, F f) {
+  const int workers = num_workers(n_threads, n);
+  std::vector<std::exception_ptr> errors(workers);
+  std::atomic<bool> failed(false);
+
+  auto run_chunk = [&](int w) {
+    size_t begin = n * w / workers;
+    size_t end = n * (w + 1) / workers;
+    try {
+      for (size_t i = begin; i < end && !failed.load(); ++i)
+        f(i);
+    } catch (...) {
+      errors[w] = std::current_exception();
+      failed.store(true);
+    }
+  };
+  run_workers(workers, run_chunk);
+
+  for (auto& error : errors)
+    if (error)
+      std::rethrow_exception(error);
+}
+
+/**
+ * Call `f(i, w)` for each row `i` in `[0, n)` of a batch, where `w` is
+ * the index of the worker evaluating the row. The rows are split into
+ * `num_workers(n_threads, n)` contiguous chunks, and worker `w` always
+ * evaluates chunk `w` in order, so per-worker state such as an RNG gives
+ * reproducible results for a fixed number of threads.
+ *
+ * Unlike handle_errors(), a failure in one row does not stop the others:
+ * the outcome of each row is recorded in `status` (0 for success and -1
+ * for failure), and the message of the first failing row is reported
+ * through `error_msg`.
+ *
+ * @param[in] name name of the calling function, used in error messages
+ * @param[in] n number of rows
+ * @param[in] n_threads number of threads to use, see num_workers()
+ * @param[out] status array of length `n` to record the outcome of each
+ * row, or `nullptr`
+ * @param[out] error_msg a pointer to a string that will be allocated if
+ * any row fails, or `nullptr`
+ * @param[in] f function to call on each row and worker index
+ * @return 0 if every row succeeded and -1 otherwise
+ */
+template <typename F>
+inline int for_each_row(const char* name, size_t n, int n_threads, int* status,
+                        char** error_msg, F f) {
+  const int workers = num_workers(n_threads, n);
+  std::vector<size_t> first_failure(workers, n);
+  std::vector<std::string> first_error(workers);
+
+  auto run_chunk = [&](int w) {
+    size_t begin = n * w / workers;
+    size_t end = n * (w + 1) / workers;
+    for (size_t i = begin; i < end; ++i) {
+      int rc = 0;
+      try {
+        f(i, w);
+      } catch (const std::exception& e) {
+        rc = -1;
+        if (first_failure[w] == n) {
+          first_failure[w] = i;
+          first_error[w] = std::string("with exception: ") + e.what();
+        }
+      } catch (...) {
+        rc = -1;
+        if (first_failure[w] == n) {
+          first_failure[w] = i;
+          first_error[w] = "with unknown exception";
+        }
+      }
+      if (status)
+        status[i] = rc;
+    }
+  };
+
+  run_workers(workers, run_chunk);
+
+  // chunks are in row order, so the first worker with a failure has
+  // the first failing row
+  for (int w = 0; w < workers; ++w) {
+    if (first_failure[w] == n)
+      continue;
+    if (error_msg) {
+      std::stringstream error;
+      error << name << "() failed for row " << first_failure[w] << " "
+            << first_error[w] << std::endl;
+      *error_msg = strdup(error.str().c_str());
+    }
+    return -1;
+  }
+  return 0;
+}
+
+}  // namespace bridgestan
+#endif
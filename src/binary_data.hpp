@@ -0,0 +1,217 @@
+#ifndef BRIDGESTAN_BINARY_DATA_HPP
+#define BRIDGESTAN_BINARY_DATA_HPP
+
+#include <cstdint>
+#include <cstring>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+#ifdef _WIN32
+#ifndef NOMINMAX
+#define NOMINMAX
+#endif
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+#include "bridgestan.h"
+
+namespace bridgestan {
+
+/**
+ * A read-only memory mapping of a whole file, unmapped on destruction.
+ * Processes which map the same file share its pages in the page cache.
+ */
+class mapped_file {
+ public:
+  explicit mapped_file(const std::string& path) {
+#ifdef _WIN32
+    file_ = CreateFileA(path.c_str(), GENERIC_READ, FILE_SHARE_READ, nullptr,
+                        OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, nullptr);
+    if (file_ == INVALID_HANDLE_VALUE)
+      throw std::runtime_error("Cannot read input file: " + path);
+    LARGE_INTEGER size;
+    if (!GetFileSizeEx(file_, &size)) {
+      CloseHandle(file_);
+      throw std::runtime_error("Cannot read input file: " + path);
+    }
+    size_ = static_cast<size_t>(size.QuadPart);
+    if (size_ > 0) {
+      mapping_
+          = CreateFileMappingA(file_, nullptr, PAGE_READONLY, 0, 0, nullptr);
+      if (mapping_ != nullptr)
+        data_ = static_cast<const char*>(
+            MapViewOfFile(mapping_, FILE_MAP_READ, 0, 0, 0));
+      if (data_ == nullptr) {
+        if (mapping_ != nullptr)
+          CloseHandle(mapping_);
+        CloseHandle(file_);
+        throw std::runtime_error("Cannot map input file: " + path);
+      }
+    }
+#else
+    int fd = open(path.c_str(), O_RDONLY);
+    if (fd < 0)
+      throw std::runtime_error("Cannot read input file: " + path);
+    struct stat st;
+    if (fstat(fd, &st) != 0) {
+      close(fd);
+      throw std::runtime_error("Cannot read input file: " + path);
+    }
+    size_ = static_cast<size_t>(st.st_size);
+    if (size_ > 0) {
+      void* p = mmap(nullptr, size_, PROT_READ, MAP_SHARED, fd, 0);
+      if (p == MAP_FAILED) {
+        close(fd);
+        throw std::runtime_error("Cannot map input file: " + path);
+      }
+      data_ = static_cast<const char*>(p);
+    }
+    close(fd);
+#endif
+  }
+
+  mapped_file(const mapped_file&) = delete;
+  mapped_file& operator=(const mapped_file&) = delete;
+
+  ~mapped_file() {
+#ifdef _WIN32
+    if (data_ != nullptr)
+      UnmapViewOfFile(data_);
+    if (mapping_ != nullptr)
+      CloseHandle(mapping_);
+    CloseHandle(file_);
+#else
+    if (data_ != nullptr)
+      munmap(const_cast<char*>(data_), size_);
+#endif
+  }
+
+  const char* data() const { return data_; }
+  size_t size() const { return size_; }
+
+ private:
+  const char* data_ = nullptr;
+  size_t size_ = 0;
+#ifdef _WIN32
+  HANDLE file_ = INVALID_HANDLE_VALUE;
+  HANDLE mapping_ = nullptr;
+#endif
+};
+
+/**
+ * The table of buffers in a BridgeStan binary data file, which point into
+ * a memory mapping of the file.
+ *
+ * The file consists of a header followed by the arrays:
+ *
+ *  - 8 bytes: the magic string `BSDATA\0` and a format version byte, 1
+ *  - `uint32`: the byte order mark `0x01020304`
+ *  - `uint32`: the number of variables
+ *  - for each variable:
+ *    - `uint32`: the length of its name, then the name in UTF-8
+ *    - `uint32`: its type, a `bs_data_type`
+ *    - `uint32`: its number of dimensions, then that many `uint64` sizes
+ *    - `uint64`: the offset from the start of the file of its values,
+ *      which are stored contiguously in row-major order
+ *
+ * All numbers are in the byte order of the machine which wrote the file,
+ * which must match the machine reading it.
+ */
+class binary_data {
+ public:
+  static constexpr char MAGIC[8] = {'B', 'S', 'D', 'A', 'T', 'A', '\0', 1};
+  static constexpr std::uint32_t BYTE_ORDER_MARK = 0x01020304;
+
+  explicit binary_data(const std::string& path) : file_(path), path_(path) {
+    const char* p = file_.data();
+    const char* end = p + file_.size();
+    if (file_.size() < sizeof(MAGIC)
+        || std::memcmp(p, MAGIC, sizeof(MAGIC)) != 0)
+      fail("not a BridgeStan binary data file");
+    p += sizeof(MAGIC);
+    if (read<std::uint32_t>(p, end) != BYTE_ORDER_MARK)
+      fail("file was written on a machine with a different byte order");
+
+    std::uint32_t n = read<std::uint32_t>(p, end);
+    names_.reserve(n);
+    shapes_.reserve(n);
+    buffers_.resize(n);
+    for (std::uint32_t i = 0; i < n; ++i) {
+      std::uint32_t name_len = read<std::uint32_t>(p, end);
+      if (static_cast<size_t>(end - p) < name_len)
+        fail("truncated header");
+      names_.emplace_back(p, name_len);
+      p += name_len;
+
+      bs_data_buffer& buf = buffers_[i];
+      std::uint32_t type = read<std::uint32_t>(p, end);
+      if (type != BS_DATA_FLOAT64 && type != BS_DATA_INT32
+          && type != BS_DATA_INT64)
+        fail("unknown type for variable " + names_.back());
+      buf.type = static_cast<bs_data_type>(type);
+      std::uint32_t ndim = read<std::uint32_t>(p, end);
+      shapes_.emplace_back(ndim);
+      size_t bytes = type == BS_DATA_INT32 ? 4 : 8;
+      for (std::uint32_t d = 0; d < ndim; ++d) {
+        std::uint64_t dim = read<std::uint64_t>(p, end);
+        if (dim != 0 && bytes > file_.size() / dim)
+          fail("variable " + names_.back() + " is larger than the file");
+        shapes_.back()[d] = static_cast<size_t>(dim);
+        bytes *= static_cast<size_t>(dim);
+      }
+      std::uint64_t offset = read<std::uint64_t>(p, end);
+      if (offset > file_.size() || bytes > file_.size() - offset)
+        fail("variable " + names_.back() + " is larger than the file");
+
+      buf.ndim = static_cast<int>(ndim);
+      buf.shape = shapes_.back().data();
+      buf.strides = nullptr;
+      buf.data = file_.data() + offset;
+    }
+    for (std::uint32_t i = 0; i < n; ++i)
+      buffers_[i].name = names_[i].c_str();
+  }
+
+  /**
+   * Return the table of buffers, which is valid for the lifetime of
+   * this object.
+   */
+  const bs_data_buffer* buffers() const { return buffers_.data(); }
+
+  /**
+   * Return the number of buffers.
+   */
+  size_t size() const { return buffers_.size(); }
+
+ private:
+  mapped_file file_;
+  std::string path_;
+  std::vector<std::string> names_;
+  std::vector<std::vector<size_t>> shapes_;
+  std::vector<bs_data_buffer> buffers_;
+
+  [[noreturn]] void fail(const std::string& msg) const {
+    throw std::runtime_error("Error reading binary data file " + path_ + ": "
+                             + msg);
+  }
+
+  template <typename T>
+  T read(const char*& p, const char* end) const {
+    if (static_cast<size_t>(end - p) < sizeof(T))
+      fail("truncated header");
+    T x;
+    std::memcpy(&x, p, sizeof(T));
+    p += sizeof(T);
+    return x;
+  }
+};
+
+}  // namespace bridgestan
+
+#endif
@@ -4,9 +4,11 @@
 #include "callback_stream.hpp"
 #include "version.hpp"
 #include "util.hpp"
+#include "batch.hpp"
 
 #include "bridgestanR.cpp"
 
+using bridgestan::for_each_row;
 using bridgestan::handle_errors;
 
 const int bs_major_version = BRIDGESTAN_MAJOR;
@@ -19,6 +21,12 @@ bs_model* bs_model_construct(const char* data, unsigned int seed,
                        [&]() { return new bs_model(data, seed); });
 }
 
+bs_model* bs_model_construct_buffers(const bs_data_buffer* buffers, size_t n,
+                                     unsigned int seed, char** error_msg) {
+  return handle_errors("construct", error_msg,
+                       [&]() { return new bs_model(buffers, n, seed); });
+}
+
 void bs_model_destruct(bs_model* m) { delete (m); }
 
 void bs_free_error_msg(char* error_msg) { free(error_msg); }
@@ -62,6 +70,85 @@ int bs_param_constrain(const bs_model* m, bool include_tp, bool include_gq,
   });
 }
 
+int bs_param_constrain_batch(const bs_model* m, bool include_tp,
+                             bool include_gq, size_t n, const double* theta_unc,
+                             double* theta, bs_rng** rngs, int n_threads,
+                             int* status, char** error_msg) {
+  return handle_errors("param_constrain_batch", error_msg, [&]() {
+    if (include_gq && rngs == nullptr)
+      throw std::invalid_argument("include_gq=true but rngs=nullptr");
+    if (rngs != nullptr && n_threads < 1)
+      throw std::invalid_argument("n_threads must be positive if rngs are set");
+
+    // SAFETY: as in bs_param_constrain, this is never advanced
+    static stan::rng_t dummy_rng(0);
+    size_t N = m->param_unc_num();
+    size_t P = m->param_num(include_tp, include_gq);
+    return for_each_row(
+        "param_constrain_batch", n, n_threads, status, error_msg,
+        [&](size_t i, int w) {
+          stan::rng_t& rng = rngs == nullptr ? dummy_rng : rngs[w]->rng_;
+          m->param_constrain(include_tp, include_gq, theta_unc + i * N,
+                             theta + i * P, rng);
+        });
+  });
+}
+
+// throws if any of the columns is not a constrained parameter
+static void check_columns(const bs_model* m, bool include_tp, bool include_gq,
+                          size_t n_columns, const size_t* columns) {
+  size_t P = m->param_num(include_tp, include_gq);
+  for (size_t j = 0; j < n_columns; ++j)
+    if (columns[j] >= P)
+      throw std::out_of_range("column index " + std::to_string(columns[j])
+                              + " is out of range for " + std::to_string(P)
+                              + " parameters");
+}
+
+int bs_param_constrain_columns(const bs_model* m, bool include_tp,
+                               bool include_gq, const double* theta_unc,
+                               size_t n_columns, const size_t* columns,
+                               double* theta, bs_rng* rng, char** error_msg) {
+  return handle_errors("param_constrain_columns", error_msg, [&]() {
+    if (include_gq && rng == nullptr)
+      throw std::invalid_argument("include_gq=true but rng=nullptr");
+    check_columns(m, include_tp, include_gq, n_columns, columns);
+    // SAFETY: as in bs_param_constrain, this is never advanced
+    static stan::rng_t dummy_rng(0);
+    m->param_constrain_columns(include_tp, include_gq, theta_unc, n_columns,
+                               columns, theta,
+                               rng == nullptr ? dummy_rng : rng->rng_);
+    return 0;
+  });
+}
+
+int bs_param_constrain_columns_batch(const bs_model* m, bool include_tp,
+                                     bool include_gq, size_t n,
+                                     const double* theta_unc, size_t n_columns,
+                                     const size_t* columns, double* theta,
+                                     bs_rng** rngs, int n_threads, int* status,
+                                     char** error_msg) {
+  return handle_errors("param_constrain_columns_batch", error_msg, [&]() {
+    if (include_gq && rngs == nullptr)
+      throw std::invalid_argument("include_gq=true but rngs=nullptr");
+    if (rngs != nullptr && n_threads < 1)
+      throw std::invalid_argument("n_threads must be positive if rngs are set");
+    check_columns(m, include_tp, include_gq, n_columns, columns);
+
+    // SAFETY: as in bs_param_constrain, this is never advanced
+    static stan::rng_t dummy_rng(0);
+    size_t N = m->param_unc_num();
+    return for_each_row("param_constrain_columns_batch", n, n_threads, status,
+                        error_msg, [&](size_t i, int w) {
+                          stan::rng_t& rng
+                              = rngs == nullptr ? dummy_rng : rngs[w]->rng_;
+                          m->param_constrain_columns(
+                              include_tp, include_gq, theta_unc + i * N,
+                              n_columns, columns, theta + i * n_columns, rng);
+                        });
+  });
+}
+
 int bs_param_unconstrain(const bs_model* m, const double* theta,
                          double* theta_unc, char** error_msg) {
   return handle_errors("param_unconstrain", error_msg, [&]() {
@@ -78,6 +165,57 @@ int bs_param_unconstrain_json(const bs_model* m, const char* json,
   });
 }
 
+int bs_param_unconstrain_buffers(const bs_model* m,
+                                 const bs_data_buffer* buffers, size_t n,
+                                 double* theta_unc, char** error_msg) {
+  return handle_errors("param_unconstrain_buffers", error_msg, [&]() {
+    m->param_unconstrain_buffers(buffers, n, theta_unc);
+    return 0;
+  });
+}
+
+int bs_param_unconstrain_batch(const bs_model* m, size_t n, const double* theta,
+                               double* theta_unc, int n_threads, int* status,
+                               char** error_msg) {
+  return handle_errors("param_unconstrain_batch", error_msg, [&]() {
+    size_t P = m->param_num(false, false);
+    size_t N = m->param_unc_num();
+    return for_each_row("param_unconstrain_batch", n, n_threads, status,
+                        error_msg, [&](size_t i, int) {
+                          m->param_unconstrain(theta + i * P,
+                                               theta_unc + i * N);
+                        });
+  });
+}
+
+int bs_param_unconstrain_json_batch(const bs_model* m, size_t n,
+                                    const char** json, double* theta_unc,
+                                    int n_threads, int* status,
+                                    char** error_msg) {
+  return handle_errors("param_unconstrain_json_batch", error_msg, [&]() {
+    size_t N = m->param_unc_num();
+    return for_each_row("param_unconstrain_json_batch", n, n_threads, status,
+                        error_msg, [&](size_t i, int) {
+                          m->param_unconstrain_json(json[i], theta_unc + i * N);
+                        });
+  });
+}
+
+int bs_param_unconstrain_buffers_batch(const bs_model* m, size_t n,
+                                       const bs_data_buffer* const* buffers,
+                                       const size_t* n_buffers,
+                                       double* theta_unc, int n_threads,
+                                       int* status, char** error_msg) {
+  return handle_errors("param_unconstrain_buffers_batch", error_msg, [&]() {
+    size_t N = m->param_unc_num();
+    return for_each_row("param_unconstrain_buffers_batch", n, n_threads, status,
+                        error_msg, [&](size_t i, int) {
+                          m->param_unconstrain_buffers(buffers[i], n_buffers[i],
+                                                       theta_unc + i * N);
+                        });
+  });
+}
+
 int bs_log_density(const bs_model* m, bool propto, bool jacobian,
                    const double* theta_unc, double* val, char** error_msg) {
   return handle_errors("log_density", error_msg, [&]() {
@@ -95,6 +233,22 @@ int bs_log_density_gradient(const bs_model* m, bool propto, bool jacobian,
   });
 }
 
+int bs_log_density_gradient_batch(const bs_model* m, bool propto, bool jacobian,
+                                  size_t n, const double* theta_unc,
+                                  double* val, double* grad, int n_threads,
+                                  int* status, char** error_msg) {
+  return handle_errors("log_density_gradient_batch", error_msg, [&]() {
+    size_t N = m->param_unc_num();
+    return for_each_row("log_density_gradient_batch", n, n_threads, status,
+                        error_msg, [&](size_t i, int) {
+                          val[i] = std::numeric_limits<double>::quiet_NaN();
+                          m->log_density_gradient(propto, jacobian,
+                                                  theta_unc + i * N, val + i,
+                                                  grad + i * N);
+                        });
+  });
+}
+
 int bs_log_density_hessian(const bs_model* m, bool propto, bool jacobian,
                            const double* theta_unc, double* val, double* grad,
                            double* hessian, char** error_msg) {
@@ -104,6 +258,17 @@ int bs_log_density_hessian(const bs_model* m, bool propto, bool jacobian,
   });
 }
 
+int bs_log_density_hessian_parallel(const bs_model* m, bool propto,
+                                    bool jacobian, const double* theta_unc,
+                                    double* val, double* grad, double* hessian,
+                                    int n_threads, char** error_msg) {
+  return handle_errors("log_density_hessian_parallel", error_msg, [&]() {
+    m->log_density_hessian(propto, jacobian, theta_unc, val, grad, hessian,
+                           n_threads);
+    return 0;
+  });
+}
+
 int bs_log_density_hessian_vector_product(const bs_model* m, bool propto,
                                           bool jacobian,
                                           const double* theta_unc,
@@ -116,6 +281,19 @@ int bs_log_density_hessian_vector_product(const bs_model* m, bool propto,
   });
 }
 
+int bs_log_density_hessian_matrix_product(const bs_model* m, bool propto,
+                                          bool jacobian,
+                                          const double* theta_unc, size_t k,
+                                          const double* vectors, double* val,
+                                          double* grad, double* hmp,
+                                          int n_threads, char** error_msg) {
+  return handle_errors("log_density_hessian_matrix_product", error_msg, [&]() {
+    m->log_density_hessian_matrix_product(propto, jacobian, theta_unc, k,
+                                          vectors, val, grad, hmp, n_threads);
+    return 0;
+  });
+}
+
 bs_rng* bs_rng_construct(unsigned int seed, char** error_msg) {
   return handle_errors("construct_rng", error_msg,
                        [&]() { return new bs_rng(seed); });
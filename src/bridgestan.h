@@ -41,10 +41,12 @@ BS_PUBLIC extern const int bs_patch_version;
  * Construct an instance of a model wrapper.
  * Data must be encoded in JSON in the
  * <a href="https://mc-stan.org/docs/cmdstan-guide/json.html">JSON Format for
- * CmdStan</a>.
+ * CmdStan</a>, or in the binary format described in `binary_data.hpp`.
  *
  * @param[in] data C-style string. This is either a
  * path to JSON-encoded data file (must end with ".json"),
+ * a path to a BridgeStan binary data file (must end with ".bsdata"),
+ * which is memory mapped rather than parsed,
  * a JSON string literal, or nullptr. An empty string or null
  * pointer are both interpreted as no data.
  * @param[in] seed seed for PRNG used during model construction.
@@ -58,6 +60,54 @@ BS_PUBLIC extern const int bs_patch_version;
 BS_PUBLIC bs_model* bs_model_construct(const char* data, unsigned int seed,
                                        char** error_msg);
 
+/**
+ * Element types of the buffers in a ::bs_data_buffer.
+ */
+typedef enum {
+  BS_DATA_FLOAT64 = 0,  ///< `double`, read as real data
+  BS_DATA_INT32 = 1,    ///< 32-bit signed integer, read as integer data
+  BS_DATA_INT64 = 2,    ///< 64-bit signed integer, read as integer data
+} bs_data_type;
+
+/**
+ * A named, typed, strided array of data, as used by
+ * bs_model_construct_buffers(). This mirrors the layout of a NumPy array.
+ *
+ * Scalars have `ndim` 0. Complex data is passed as real data with a
+ * trailing dimension of size 2 holding the real and imaginary parts, as
+ * in the JSON format.
+ */
+typedef struct {
+  const char* name;          ///< name of the variable
+  bs_data_type type;         ///< type of the elements
+  int ndim;                  ///< number of dimensions
+  const size_t* shape;       ///< `ndim` sizes, may be null if `ndim` is 0
+  const ptrdiff_t* strides;  ///< `ndim` strides in bytes, or null if the
+                             ///< array is contiguous in row-major order
+  const void* data;          ///< pointer to the first element
+} bs_data_buffer;
+
+/**
+ * Construct an instance of a model wrapper from data held in memory,
+ * rather than encoded as JSON.
+ *
+ * The buffers are read in place while the model is constructed, without
+ * being serialized or parsed, and are not referenced afterwards.
+ *
+ * @param[in] buffers array of `n` data buffers. Names must be unique.
+ * @param[in] n number of buffers, which may be 0 if the model has no data
+ * @param[in] seed seed for PRNG used during model construction.
+ * This PRNG is used for RNG functions in the `transformed data`
+ * block of the model, and then discarded.
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This must later be freed by calling bs_free_error_msg().
+ * @return pointer to constructed model or `nullptr` if construction
+ * fails
+ */
+BS_PUBLIC bs_model* bs_model_construct_buffers(const bs_data_buffer* buffers,
+                                               size_t n, unsigned int seed,
+                                               char** error_msg);
+
 /**
  * Destroy the model.
  *
@@ -184,6 +234,117 @@ BS_PUBLIC int bs_param_constrain(const bs_model* m, bool include_tp,
                                  bool include_gq, const double* theta_unc,
                                  double* theta, bs_rng* rng, char** error_msg);
 
+/**
+ * Set the constrained parameters of a batch of `n` points, including
+ * transformed parameters and/or generated quantities as specified.
+ * This is equivalent to calling bs_param_constrain() on each point, but
+ * a failure at one point does not prevent the others from being
+ * evaluated.
+ *
+ * The points are stored contiguously in row-major order, so point `i`
+ * begins at `theta_unc + i * D` and its constrained parameters are
+ * written to `theta + i * P`, where `D` is the number of unconstrained
+ * parameters and `P` is the number returned by bs_param_num() with the
+ * same `include_tp` and `include_gq`.
+ *
+ * If the model was compiled with `STAN_THREADS`, the points are split
+ * into `n_threads` contiguous chunks which are evaluated concurrently,
+ * and chunk `w` draws its random numbers from `rngs[w]`. Results are
+ * therefore reproducible for a fixed set of RNGs and number of threads.
+ * Otherwise, `n_threads` is ignored and only `rngs[0]` is used.
+ *
+ * @param[in] m pointer to model structure
+ * @param[in] include_tp `true` to include transformed parameters
+ * @param[in] include_gq `true` to include generated quantities
+ * @param[in] n number of points in the batch
+ * @param[in] theta_unc `n` x `D` array of unconstrained parameters
+ * @param[out] theta `n` x `P` array of constrained parameters
+ * @param[in] rngs array of `n_threads` pointers to pseudorandom number
+ * generators created by bs_rng_construct(). This is only required when
+ * `include_gq` is `true`, otherwise it can be null.
+ * @param[in] n_threads number of threads to use. Values less than 1 use
+ * one thread per available hardware thread, which is only allowed when
+ * `rngs` is null.
+ * @param[out] status array of `n` codes to set, 0 for each point which was
+ * evaluated successfully and -1 for each point which failed. May be null.
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This describes the first point which failed and must later be
+ * freed by calling bs_free_error_msg().
+ * @return code 0 if every point was successful and code -1 if there is an
+ * exception in the underlying Stan code for any point
+ */
+BS_PUBLIC int bs_param_constrain_batch(const bs_model* m, bool include_tp,
+                                       bool include_gq, size_t n,
+                                       const double* theta_unc, double* theta,
+                                       bs_rng** rngs, int n_threads,
+                                       int* status, char** error_msg);
+
+/**
+ * Set only the specified columns of the constrained parameters of the
+ * specified point, as computed by bs_param_constrain(), and return a
+ * return code of 0 for success and -1 if there is an exception executing
+ * the Stan program or a column index is out of range.
+ *
+ * Column `columns[j]` is written to `theta[j]`, so `theta` only needs
+ * space for `n_columns` values however many parameters the model has.
+ *
+ * @param[in] m pointer to model structure
+ * @param[in] include_tp `true` to include transformed parameters
+ * @param[in] include_gq `true` to include generated quantities
+ * @param[in] theta_unc sequence of unconstrained parameters
+ * @param[in] n_columns number of columns to set
+ * @param[in] columns indices of the columns to set, each less than the
+ * number returned by bs_param_num() with the same `include_tp` and
+ * `include_gq`
+ * @param[out] theta array of `n_columns` constrained parameters to set
+ * @param[in] rng pointer to pseudorandom number generator, as for
+ * bs_param_constrain()
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This must later be freed by calling bs_free_error_msg().
+ * @return code 0 if successful and code -1 if there is an exception
+ * in the underlying Stan code
+ */
+BS_PUBLIC int bs_param_constrain_columns(const bs_model* m, bool include_tp,
+                                         bool include_gq,
+                                         const double* theta_unc,
+                                         size_t n_columns,
+                                         const size_t* columns, double* theta,
+                                         bs_rng* rng, char** error_msg);
+
+/**
+ * Set only the specified columns of the constrained parameters of a batch
+ * of `n` points, as computed by bs_param_constrain_batch(). The selected
+ * columns of point `i` are written to `theta + i * n_columns`.
+ *
+ * If a column index is out of range, no point is evaluated and -1 is
+ * returned.
+ *
+ * @param[in] m pointer to model structure
+ * @param[in] include_tp `true` to include transformed parameters
+ * @param[in] include_gq `true` to include generated quantities
+ * @param[in] n number of points in the batch
+ * @param[in] theta_unc `n` x `D` array of unconstrained parameters
+ * @param[in] n_columns number of columns to set for each point
+ * @param[in] columns indices of the columns to set, as for
+ * bs_param_constrain_columns()
+ * @param[out] theta `n` x `n_columns` array of constrained parameters
+ * @param[in] rngs array of pointers to pseudorandom number generators, as
+ * for bs_param_constrain_batch()
+ * @param[in] n_threads number of threads to use, as for
+ * bs_param_constrain_batch()
+ * @param[out] status array of `n` codes to set, 0 for each point which was
+ * evaluated successfully and -1 for each point which failed. May be null.
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This describes the first point which failed and must later be
+ * freed by calling bs_free_error_msg().
+ * @return code 0 if every point was successful and code -1 if there is an
+ * exception in the underlying Stan code for any point
+ */
+BS_PUBLIC int bs_param_constrain_columns_batch(
+    const bs_model* m, bool include_tp, bool include_gq, size_t n,
+    const double* theta_unc, size_t n_columns, const size_t* columns,
+    double* theta, bs_rng** rngs, int n_threads, int* status, char** error_msg);
+
 /**
  * Set the sequence of unconstrained parameters based on the
  * specified constrained parameters, and return a return code of 0
@@ -221,6 +382,128 @@ BS_PUBLIC int bs_param_unconstrain(const bs_model* m, const double* theta,
 BS_PUBLIC int bs_param_unconstrain_json(const bs_model* m, const char* json,
                                         double* theta_unc, char** error_msg);
 
+/**
+ * Set the sequence of unconstrained parameters based on the constrained
+ * parameters held in memory as named arrays, and return a return code of
+ * 0 for success and -1 for failure. This is equivalent to
+ * bs_param_unconstrain_json(), but the buffers are read in place, as for
+ * bs_model_construct_buffers(), without being serialized or parsed.
+ *
+ * @param[in] m pointer to model structure
+ * @param[in] buffers array of `n` parameter buffers. Names must be unique.
+ * @param[in] n number of buffers
+ * @param[out] theta_unc sequence of unconstrained parameters
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This must later be freed by calling bs_free_error_msg().
+ * @return code 0 if successful and code -1 if there is an exception
+ * in the underlying Stan code
+ */
+BS_PUBLIC int bs_param_unconstrain_buffers(const bs_model* m,
+                                           const bs_data_buffer* buffers,
+                                           size_t n, double* theta_unc,
+                                           char** error_msg);
+
+/**
+ * Set the unconstrained parameters of a batch of `n` points. This is
+ * equivalent to calling bs_param_unconstrain() on each point, but a
+ * failure at one point does not prevent the others from being
+ * evaluated.
+ *
+ * The points are stored contiguously in row-major order, so point `i`
+ * begins at `theta + i * P` and its unconstrained parameters are
+ * written to `theta_unc + i * D`, where `P` is the number of
+ * parameters and `D` is the number of unconstrained parameters.
+ *
+ * If the model was compiled with `STAN_THREADS`, the points are split
+ * into `n_threads` contiguous chunks which are evaluated concurrently.
+ * Otherwise, `n_threads` is ignored and the points are evaluated in order.
+ *
+ * @param[in] m pointer to model structure
+ * @param[in] n number of points in the batch
+ * @param[in] theta `n` x `P` array of constrained parameters
+ * @param[out] theta_unc `n` x `D` array of unconstrained parameters
+ * @param[in] n_threads number of threads to use. Values less than 1 use
+ * one thread per available hardware thread.
+ * @param[out] status array of `n` codes to set, 0 for each point which was
+ * evaluated successfully and -1 for each point which failed. May be null.
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This describes the first point which failed and must later be
+ * freed by calling bs_free_error_msg().
+ * @return code 0 if every point was successful and code -1 if there is an
+ * exception in the underlying Stan code for any point
+ */
+BS_PUBLIC int bs_param_unconstrain_batch(const bs_model* m, size_t n,
+                                         const double* theta, double* theta_unc,
+                                         int n_threads, int* status,
+                                         char** error_msg);
+
+/**
+ * Set the unconstrained parameters of a batch of `n` points, each
+ * specified by its own JSON document. This is equivalent to calling
+ * bs_param_unconstrain_json() on each document, but a failure for one
+ * document does not prevent the others from being evaluated.
+ *
+ * The unconstrained parameters of document `i` are written to
+ * `theta_unc + i * D`, where `D` is the number of unconstrained
+ * parameters.
+ *
+ * If the model was compiled with `STAN_THREADS`, the documents are split
+ * into `n_threads` contiguous chunks which are evaluated concurrently.
+ * Otherwise, `n_threads` is ignored and the documents are evaluated in order.
+ *
+ * @param[in] m pointer to model structure
+ * @param[in] n number of documents in the batch
+ * @param[in] json array of `n` JSON-encoded constrained parameters
+ * @param[out] theta_unc `n` x `D` array of unconstrained parameters
+ * @param[in] n_threads number of threads to use. Values less than 1 use
+ * one thread per available hardware thread.
+ * @param[out] status array of `n` codes to set, 0 for each document which was
+ * evaluated successfully and -1 for each document which failed. May be null.
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This describes the first document which failed and must later
+ * be freed by calling bs_free_error_msg().
+ * @return code 0 if every document was successful and code -1 if there is an
+ * exception in the underlying Stan code for any document
+ */
+BS_PUBLIC int bs_param_unconstrain_json_batch(const bs_model* m, size_t n,
+                                              const char** json,
+                                              double* theta_unc, int n_threads,
+                                              int* status, char** error_msg);
+
+/**
+ * Set the unconstrained parameters of a batch of `n` points, each
+ * specified by its own table of named arrays. This is equivalent to
+ * calling bs_param_unconstrain_buffers() on each table, but a failure for
+ * one table does not prevent the others from being evaluated.
+ *
+ * The unconstrained parameters of table `i`, which has `n_buffers[i]`
+ * buffers, are written to `theta_unc + i * D`, where `D` is the number of
+ * unconstrained parameters.
+ *
+ * If the model was compiled with `STAN_THREADS`, the tables are split
+ * into `n_threads` contiguous chunks which are evaluated concurrently.
+ * Otherwise, `n_threads` is ignored and the tables are evaluated in order.
+ *
+ * @param[in] m pointer to model structure
+ * @param[in] n number of tables in the batch
+ * @param[in] buffers array of `n` tables of parameter buffers
+ * @param[in] n_buffers array of the `n` numbers of buffers in each table
+ * @param[out] theta_unc `n` x `D` array of unconstrained parameters
+ * @param[in] n_threads number of threads to use. Values less than 1 use
+ * one thread per available hardware thread.
+ * @param[out] status array of `n` codes to set, 0 for each table which was
+ * evaluated successfully and -1 for each table which failed. May be null.
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This describes the first table which failed and must later
+ * be freed by calling bs_free_error_msg().
+ * @return code 0 if every table was successful and code -1 if there is an
+ * exception in the underlying Stan code for any table
+ */
+BS_PUBLIC int bs_param_unconstrain_buffers_batch(
+    const bs_model* m, size_t n, const bs_data_buffer* const* buffers,
+    const size_t* n_buffers, double* theta_unc, int n_threads, int* status,
+    char** error_msg);
+
 /**
  * Set the log density of the specified parameters, dropping
  * constants if `propto` is `true` and including the Jacobian terms
@@ -268,6 +551,47 @@ BS_PUBLIC int bs_log_density_gradient(const bs_model* m, bool propto,
                                       double* val, double* grad,
                                       char** error_msg);
 
+/**
+ * Set the log densities and gradients of a batch of `n` points,
+ * dropping constants if `propto` is `true` and including the
+ * Jacobian terms resulting from constraining parameters if
+ * `jacobian` is `true`. This is equivalent to calling
+ * bs_log_density_gradient() on each point, but a failure at one
+ * point does not prevent the others from being evaluated.
+ *
+ * The points are stored contiguously in row-major order, so point
+ * `i` begins at `theta_unc + i * D` and its gradient is written to
+ * `grad + i * D`, where `D` is the number of unconstrained
+ * parameters. The log density of a point which fails is set to NaN.
+ *
+ * If the model was compiled with `STAN_THREADS`, the points are split
+ * into `n_threads` contiguous chunks which are evaluated concurrently.
+ * Otherwise, `n_threads` is ignored and the points are evaluated in order.
+ *
+ * @param[in] m pointer to model structure
+ * @param[in] propto `true` to discard constant terms
+ * @param[in] jacobian `true` to include change-of-variables terms
+ * @param[in] n number of points in the batch
+ * @param[in] theta_unc `n` x `D` array of unconstrained parameters
+ * @param[out] val array of `n` log densities to be set
+ * @param[out] grad `n` x `D` array of gradients to set
+ * @param[in] n_threads number of threads to use. Values less than 1 use
+ * one thread per available hardware thread.
+ * @param[out] status array of `n` codes to set, 0 for each point which was
+ * evaluated successfully and -1 for each point which failed. May be null.
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This describes the first point which failed and must later be
+ * freed by calling bs_free_error_msg().
+ * @return code 0 if every point was successful and code -1 if there is an
+ * exception in the underlying Stan code for any point
+ */
+BS_PUBLIC int bs_log_density_gradient_batch(const bs_model* m, bool propto,
+                                            bool jacobian, size_t n,
+                                            const double* theta_unc,
+                                            double* val, double* grad,
+                                            int n_threads, int* status,
+                                            char** error_msg);
+
 /**
  * Set the log density, gradient, and Hessian of the specified parameters,
  * dropping constants if `propto` is `true` and including the
@@ -300,6 +624,38 @@ BS_PUBLIC int bs_log_density_hessian(const bs_model* m, bool propto,
                                      double* val, double* grad, double* hessian,
                                      char** error_msg);
 
+/**
+ * Set the log density, gradient, and Hessian of the specified parameters
+ * as in bs_log_density_hessian(), computing the columns of the Hessian
+ * concurrently.
+ *
+ * If the model was compiled with `STAN_THREADS`, the `D` columns are split
+ * into `n_threads` contiguous chunks which are computed concurrently, each
+ * with one forward-over-reverse sweep or two gradient evaluations per
+ * column. Otherwise, `n_threads` is ignored. The result is the same for
+ * any number of threads.
+ *
+ * @param[in] m pointer to model structure
+ * @param[in] propto `true` to discard constant terms
+ * @param[in] jacobian `true` to include change-of-variables terms
+ * @param[in] theta_unc unconstrained parameters
+ * @param[out] val log density to be set
+ * @param[out] grad gradient to set
+ * @param[out] hessian hessian to set
+ * @param[in] n_threads number of threads to use. Values less than 1 use
+ * one thread per available hardware thread.
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This must later be freed by calling bs_free_error_msg().
+ * @return code 0 if successful and code -1 if there is an exception
+ * in the underlying Stan code
+ */
+BS_PUBLIC int bs_log_density_hessian_parallel(const bs_model* m, bool propto,
+                                              bool jacobian,
+                                              const double* theta_unc,
+                                              double* val, double* grad,
+                                              double* hessian, int n_threads,
+                                              char** error_msg);
+
 /**
  * Calculate the log density and the product of the Hessian with the specified
  * vector for the specified unconstrained parameters and write it into the
@@ -334,6 +690,52 @@ BS_PUBLIC int bs_log_density_hessian_vector_product(
     const bs_model* m, bool propto, bool jacobian, const double* theta_unc,
     const double* vector, double* val, double* hvp, char** error_msg);
 
+/**
+ * Calculate the log density and the products of the Hessian with each of
+ * `k` vectors for the specified unconstrained parameters, dropping
+ * constants if `propto` is `true` and including the Jacobian terms
+ * resulting from constraining parameters if `jacobian` is `true`, and
+ * return a return code of 0 for success and -1 if there is an exception
+ * executing the Stan program.
+ *
+ * The products are the same as from calling
+ * bs_log_density_hessian_vector_product() on each vector, and the log
+ * density is the same as from bs_log_density(). If `grad` is not null, the
+ * gradient is also computed, as by bs_log_density_gradient(), in place of
+ * the evaluation of the log density. The vectors are the columns of
+ * `vectors`, a `D` x `k` array in row-major order, where `D` is the number
+ * of unconstrained parameters, and their products are written to the
+ * columns of `hmp` in the same layout.
+ *
+ * With finite differences, the two gradient evaluations of every product
+ * are evaluated as one batch, along with the evaluation of the log density
+ * or its gradient. With `BRIDGESTAN_AD_HESSIAN`, each product takes one
+ * forward-over-reverse sweep, and the log density and gradient are taken
+ * from the first of them. If the model was compiled with
+ * `STAN_THREADS`, these are split between `n_threads` threads.
+ * Otherwise, `n_threads` is ignored.
+ *
+ * @param[in] m pointer to model structure
+ * @param[in] propto `true` to discard constant terms
+ * @param[in] jacobian `true` to include change-of-variables terms
+ * @param[in] theta_unc unconstrained parameters
+ * @param[in] k number of vectors
+ * @param[in] vectors `D` x `k` array of vectors to multiply the Hessian by
+ * @param[out] val log density to be set
+ * @param[out] grad gradient to set, or nullptr if it is not needed
+ * @param[out] hmp `D` x `k` array of Hessian-vector products to set
+ * @param[in] n_threads number of threads to use. Values less than 1 use
+ * one thread per available hardware thread.
+ * @param[out] error_msg a pointer to a string that will be allocated if there
+ * is an error. This must later be freed by calling bs_free_error_msg().
+ * @return code 0 if successful and code -1 if there is an exception
+ * in the underlying Stan code
+ */
+BS_PUBLIC int bs_log_density_hessian_matrix_product(
+    const bs_model* m, bool propto, bool jacobian, const double* theta_unc,
+    size_t k, const double* vectors, double* val, double* grad, double* hmp,
+    int n_threads, char** error_msg);
+
 /**
  * Construct an PRNG object to be used in bs_param_constrain().
  * This object is not thread safe and should be constructed and
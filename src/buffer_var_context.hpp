@@ -0,0 +1,284 @@
+#ifndef BRIDGESTAN_BUFFER_VAR_CONTEXT_HPP
+#define BRIDGESTAN_BUFFER_VAR_CONTEXT_HPP
+
+#include <stan/io/var_context.hpp>
+
+#include <complex>
+#include <cstdint>
+#include <cstring>
+#include <limits>
+#include <map>
+#include <sstream>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+#include "bridgestan.h"
+
+namespace bridgestan {
+
+/**
+ * A `stan::io::var_context` which reads data directly from strided
+ * arrays in memory, such as the buffers of NumPy arrays, described by
+ * a table of `bs_data_buffer`s.
+ *
+ * The buffers are borrowed, not copied, so they must outlive this object.
+ * Buffers are laid out in row-major order (or arbitrary strides), while
+ * Stan expects values in column-major order, so each array is transposed
+ * as it is read.
+ */
+class buffer_var_context : public stan::io::var_context {
+ public:
+  /**
+   * Construct a context from the specified buffers.
+   *
+   * @param[in] buffers array of `n` buffer descriptions
+   * @param[in] n number of buffers
+   * @throw std::invalid_argument if a buffer is malformed or a name is
+   * repeated
+   */
+  buffer_var_context(const bs_data_buffer* buffers, size_t n) {
+    if (n > 0 && buffers == nullptr)
+      throw std::invalid_argument("Data buffers must not be null");
+    for (size_t i = 0; i < n; ++i) {
+      const bs_data_buffer& buf = buffers[i];
+      if (buf.name == nullptr)
+        throw std::invalid_argument("Data buffer " + std::to_string(i)
+                                    + " has no name");
+      std::string name(buf.name);
+      if (buf.type != BS_DATA_FLOAT64 && buf.type != BS_DATA_INT32
+          && buf.type != BS_DATA_INT64)
+        throw std::invalid_argument("Data buffer for variable " + name
+                                    + " has an unknown type");
+      if (buf.ndim < 0 || (buf.ndim > 0 && buf.shape == nullptr))
+        throw std::invalid_argument("Data buffer for variable " + name
+                                    + " has an invalid shape");
+
+      entry e;
+      e.type = buf.type;
+      e.data = static_cast<const char*>(buf.data);
+      e.dims.assign(buf.shape, buf.shape + buf.ndim);
+      e.size = 1;
+      for (size_t d : e.dims)
+        e.size *= d;
+      if (e.size > 0 && e.data == nullptr)
+        throw std::invalid_argument("Data buffer for variable " + name
+                                    + " is null");
+      if (buf.strides != nullptr) {
+        e.strides.assign(buf.strides, buf.strides + buf.ndim);
+      } else {
+        e.strides.resize(buf.ndim);
+        std::ptrdiff_t stride = element_size(buf.type);
+        for (int d = buf.ndim - 1; d >= 0; --d) {
+          e.strides[d] = stride;
+          stride *= e.dims[d];
+        }
+      }
+      if (!vars_.emplace(name, std::move(e)).second)
+        throw std::invalid_argument("Duplicate data variable: " + name);
+    }
+  }
+
+  bool contains_r(const std::string& name) const override {
+    return vars_.find(name) != vars_.end();
+  }
+
+  bool contains_i(const std::string& name) const override {
+    auto it = vars_.find(name);
+    return it != vars_.end() && it->second.type != BS_DATA_FLOAT64;
+  }
+
+  std::vector<double> vals_r(const std::string& name) const override {
+    auto it = vars_.find(name);
+    if (it == vars_.end())
+      return {};
+    const entry& e = it->second;
+    std::vector<double> vals(e.size);
+    switch (e.type) {
+      case BS_DATA_FLOAT64:
+        read<double>(e, vals.data());
+        break;
+      case BS_DATA_INT32:
+        read<std::int32_t>(e, vals.data());
+        break;
+      case BS_DATA_INT64:
+        read<std::int64_t>(e, vals.data());
+        break;
+    }
+    return vals;
+  }
+
+  std::vector<std::complex<double>> vals_c(
+      const std::string& name) const override {
+    // as in stan::json::json_data, the real and imaginary parts are the
+    // two halves of the trailing dimension
+    std::vector<double> vals = vals_r(name);
+    std::vector<std::complex<double>> vals_c(vals.size() / 2);
+    size_t offset = vals_c.size();
+    for (size_t i = 0; i < vals_c.size(); ++i)
+      vals_c[i] = {vals[i], vals[i + offset]};
+    return vals_c;
+  }
+
+  std::vector<size_t> dims_r(const std::string& name) const override {
+    auto it = vars_.find(name);
+    if (it == vars_.end())
+      return {};
+    return it->second.dims;
+  }
+
+  std::vector<int> vals_i(const std::string& name) const override {
+    auto it = vars_.find(name);
+    if (it == vars_.end() || it->second.type == BS_DATA_FLOAT64)
+      return {};
+    const entry& e = it->second;
+    std::vector<int> vals(e.size);
+    if (e.type == BS_DATA_INT32) {
+      read<std::int32_t>(e, vals.data());
+    } else {
+      std::vector<std::int64_t> wide(e.size);
+      read<std::int64_t>(e, wide.data());
+      for (size_t i = 0; i < e.size; ++i) {
+        if (wide[i] < std::numeric_limits<int>::min()
+            || wide[i] > std::numeric_limits<int>::max())
+          throw std::domain_error("Integer value out of range in variable "
+                                  + name + ": " + std::to_string(wide[i]));
+        vals[i] = static_cast<int>(wide[i]);
+      }
+    }
+    return vals;
+  }
+
+  std::vector<size_t> dims_i(const std::string& name) const override {
+    if (!contains_i(name))
+      return {};
+    return vars_.find(name)->second.dims;
+  }
+
+  void names_r(std::vector<std::string>& names) const override {
+    names.clear();
+    for (const auto& var : vars_)
+      if (var.second.type == BS_DATA_FLOAT64)
+        names.push_back(var.first);
+  }
+
+  void names_i(std::vector<std::string>& names) const override {
+    names.clear();
+    for (const auto& var : vars_)
+      if (var.second.type != BS_DATA_FLOAT64)
+        names.push_back(var.first);
+  }
+
+  /**
+   * Check the variable has the declared dimensions, following the rules
+   * of `stan::json::json_data`: a missing variable is allowed if it is
+   * declared with zero elements.
+   */
+  void validate_dims(const std::string& stage, const std::string& name,
+                     const std::string& base_type,
+                     const std::vector<size_t>& dims_declared) const override {
+    size_t num_expected = 1;
+    for (size_t d : dims_declared)
+      num_expected *= d;
+    auto it = vars_.find(name);
+    if (it == vars_.end() || it->second.size == 0) {
+      if (num_expected == 0)
+        return;
+      if (it == vars_.end()) {
+        std::stringstream msg;
+        msg << "variable does not exist; processing stage=" << stage
+            << "; variable name=" << name << "; base type=" << base_type;
+        throw std::runtime_error(msg.str());
+      }
+    }
+    if (base_type == "int" && !contains_i(name)) {
+      std::stringstream msg;
+      msg << "int variable contained non-int values; processing stage=" << stage
+          << "; variable name=" << name << "; base type=" << base_type;
+      throw std::runtime_error(msg.str());
+    }
+    const std::vector<size_t>& dims = it->second.dims;
+    if (dims.size() != dims_declared.size()) {
+      std::stringstream msg;
+      msg << "mismatch in number dimensions declared and found in context"
+          << "; processing stage=" << stage << "; variable name=" << name
+          << "; dims declared=";
+      dims_msg(msg, dims_declared);
+      msg << "; dims found=";
+      dims_msg(msg, dims);
+      throw std::runtime_error(msg.str());
+    }
+    for (size_t i = 0; i < dims.size(); ++i) {
+      if (dims_declared[i] != dims[i]) {
+        std::stringstream msg;
+        msg << "mismatch in dimension declared and found in context"
+            << "; processing stage=" << stage << "; variable name=" << name
+            << "; position=" << i << "; dims declared=";
+        dims_msg(msg, dims_declared);
+        msg << "; dims found=";
+        dims_msg(msg, dims);
+        throw std::runtime_error(msg.str());
+      }
+    }
+  }
+
+ private:
+  struct entry {
+    bs_data_type type;
+    const char* data;
+    std::vector<size_t> dims;
+    std::vector<std::ptrdiff_t> strides;
+    size_t size;
+  };
+
+  std::map<std::string, entry> vars_;
+
+  static std::ptrdiff_t element_size(bs_data_type type) {
+    return type == BS_DATA_INT32 ? sizeof(std::int32_t) : sizeof(std::int64_t);
+  }
+
+  /**
+   * Copy the elements of `e` to `out` in column-major order, converting
+   * them to the type of `out`. The first index varies fastest, so the
+   * innermost loop runs over the first dimension.
+   */
+  template <typename In, typename Out>
+  static void read(const entry& e, Out* out) {
+    if (e.size == 0)
+      return;
+    size_t ndim = e.dims.size();
+    if (ndim == 0) {
+      *out = static_cast<Out>(load<In>(e.data));
+      return;
+    }
+    size_t inner = e.dims[0];
+    std::ptrdiff_t inner_stride = e.strides[0];
+    std::vector<size_t> index(ndim, 0);
+    const char* outer = e.data;
+    for (size_t done = 0; done < e.size; done += inner) {
+      const char* p = outer;
+      for (size_t i = 0; i < inner; ++i, p += inner_stride)
+        *out++ = static_cast<Out>(load<In>(p));
+      // advance the remaining indices, first to last
+      for (size_t d = 1; d < ndim; ++d) {
+        outer += e.strides[d];
+        if (++index[d] < e.dims[d])
+          break;
+        outer -= e.strides[d] * static_cast<std::ptrdiff_t>(e.dims[d]);
+        index[d] = 0;
+      }
+    }
+  }
+
+  // buffers are not guaranteed to be aligned
+  template <typename T>
+  static T load(const char* p) {
+    T x;
+    std::memcpy(&x, p, sizeof(T));
+    return x;
+  }
+};
+
+}  // namespace bridgestan
+
+#endif
@@ -15,6 +15,7 @@
 
 #include <cmath>
 #include <fstream>
+#include <limits>
 #include <ostream>
 #include <sstream>
 #include <stdexcept>
@@ -23,6 +24,9 @@
 #include <memory>
 #include <type_traits>
 
+#include "batch.hpp"
+#include "binary_data.hpp"
+#include "buffer_var_context.hpp"
 #include "util.hpp"
 #include "version.hpp"
 
@@ -70,8 +74,17 @@ inline model_ptr model_from_data(const char* data, unsigned int seed) {
       stan::io::empty_var_context data_context;
       return model_ptr(&new_model(data_context, seed, outstream));
     } else {
-      if (stan::io::ends_with(".json", data_str)) {
-        std::ifstream in(data_str);
+      if (stan::io::ends_with(".bsdata", data_str)) {
+        binary_data binary(data_str);
+        buffer_var_context data_context(binary.buffers(), binary.size());
+        return model_ptr(&new_model(data_context, seed, outstream));
+      } else if (stan::io::ends_with(".json", data_str)) {
+        // the file is parsed as it is read, so only this buffer of the
+        // text is in memory at once
+        std::vector<char> buffer(1 << 16);
+        std::ifstream in;
+        in.rdbuf()->pubsetbuf(buffer.data(), buffer.size());
+        in.open(data_str, std::ios::binary);
         if (!in.good())
           throw std::runtime_error("Cannot read input file: " + data_str);
         stan::json::json_data data_context(in);
@@ -86,6 +99,14 @@ inline model_ptr model_from_data(const char* data, unsigned int seed) {
   }
 }
 
+inline model_ptr model_from_buffers(const bs_data_buffer* buffers, size_t n,
+                                    unsigned int seed) {
+  BRIDGESTAN_PREPARE_AD_FOR_THREADING();
+
+  buffer_var_context data_context(buffers, n);
+  return model_ptr(&new_model(data_context, seed, outstream));
+}
+
 }  // namespace bridgestan
 
 /**
@@ -101,12 +122,34 @@ class bs_model {
    *
    * @param[in] data C-style string. This is either a
    * path to JSON-encoded data file (must end with ".json"),
+   * a path to a BridgeStan binary data file (must end with ".bsdata"),
+   * which is memory mapped rather than parsed,
    * a JSON string literal, or nullptr. An empty string or null
    * pointer are both interpreted as no data.
    * @param[in] seed pseudorandom number generator seed
    */
   bs_model(const char* data, unsigned int seed)
-      : model_(bridgestan::model_from_data(data, seed)),
+      : bs_model(bridgestan::model_from_data(data, seed)) {}
+
+  /**
+   * Construct a model and random number generator with cached
+   * parameter numbers and names from data held in memory.
+   *
+   * @param[in] buffers array of `n` named data buffers
+   * @param[in] n number of buffers
+   * @param[in] seed pseudorandom number generator seed
+   */
+  bs_model(const bs_data_buffer* buffers, size_t n, unsigned int seed)
+      : bs_model(bridgestan::model_from_buffers(buffers, n, seed)) {}
+
+  /**
+   * Take ownership of a constructed model and cache its parameter numbers
+   * and names.
+   *
+   * @param[in] model the model
+   */
+  explicit bs_model(bridgestan::model_ptr model)
+      : model_(std::move(model)),
         name_(bridgestan::make_unique_cstr(model_->model_name())) {
     std::stringstream info;
     info << "BridgeStan version: " << bridgestan::MAJOR_VERSION << '.'
@@ -270,9 +313,24 @@ class bs_model {
   void param_unconstrain_json(const char* json, double* theta_unc) const {
     std::stringstream in(json);
     stan::json::json_data inits_context(in);
-    Eigen::VectorXd params_unc;
-    model_->transform_inits(inits_context, params_unc, outstream);
-    Eigen::VectorXd::Map(theta_unc, params_unc.size()) = params_unc;
+    transform_inits(inits_context, theta_unc);
+  }
+
+  /**
+   * Unconstrain the parameters specified as a table of named arrays in
+   * memory and write into the specified unconstrained parameter array.
+   * The arrays are read in place, as for the data of
+   * bs_model_construct_buffers().
+   *
+   * @param[in] buffers array of `n` parameter buffers
+   * @param[in] n number of buffers
+   * @param[out] theta_unc unconstrained parameters generated
+   * @throw std::invalid_argument if a buffer is malformed
+   */
+  void param_unconstrain_buffers(const bs_data_buffer* buffers, size_t n,
+                                 double* theta_unc) const {
+    bridgestan::buffer_var_context inits_context(buffers, n);
+    transform_inits(inits_context, theta_unc);
   }
 
   /**
@@ -288,6 +346,47 @@ class bs_model {
   void param_constrain(bool include_tp, bool include_gq,
                        const double* theta_unc, double* theta,
                        stan::rng_t& rng) const {
+    Eigen::VectorXd params
+        = write_array(include_tp, include_gq, theta_unc, rng);
+    Eigen::VectorXd::Map(theta, params.size()) = params;
+  }
+
+  /**
+   * Constrain the specified unconstrained parameters and write only the
+   * specified columns of the result into the specified array, which
+   * has one element per column.
+   *
+   * @param[in] include_tp `true` to include transformed parameters
+   * @param[in] include_gq `true` to include generated quantities
+   * @param[in] theta_unc unconstrained parameters to constrain
+   * @param[in] n_columns number of columns to write
+   * @param[in] columns indices of the columns to write, which must be
+   * less than `param_num(include_tp, include_gq)`
+   * @param[out] theta selected constrained parameters generated
+   */
+  void param_constrain_columns(bool include_tp, bool include_gq,
+                               const double* theta_unc, size_t n_columns,
+                               const size_t* columns, double* theta,
+                               stan::rng_t& rng) const {
+    Eigen::VectorXd params
+        = write_array(include_tp, include_gq, theta_unc, rng);
+    for (size_t j = 0; j < n_columns; ++j)
+      theta[j] = params.coeff(columns[j]);
+  }
+
+ private:
+  /**
+   * Constrain the specified unconstrained parameters and return them as
+   * a vector.
+   *
+   * @param[in] include_tp `true` to include transformed parameters
+   * @param[in] include_gq `true` to include generated quantities
+   * @param[in] theta_unc unconstrained parameters to constrain
+   * @param[in] rng pseudorandom number generator for generated quantities
+   * @return constrained parameters generated
+   */
+  Eigen::VectorXd write_array(bool include_tp, bool include_gq,
+                              const double* theta_unc, stan::rng_t& rng) const {
     // write_array can run arbitrary user code in tparams/gqs,
     // including sundials ODES which always require AD
     BRIDGESTAN_PREPARE_AD_FOR_THREADING();
@@ -296,10 +395,23 @@ class bs_model {
     Eigen::VectorXd params;
     model_->write_array(rng, params_unc, params, include_tp, include_gq,
                         outstream);
-    Eigen::VectorXd::Map(theta, params.size()) = params;
+    return params;
+  }
+
+  /**
+   * Unconstrain the parameters read from the specified context and write
+   * into the specified unconstrained parameter array.
+   *
+   * @param[in] context constrained parameters, by name
+   * @param[out] theta_unc unconstrained parameters generated
+   */
+  void transform_inits(const stan::io::var_context& context,
+                       double* theta_unc) const {
+    Eigen::VectorXd params_unc;
+    model_->transform_inits(context, params_unc, outstream);
+    Eigen::VectorXd::Map(theta_unc, params_unc.size()) = params_unc;
   }
 
- private:
   /**
    * Returns a lambda which calls the correct version of log_prob
    * depending on the values of propto and jacobian.
@@ -411,6 +523,10 @@ class bs_model {
    * Jacobian adjustment if `jacobian` is `true`.  The Hessian is
    * symmetric so row-major vs. column-major are identical.
    *
+   * The columns of the Hessian are independent, so with `STAN_THREADS`
+   * they are computed by up to `n_threads` threads. The result does
+   * not depend on the number of threads.
+   *
    * @param[in] propto `true` to drop constant terms
    * @param[in] jacobian `true` to include Jacobian adjustment for
    * constrained parameter transforms
@@ -418,24 +534,73 @@ class bs_model {
    * @param[out] val log density produced
    * @param[out] grad gradient produced
    * @param[out] hess Hessian produced
+   * @param[in] n_threads number of threads to use, see
+   * bridgestan::num_workers()
    */
   void log_density_hessian(bool propto, bool jacobian, const double* theta_unc,
-                           double* val, double* grad, double* hessian) const {
+                           double* val, double* grad, double* hessian,
+                           int n_threads = 1) const {
     auto logp = make_model_lambda(propto, jacobian);
     int N = param_unc_num_;
     Eigen::Map<const Eigen::VectorXd> params_unc(theta_unc, N);
-    Eigen::VectorXd grad_vec(N);
-    Eigen::MatrixXd hess_mat(N, N);
 
+    if (bridgestan::num_workers(n_threads, N) == 1) {
+      Eigen::VectorXd grad_vec(N);
+      Eigen::MatrixXd hess_mat(N, N);
 #ifdef BRIDGESTAN_AD_HESSIAN
-    stan::math::hessian(logp, params_unc, *val, grad_vec, hess_mat);
+      stan::math::hessian(logp, params_unc, *val, grad_vec, hess_mat);
 #else
-    stan::math::internal::finite_diff_hessian_auto(logp, params_unc, *val,
-                                                   grad_vec, hess_mat);
+      stan::math::internal::finite_diff_hessian_auto(logp, params_unc, *val,
+                                                     grad_vec, hess_mat);
 #endif
+      Eigen::VectorXd::Map(grad, N) = grad_vec;
+      Eigen::MatrixXd::Map(hessian, N, N) = hess_mat;
+      return;
+    }
 
-    Eigen::VectorXd::Map(grad, N) = grad_vec;
-    Eigen::MatrixXd::Map(hessian, N, N) = hess_mat;
+    Eigen::Map<Eigen::MatrixXd> hess_mat(hessian, N, N);
+#ifdef BRIDGESTAN_AD_HESSIAN
+    // one forward-over-reverse sweep per column, as in stan::math::hessian
+    bridgestan::for_each_index(N, n_threads, [&](size_t i) {
+      BRIDGESTAN_PREPARE_AD_FOR_THREADING();
+      stan::math::nested_rev_autodiff nested;
+      Eigen::Matrix<stan::math::fvar<stan::math::var>, Eigen::Dynamic, 1> x(N);
+      for (int j = 0; j < N; ++j)
+        x(j) = stan::math::fvar<stan::math::var>(params_unc(j),
+                                                 j == static_cast<int>(i));
+      stan::math::fvar<stan::math::var> fx = logp(x);
+      grad[i] = fx.d_.val();
+      if (i == 0)
+        *val = fx.val_.val();
+      stan::math::grad(fx.d_.vi_);
+      for (int j = 0; j < N; ++j)
+        hess_mat(i, j) = x(j).val_.adj();
+    });
+#else
+    // central differences of gradients, as in finite_diff_hessian_auto
+    Eigen::VectorXd x(params_unc);
+    stan::math::gradient(logp, x, *val, grad, grad + N);
+    std::vector<Eigen::VectorXd> g_plus(N);
+    std::vector<Eigen::VectorXd> g_minus(N);
+    std::vector<double> epsilons(N);
+    bridgestan::for_each_index(N, n_threads, [&](size_t i) {
+      BRIDGESTAN_PREPARE_AD_FOR_THREADING();
+      double tmp;
+      Eigen::VectorXd x_temp(x);
+      epsilons[i] = stan::math::finite_diff_stepsize(x(i));
+      x_temp(i) += epsilons[i];
+      stan::math::gradient(logp, x_temp, tmp, g_plus[i]);
+      x_temp(i) = x(i) - epsilons[i];
+      stan::math::gradient(logp, x_temp, tmp, g_minus[i]);
+    });
+    for (int i = 0; i < N; ++i) {
+      for (int j = i; j < N; ++j) {
+        hess_mat(j, i) = (g_plus[j](i) - g_minus[j](i)) / (4 * epsilons[j])
+                         + (g_plus[i](j) - g_minus[i](j)) / (4 * epsilons[i]);
+        hess_mat(i, j) = hess_mat(j, i);
+      }
+    }
+#endif
   }
 
   /**
@@ -473,6 +638,115 @@ class bs_model {
     Eigen::VectorXd::Map(hvp, N) = hvp_vec;
   }
 
+  /**
+   * Calculate the log density and the products of the Hessian with each of
+   * `k` vectors for the specified unconstrained parameters, dropping
+   * constants it `propto` is `true` and including the Jacobian adjustment
+   * if `jacobian` is `true`. The vectors are the columns of the `D` x `k`
+   * row-major array `vectors`, where `D` is the number of unconstrained
+   * parameters, and their products are written to the columns of the
+   * `D` x `k` row-major array `hmp`.
+   *
+   * Each product is computed as by log_density_hessian_vector_product().
+   * With `STAN_THREADS`, the gradient evaluations of all the products
+   * are split between up to `n_threads` threads. The log density, and
+   * the gradient if `grad` is not null, are computed along with the
+   * products rather than by another evaluation of the model.
+   *
+   * @param[in] propto `true` to drop constant terms
+   * @param[in] jacobian `true` to include Jacobian adjustment for
+   * constrained parameter transforms
+   * @param[in] theta_unc unconstrained parameters
+   * @param[in] k number of vectors
+   * @param[in] vectors vectors to multiply Hessian by
+   * @param[out] val log density produced
+   * @param[out] grad gradient produced, or nullptr
+   * @param[out] hmp Hessian-vector products produced
+   * @param[in] n_threads number of threads to use, see
+   * bridgestan::num_workers()
+   */
+  void log_density_hessian_matrix_product(bool propto, bool jacobian,
+                                          const double* theta_unc, size_t k,
+                                          const double* vectors, double* val,
+                                          double* grad, double* hmp,
+                                          int n_threads) const {
+    using RowMajor = Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic,
+                                   Eigen::RowMajor>;
+    auto logp = make_model_lambda(propto, jacobian);
+    int N = param_unc_num_;
+    Eigen::VectorXd x = Eigen::VectorXd::Map(theta_unc, N);
+    Eigen::Map<const RowMajor> V(vectors, N, k);
+    Eigen::Map<RowMajor> HV(hmp, N, k);
+
+#ifdef BRIDGESTAN_AD_HESSIAN
+    if (k == 0) {
+      if (grad != nullptr)
+        log_density_gradient(propto, jacobian, theta_unc, val, grad);
+      else
+        log_density(propto, jacobian, theta_unc, val);
+      return;
+    }
+    // Stan has no tangent type with several directions, so each product
+    // takes its own forward-over-reverse sweep, as in
+    // stan::math::hessian_times_vector. The value of the first sweep is
+    // the log density, and a second reverse pass over its tape gives the
+    // gradient.
+    bridgestan::for_each_index(k, n_threads, [&](size_t j) {
+      BRIDGESTAN_PREPARE_AD_FOR_THREADING();
+      stan::math::nested_rev_autodiff nested;
+      Eigen::Matrix<stan::math::fvar<stan::math::var>, Eigen::Dynamic, 1> xv(N);
+      for (int i = 0; i < N; ++i)
+        xv(i) = stan::math::fvar<stan::math::var>(x(i), V(i, j));
+      stan::math::fvar<stan::math::var> fx = logp(xv);
+      stan::math::grad(fx.d_.vi_);
+      for (int i = 0; i < N; ++i)
+        HV(i, j) = xv(i).val_.adj();
+      if (j == 0) {
+        *val = fx.val_.val();
+        if (grad != nullptr) {
+          nested.set_zero_all_adjoints();
+          stan::math::grad(fx.val_.vi_);
+          for (int i = 0; i < N; ++i)
+            grad[i] = xv(i).val_.adj();
+        }
+      }
+    });
+#else
+    // central differences of gradients, as in
+    // finite_diff_hessian_times_vector_auto, with the 2k gradients
+    // evaluated as one batch. They are not taken at theta_unc, so the
+    // log density, or its gradient, is one more task in the batch.
+    const double x_scale = std::sqrt(stan::math::EPSILON) * (1 + x.norm());
+    // contiguous copies, so the norms match those of
+    // log_density_hessian_vector_product() exactly
+    std::vector<Eigen::VectorXd> vs(k);
+    for (size_t j = 0; j < k; ++j)
+      vs[j] = V.col(j);
+    std::vector<Eigen::VectorXd> grads(2 * k);
+    bridgestan::for_each_index(2 * k + 1, n_threads, [&](size_t i) {
+      BRIDGESTAN_PREPARE_AD_FOR_THREADING();
+      if (i == 2 * k) {
+        if (grad != nullptr)
+          log_density_gradient(propto, jacobian, theta_unc, val, grad);
+        else
+          log_density(propto, jacobian, theta_unc, val);
+        return;
+      }
+      const Eigen::VectorXd& v = vs[i / 2];
+      Eigen::VectorXd v_eps = x_scale / v.norm() * v;
+      double tmp;
+      if (i % 2 == 0)
+        stan::math::gradient(logp, x + v_eps, tmp, grads[i]);
+      else
+        stan::math::gradient(logp, x - v_eps, tmp, grads[i]);
+    });
+    for (size_t j = 0; j < k; ++j) {
+      double epsilon = x_scale / vs[j].norm();
+      HV.col(j) = (grads[2 * j] - grads[2 * j + 1]) / (2 * epsilon);
+    }
+#endif
+  }
+
  private:
   /** Stan model */
   bridgestan::model_ptr model_;